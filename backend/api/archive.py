@@ -0,0 +1,228 @@
+"""
+Archive - Tiered storage of old orders and trades for the Order Book application
+
+The hot tier of a FileDB, its JSON files or journal state, holds the live
+book and recent activity. Filled and cancelled orders, and trades, older
+than a threshold are moved to the cold tier: immutable, memory-mapped
+segment files (see segments.py) under ``archive/`` in the database's data
+directory, listed by ``archive/manifest.json``.
+
+A record is moved by writing it to a new segment, listing the segment in
+the manifest and only then dropping it from the hot tier. A crash in
+between leaves the record in both tiers, and the copy in the hot tier is
+dropped when it is next loaded.
+
+Trades are archived oldest first, so the archived trades always come
+before the hot ones, by id and (but for trades older versions stored out
+of time order) by time, and their segments follow one another. Orders are archived when they are done, so order segments may
+overlap in id.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+from operator import attrgetter
+
+from . import metrics
+from .fsutil import file_version, fsync_dir
+from .records import now_ns
+from .segments import Segment, write_segment
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ('orders', 'trades')
+
+ARCHIVED_RECORDS = metrics.Counter(
+    'orderbook_archived_records_total',
+    'Orders and trades moved from the hot tier to archive segments',
+    labels=('collection',)
+)
+
+
+class Archive:
+    """The archive segments of one database"""
+
+    def __init__(self, archive_dir, symbol, tick_size):
+        self.archive_dir = archive_dir
+        self.manifest_file = archive_dir / 'manifest.json'
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.segments = {name: [] for name in COLLECTIONS}
+        self._last_ids = dict.fromkeys(COLLECTIONS, 0)
+        self._next_segment = 1
+        self._manifest_version = None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Pick up the manifest if it changed since it was read, opening any
+        new segments. Returns whether it changed.
+        """
+        version = file_version(self.manifest_file)
+        if version == self._manifest_version:
+            return False
+        self._manifest_version = version
+        if version is None:
+            return True
+
+        with open(self.manifest_file, 'r') as f:
+            manifest = json.load(f)
+        self._next_segment = manifest['next_segment']
+        for name in COLLECTIONS:
+            opened = {segment.path.name: segment for segment in self.segments[name]}
+            self.segments[name] = [
+                opened.pop(file_name, None) or Segment(self.archive_dir / file_name,
+                                                       self.tick_size)
+                for file_name in manifest[name]
+            ]
+            for segment in opened.values():
+                segment.close()
+            self._last_ids[name] = max(
+                (segment.last_id for segment in self.segments[name]), default=0
+            )
+        return True
+
+    def write(self, name, records):
+        """
+        Write records of a collection, in id order, to a new segment that is
+        not listed yet. Returns the segment's file name, for publish.
+        """
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        file_name = f'{name}-{self._next_segment:06d}.seg'
+        self._next_segment += 1
+        write_segment(self.archive_dir / file_name, name, records, self.symbol, self.tick_size)
+        return file_name
+
+    def publish(self, file_names):
+        """List new segments, given as {collection: file name}, in the manifest"""
+        manifest = {
+            name: [segment.path.name for segment in self.segments[name]]
+            for name in COLLECTIONS
+        }
+        for name, file_name in file_names.items():
+            manifest[name].append(file_name)
+        manifest['next_segment'] = self._next_segment
+
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+        fsync_dir(self.archive_dir)
+        self.refresh()
+
+    def count(self, name):
+        return sum(len(segment) for segment in self.segments[name])
+
+    def last_id(self, name):
+        """The highest archived id of a collection, or 0"""
+        return self._last_ids[name]
+
+    def get(self, name, record_id):
+        """An archived record by id, or None"""
+        for segment in self.segments[name]:
+            record = segment.get(record_id)
+            if record is not None:
+                return record
+        return None
+
+    def __contains__(self, key):
+        name, record_id = key
+        return any(record_id in segment for segment in self.segments[name])
+
+    def user_records(self, name, user_id):
+        """The archived records of one user, in id order"""
+        records = [
+            record
+            for segment in self.segments[name]
+            for record in segment.user_records(user_id)
+        ]
+        if name == 'orders' and len(self.segments[name]) > 1:
+            records.sort(key=attrgetter('id'))
+        return records
+
+    def iter_after(self, name, since_id=None):
+        """Iterate over the archived records of a collection after since_id, in id order"""
+        streams = [
+            segment.records(0 if since_id is None else segment.bisect_id(since_id, right=True))
+            for segment in self.segments[name]
+            if since_id is None or segment.last_id > since_id
+        ]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=attrgetter('id'))
+
+    # Trades only: their segments follow one another, so positions run on
+    # from one segment to the next
+    def bisect_trades(self, value, key='id', right=False):
+        """Position in the archived trades of an id or timestamp, as bisect would find it"""
+        position = 0
+        for segment in self.segments['trades']:
+            if key == 'id':
+                found = segment.bisect_id(value, right)
+            else:
+                found = segment.bisect_timestamp(value, right)
+            position += found
+            if found < len(segment):
+                break
+        return position
+
+    def trade_timestamps(self, start=0):
+        """Iterate over the timestamps of the archived trades from position start"""
+        offset = 0
+        for segment in self.segments['trades']:
+            if start < offset + len(segment):
+                yield from segment.timestamps(max(0, start - offset))
+            offset += len(segment)
+
+    def trades(self, start, stop):
+        """The archived trades at positions start to stop"""
+        trades = []
+        offset = 0
+        for segment in self.segments['trades']:
+            if start < offset + len(segment) and stop > offset:
+                trades.extend(segment.records(max(0, start - offset), stop - offset))
+            offset += len(segment)
+            if offset >= stop:
+                break
+        return trades
+
+    def close(self):
+        for segments in self.segments.values():
+            for segment in segments:
+                segment.close()
+
+
+class Archiver:
+    """
+    Periodically moves old inactive orders and trades of some databases to
+    their archives, from a background thread of the process that writes them
+    """
+
+    def __init__(self, databases, archive_after, interval=3600, min_records=1000):
+        self.databases = databases
+        self.archive_after = archive_after
+        self.interval = interval
+        self.min_records = min_records
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='archiver', daemon=True)
+        self._thread.start()
+
+    def run_once(self):
+        """Archive the records older than archive_after seconds in every database"""
+        before = now_ns() - int(self.archive_after * 10**9)
+        for db in self.databases:
+            try:
+                db.archive_history(before, min_records=self.min_records)
+            except Exception:
+                logger.exception('Archiving %s failed', db.data_dir)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
@@ -1,8 +1,29 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.conf import settings
+from . import metrics
 from .jwt_utils import get_user_from_token
 
+JWT_DECODE_SECONDS = metrics.Histogram(
+    'orderbook_jwt_decode_seconds',
+    'Time spent verifying a bearer token, cached or not'
+)
+
+
+class Principal:
+    """
+    The user a request is authenticated as, with the attributes DRF
+    permissions and the views expect of request.user
+    """
+    __slots__ = ('id', 'username')
+    is_authenticated = True
+    is_anonymous = False
+    
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
 class JWTAuthentication(BaseAuthentication):
     """
     Custom JWT authentication for DRF
@@ -14,17 +35,10 @@ class JWTAuthentication(BaseAuthentication):
             return None
         
         token = auth_header[7:]
-        user_data = get_user_from_token(token)
+        with JWT_DECODE_SECONDS.time():
+            user_data = get_user_from_token(token)
         
         if not user_data:
             raise AuthenticationFailed('Invalid token or token expired')
         
-        # Create a simple user object with the necessary methods
-        user = type('User', (object,), {
-            'id': user_data['id'], 
-            'username': user_data['username'],
-            'is_authenticated': True,
-            'is_anonymous': False
-        })
-        
-        return (user, token)
+        return (Principal(user_data['id'], user_data['username']), token)
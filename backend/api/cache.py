@@ -0,0 +1,79 @@
+"""
+Cache - Versioned response bodies for the Order Book application
+
+Read endpoints that many clients poll tag each response with the version of
+the data it was built from. A client that already has that version gets an
+empty 304 Not Modified; anyone else gets the encoded body, built once per
+version and shared by every request for the same resource.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    The latest encoded body of each resource, with the ETag it was built at.
+    Holds at most max_entries resources and max_bytes of bodies, dropping the
+    least recently used; a body larger than max_bytes is not kept at all.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()       # key -> (etag, body)
+        self._bytes = 0                     # Size of the bodies held
+        self._building = {}                 # key -> lock held while its body is built
+        self._lock = threading.Lock()
+
+    def get(self, key, etag, build):
+        """
+        Get the body of a resource at the given ETag, calling build() for it
+        only if no request has yet. Concurrent requests for the same
+        resource wait for one build instead of each encoding it.
+        """
+        entry = self.lookup(key, etag)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            entry = self.lookup(key, etag)
+            if entry is not None:
+                return entry
+
+            body = build()
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= len(previous[1])
+                if len(body) > self.max_bytes:
+                    self._building.pop(key, None)
+                    return body
+
+                self._entries[key] = (etag, body)
+                self._bytes += len(body)
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    evicted, (_, evicted_body) = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted_body)
+                    self._building.pop(evicted, None)
+            return body
+
+    def lookup(self, key, etag):
+        """The cached body of a resource at the given ETag, or None; never waits for a build"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+
+def etag_matches(request, etag):
+    """Whether the client's If-None-Match names the given ETag"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    # Weak comparison, as for If-None-Match
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
@@ -0,0 +1,197 @@
+"""
+Export - Streaming and columnar export of orders and trades for the Order Book application
+
+Records are read from FileDB a chunk at a time and written out as each chunk
+is converted, so exporting the full history holds one chunk in memory.
+
+Text formats, streamed by the export endpoint and the export command:
+- ndjson: one JSON object per line, as the API returns records
+- csv: a header row, then one row per record
+
+The columnar format, written to a file by the export command, is Parquet
+when pyarrow is installed and otherwise a directory of NumPy .npy files,
+one per column, when numpy is. Columnar prices are floats and timestamps
+are nanoseconds since the epoch.
+"""
+import csv
+import io
+import json
+import shutil
+from pathlib import Path
+
+COLLECTIONS = ('orders', 'trades')
+
+# Content type of each text format
+TEXT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+CHUNK_SIZE = 1000
+
+FIELDS = {
+    'orders': ('id', 'symbol', 'user_id', 'user', 'price', 'quantity', 'order_type', 'timestamp',
+               'is_active'),
+    'trades': ('id', 'symbol', 'price', 'quantity', 'timestamp', 'bid_user_id', 'bid_user',
+               'ask_user_id', 'ask_user'),
+}
+
+# Column types of the columnar formats. Strings of unbounded length have no
+# .npy type (short of pickled objects), so .npy exports leave them out.
+COLUMN_TYPES = {
+    'id': 'int64',
+    'symbol': 'string',
+    'user_id': 'int64',
+    'user': 'string',
+    'price': 'float64',
+    'quantity': 'int64',
+    'order_type': 'string',
+    'timestamp': 'timestamp',
+    'is_active': 'bool',
+    'bid_user_id': 'int64',
+    'bid_user': 'string',
+    'ask_user_id': 'int64',
+    'ask_user': 'string',
+}
+
+NPY_TYPES = {'int64': '<i8', 'float64': '<f8', 'bool': '|b1', 'timestamp': '<M8[ns]'}
+
+
+def iter_records(db, collection, since_id=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over chunks of the orders or trades after since_id, optionally
+    bounded by start and end (nanoseconds since the epoch, inclusive)
+    """
+    for chunk in db.iter_chunks(collection, since_id=since_id, chunk_size=chunk_size):
+        if start is not None or end is not None:
+            chunk = [
+                record for record in chunk
+                if (start is None or record.timestamp >= start)
+                and (end is None or record.timestamp <= end)
+            ]
+        if chunk:
+            yield chunk
+
+
+def iter_text(db, collection, fmt, **options):
+    """Iterate over the export in a text format, one string per chunk of records"""
+    tick_size = db.tick_size
+    fields = FIELDS[collection]
+
+    if fmt == 'ndjson':
+        for chunk in iter_records(db, collection, **options):
+            yield ''.join(json.dumps(record.to_dict(tick_size)) + '\n' for record in chunk)
+        return
+
+    if fmt != 'csv':
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields)
+    writer.writeheader()
+    for chunk in iter_records(db, collection, **options):
+        writer.writerows(record.to_dict(tick_size) for record in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def columnar_format():
+    """The columnar format that can be written here: 'parquet', 'npy' or None"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return 'parquet'
+    except ImportError:
+        pass
+    try:
+        import numpy  # noqa: F401
+        return 'npy'
+    except ImportError:
+        return None
+
+
+def write_columnar(db, collection, path, **options):
+    """
+    Write the export in the columnar format available (see columnar_format):
+    a Parquet file at path, or a directory at path with one .npy file per
+    column. Returns the format written and the number of records.
+    Raises RuntimeError if neither pyarrow nor numpy is installed.
+    """
+    fmt = columnar_format()
+    if fmt is None:
+        raise RuntimeError('Columnar export needs pyarrow or numpy')
+
+    chunks = (
+        _columns(chunk, collection, db.tick_size)
+        for chunk in iter_records(db, collection, **options)
+    )
+    if fmt == 'parquet':
+        return fmt, _write_parquet(collection, Path(path), chunks)
+    return fmt, _write_npy(collection, Path(path), chunks)
+
+
+def _columns(chunk, collection, tick_size):
+    """Turn a chunk of records into a list of values per field"""
+    columns = {}
+    for field in FIELDS[collection]:
+        values = [getattr(record, field) for record in chunk]
+        if field == 'price':
+            values = [float(tick_size.to_price(price)) for price in values]
+        columns[field] = values
+    return columns
+
+
+def _write_parquet(collection, path, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('ns'),
+    }
+    schema = pa.schema([(field, types[COLUMN_TYPES[field]]) for field in FIELDS[collection]])
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for columns in chunks:
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(columns['id'])
+    return count
+
+
+def _write_npy(collection, path, chunks):
+    """
+    Write each column to a raw file as chunks arrive, then prefix it with
+    the .npy header once the number of records is known
+    """
+    import numpy as np
+
+    fields = [field for field in FIELDS[collection] if COLUMN_TYPES[field] in NPY_TYPES]
+    dtypes = {field: np.dtype(NPY_TYPES[COLUMN_TYPES[field]]) for field in fields}
+    path.mkdir(parents=True, exist_ok=True)
+
+    raw_paths = {field: path / f'{field}.raw' for field in fields}
+    raw_files = {field: open(raw_path, 'wb') for field, raw_path in raw_paths.items()}
+    count = 0
+    try:
+        for columns in chunks:
+            for field in fields:
+                raw_files[field].write(np.asarray(columns[field], dtype=dtypes[field]).tobytes())
+            count += len(columns['id'])
+    finally:
+        for raw_file in raw_files.values():
+            raw_file.close()
+
+    for field, raw_path in raw_paths.items():
+        header = {
+            'descr': np.lib.format.dtype_to_descr(dtypes[field]),
+            'fortran_order': False,
+            'shape': (count,),
+        }
+        with open(path / f'{field}.npy', 'wb') as f, open(raw_path, 'rb') as raw_file:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(raw_file, f)
+        raw_path.unlink()
+    return count
@@ -1,24 +1,153 @@
 """
 FileDB - A simple file-based database system for the Order Book application
 """
+import bisect
+import heapq
+import itertools
 import json
+import logging
 import os
+from operator import attrgetter
 from pathlib import Path
-from datetime import datetime
 import threading
 
+from . import metrics
+from .archive import ARCHIVED_RECORDS, Archive
+from .fsutil import file_version
+from .group_commit import GroupCommitter
+from .journal import Journal
+from .records import Order, Trade, format_timestamp, now_ns, timestamp_ns
+from .ticks import TickSize
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ('json', 'journal')
+
+# Collections held as records in memory; users stay plain dicts
+RECORD_TYPES = {'orders': Order, 'trades': Trade}
+
+LOAD_SECONDS = metrics.Histogram(
+    'orderbook_filedb_load_seconds',
+    'Time spent parsing a JSON collection file',
+    labels=('collection',)
+)
+SAVE_SECONDS = metrics.Histogram(
+    'orderbook_filedb_save_seconds',
+    'Time spent writing and syncing a JSON collection file',
+    labels=('collection',)
+)
+FLUSH_BYTES = metrics.Histogram(
+    'orderbook_filedb_flush_bytes',
+    'Bytes written to storage by one commit',
+    labels=('storage',),
+    buckets=metrics.SIZE_BUCKETS
+)
+
+
+class StorageReloaded(Exception):
+    """The state a change was made against was discarded by a reload"""
+
+
 class FileDB:
-    """Simple file-based database for storing users, orders, and trades"""
+    """
+    Simple file-based database for storing users, orders, and trades.
+    
+    Two storage modes are supported:
+    - 'json' keeps each collection in its own JSON file, rewritten on every change
+    - 'journal' keeps the collections in memory, appends every change to a
+      write-ahead journal and periodically compacts it into a snapshot
+    
+    Orders and trades belong to a single symbol; records written before
+    multi-symbol support are tagged with it when they are loaded. In memory
+    they are Order and Trade records, and they are returned as such; they are
+    only turned into dicts to be written out. Prices are held in ticks of
+    the database's tick size and stored as decimals.
     
-    def __init__(self, data_dir):
+    A follower is a read-only view of a database written by another process
+    (the sequencer): it picks up the writer's changes as they are published,
+    by reloading changed JSON files or by reading new journal records.
+    
+    Inactive orders and trades older than a threshold can be moved out of
+    the hot tier (the JSON files or the journal state) into memory-mapped
+    archive segments with archive_history. Reads cover both tiers.
+    
+    Changes are applied in memory and then written. If a write fails, the
+    in-memory state is read again from storage, so it never holds a change
+    that was reported as failed, and reloads is incremented; anything built
+    from the state, like the matching engine's book, must then be rebuilt.
+    
+    With group_commit, changes are applied in memory straight away but
+    written in batches by a GroupCommitter, and each write method returns
+    once the batch holding its change is durable. Other readers see a change
+    before it is on disk.
+    """
+    
+    def __init__(self, data_dir, symbol=None, tick_size=None, storage='json', fsync='always',
+                 fsync_interval=1.0, snapshot_interval=10000, follower=False,
+                 group_commit=False, group_commit_window=0.001, group_commit_max_events=256):
+        if storage not in STORAGE_MODES:
+            raise ValueError(f'Unknown storage mode: {storage}')
+        
         self.data_dir = Path(data_dir)
         self.users_file = self.data_dir / 'users.json'
         self.orders_file = self.data_dir / 'orders.json'
         self.trades_file = self.data_dir / 'trades.json'
-        self.lock = threading.RLock()         # Thread-safe lock for file operations
+        # Thread-safe lock for file operations
+        self.lock = metrics.InstrumentedLock(threading.RLock(),
+                                             metrics.LOCK_WAIT_SECONDS.labels('filedb'))
+        self.symbol = symbol
+        self.tick_size = tick_size or TickSize()
+        self.storage = storage
+        self.follower = follower
+        self.snapshot_interval = snapshot_interval
+        self._flush_bytes = FLUSH_BYTES.labels(storage)
+        self._files = {
+            'users': self.users_file,
+            'orders': self.orders_file,
+            'trades': self.trades_file,
+        }
+        
+        # Parsed JSON collections, keyed by name, with the file version they were read at
+        self._cache = {}
+        # Change counter of each collection, bumped whenever it is modified or reloaded.
+        # The epoch tells counters of different opens of the database apart.
+        self.epoch = os.urandom(4).hex()
+        self._versions = dict.fromkeys(self._files, 0)
+        # Hash indexes over each collection, rebuilt whenever it is (re)loaded
+        self._indexes = {}
+        # Collections with changes not yet written by the group committer;
+        # their cached copies are newer than their files
+        self._dirty = set()
+        # How far the trades have been checked for time order: (trades checked,
+        # latest timestamp among them, position from which they are in order)
+        self._trade_order = (0, None, 0)
+        # Number of times the state was read again after a failed write
+        self.reloads = 0
+        # Number of times the state was rebuilt, after a failed write or by a
+        # follower from a new snapshot; record ids may be reused across them
+        self.generation = 0
         
         # Initialize data directory and files if they don't exist
         self._initialize()
+        
+        # Archived orders and trades, and the lock that one archiving run holds
+        self.archive = Archive(self.data_dir / 'archive', symbol, self.tick_size)
+        self._archiving = threading.Lock()
+        
+        # In journal mode the collections live in memory and are rebuilt
+        # from the latest snapshot plus the journal tail
+        self.journal = None
+        self._state = None
+        if storage == 'journal':
+            self.journal = Journal(self.data_dir, fsync=fsync, fsync_interval=fsync_interval,
+                                   follower=follower)
+            self._recover()
+        
+        self._committer = None
+        if group_commit and not follower:
+            self._committer = GroupCommitter(self.lock, self._prepare_batch, self._reload,
+                                             window=group_commit_window,
+                                             max_events=group_commit_max_events)
     
     def _initialize(self):
         """Initialize the data directory and files"""
@@ -48,118 +177,652 @@ class FileDB:
                 return []
             
             try:
-                with open(file_path, 'r') as f:
+                with open(file_path, 'r') as f, LOAD_SECONDS.labels(file_path.stem).time():
                     return json.load(f)
             except json.JSONDecodeError:
                 return []
     
     def _save_data(self, file_path, data):
-        """Save data to a file"""
+        """
+        Save data to a file, atomically replacing the previous version.
+        Returns the number of bytes written.
+        """
+        with self.lock:
+            return self._write_file(file_path, data)
+    
+    @staticmethod
+    def _write_file(file_path, data):
+        """Write data to a file through a temporary file, without taking the lock"""
+        tmp_path = file_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f, SAVE_SECONDS.labels(file_path.stem).time():
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, file_path)
+        return size
+    
+    def _records(self, name, data):
+        """Turn a stored collection into its in-memory form"""
+        record_type = RECORD_TYPES.get(name)
+        if record_type is None:
+            return data
+        return [record_type.from_dict(item, self.tick_size, self.symbol) for item in data]
+    
+    def _stored(self, name, data):
+        """Turn an in-memory collection into its stored form"""
+        if name not in RECORD_TYPES:
+            return data
+        return [record.to_dict(self.tick_size) for record in data]
+    
+    def _stored_changes(self, changes):
+        """Turn changes to an order into the form stored in the journal"""
+        stored = dict(changes)
+        if 'price' in stored:
+            stored['price'] = self.tick_size.to_price(stored['price'])
+        if 'timestamp' in stored:
+            stored['timestamp'] = format_timestamp(stored['timestamp'])
+        return stored
+    
+    def _record_changes(self, stored):
+        """Turn changes to an order read from the journal into their in-memory form"""
+        changes = dict(stored)
+        if 'price' in changes:
+            changes['price'] = self.tick_size.nearest_ticks(changes['price'])
+        if 'timestamp' in changes:
+            changes['timestamp'] = timestamp_ns(changes['timestamp'])
+        return changes
+    
+    def _snapshot(self):
+        self.journal.snapshot({name: self._stored(name, data) for name, data in self._state.items()})
+    
+    def _recover(self):
+        """Rebuild the in-memory state from the journal"""
+        state, records = self.journal.recover()
+        
+        if state is None:
+            # First start in journal mode: seed the state from the JSON files
+            state = {name: self._load_data(path) for name, path in self._files.items()}
+            self._state = {name: self._records(name, data) for name, data in state.items()}
+            if not self.follower:
+                self._snapshot()
+        else:
+            self._state = {name: self._records(name, data) for name, data in state.items()}
+        
+        for name, data in self._state.items():
+            self._build_indexes(name, data)
+            self._versions[name] += 1
+        
+        self._replay(records)
+        # Records archived just before a crash may still be in the snapshot
+        self._drop_archived()
+    
+    def _follow(self):
+        """Follower: apply the journal records the writer appended since the last read"""
+        records = self.journal.read_new()
+        if records is None:
+            # The writer compacted the journal into a new snapshot
+            self._recover()
+            self.generation += 1
+        else:
+            self._replay(records)
+    
+    def _replay(self, records):
+        """Apply journal records to the in-memory state"""
+        for record in records:
+            data = record['data']
+            if record['type'] == 'user':
+                self._state['users'].append(data)
+                self._index_user(data)
+                self._versions['users'] += 1
+            elif record['type'] == 'password':
+                self._indexes['users']['by_username'][data['username']]['password'] = data['password']
+                self._versions['users'] += 1
+            elif record['type'] == 'order':
+                order = Order.from_dict(data, self.tick_size, self.symbol)
+                self._state['orders'].append(order)
+                self._index_order(order)
+                self._versions['orders'] += 1
+            elif record['type'] == 'amend':
+                self._amend_order(self._indexes['orders']['by_id'][data['id']],
+                                  self._record_changes(data['changes']))
+                self._versions['orders'] += 1
+            elif record['type'] == 'trade':
+                trade = Trade.from_dict(data, self.tick_size, self.symbol)
+                self._state['trades'].append(trade)
+                self._index_trade(trade)
+                self._versions['trades'] += 1
+            elif record['type'] == 'archive':
+                # Records were moved to new archive segments
+                self.archive.refresh()
+                self._drop_archived()
+    
+    def _collection(self, name):
+        """
+        Get a collection for reading or modification.
+        This is the live in-memory list: the journal state in journal mode,
+        or the cached copy of the JSON file in JSON mode.
+        """
+        if self.follower:
+            with self.lock:
+                if self.archive.refresh():
+                    # The writer archived records, which may still be loaded
+                    self._drop_archived()
+                if self._state is not None:
+                    self._follow()
+        if self._state is not None:
+            return self._state[name]
+        return self._cached(name)
+    
+    def _cached(self, name):
+        """
+        Get a JSON collection from the in-process cache.
+        The file is only parsed again if it was replaced or modified underneath us.
+        """
+        with self.lock:
+            cached = self._cache.get(name)
+            if cached is not None and name in self._dirty:
+                # The file is behind the cache until the group committer writes it
+                return cached[1]
+            
+            file_path = self._files[name]
+            version = file_version(file_path)
+            if cached is None or cached[0] != version:
+                records = self._records(name, self._load_data(file_path))
+                cached = (version, self._without_archived(name, records))
+                self._cache[name] = cached
+                self._build_indexes(name, cached[1])
+                self._versions[name] += 1
+            
+            return cached[1]
+    
+    def _without_archived(self, name, data):
+        """Leave out the records of a hot collection that are also in the archive"""
+        if name not in RECORD_TYPES or not self.archive.segments[name]:
+            return data
+        last_id = self.archive.last_id(name)
+        if name == 'trades':
+            # Archived trades are always the oldest ones
+            return [trade for trade in data if trade.id > last_id]
+        return [
+            order for order in data
+            if order.is_active or order.id > last_id or ('orders', order.id) not in self.archive
+        ]
+    
+    def _drop_archived(self):
+        """Drop the records that are also in the archive from the loaded hot collections"""
+        for name in RECORD_TYPES:
+            if self._state is not None:
+                data = self._state[name]
+            elif name in self._cache:
+                data = self._cache[name][1]
+            else:
+                continue
+            kept = self._without_archived(name, data)
+            if len(kept) != len(data):
+                data[:] = kept
+                self._build_indexes(name, data)
+                self._versions[name] += 1
+    
+    def _next_id(self, name, data):
+        """The id of the next record of a collection, counting archived records"""
+        last_id = data[-1].id if data else 0
+        return max(last_id, self.archive.last_id(name)) + 1
+    
+    def version(self, name):
+        """
+        Get the current version of a collection, e.g. to tag responses built
+        from it: the epoch and a counter that changes whenever it does
+        """
+        with self.lock:
+            self._collection(name)
+            return f'{self.epoch}-{self._versions[name]}'
+    
+    def _index(self, name):
+        """Get the indexes of a collection, making sure they match its current version"""
+        with self.lock:
+            self._collection(name)
+            return self._indexes[name]
+    
+    def _build_indexes(self, name, data):
+        """Rebuild the indexes of a freshly loaded collection"""
+        if name == 'users':
+            self._indexes['users'] = {
+                'by_username': {},          # username -> user
+            }
+            for user in data:
+                self._index_user(user)
+        elif name == 'orders':
+            self._indexes['orders'] = {
+                'by_id': {},                # order id -> order
+                'by_user': {},              # user id -> [order ids]
+                'active': {},               # active order ids, in id order
+            }
+            for order in data:
+                self._index_order(order)
+        elif name == 'trades':
+            self._indexes['trades'] = {
+                'by_id': {},                # trade id -> trade
+                'by_user': {},              # user id -> [trade ids]
+            }
+            for trade in data:
+                self._index_trade(trade)
+    
+    def _index_user(self, user):
+        self._indexes['users']['by_username'][user['username']] = user
+    
+    def _index_order(self, order):
+        indexes = self._indexes['orders']
+        indexes['by_id'][order.id] = order
+        indexes['by_user'].setdefault(order.user_id, []).append(order.id)
+        if order.is_active:
+            indexes['active'][order.id] = None
+    
+    def _index_trade(self, trade):
+        indexes = self._indexes['trades']
+        indexes['by_id'][trade.id] = trade
+        indexes['by_user'].setdefault(trade.bid_user_id, []).append(trade.id)
+        if trade.ask_user_id != trade.bid_user_id:
+            indexes['by_user'].setdefault(trade.ask_user_id, []).append(trade.id)
+    
+    def _amend_order(self, order, changes):
+        """Apply changes to an order, keeping the active-order set in step"""
+        order.update(changes)
+        if order.is_active:
+            self._indexes['orders']['active'][order.id] = None
+        else:
+            self._indexes['orders']['active'].pop(order.id, None)
+    
+    def _commit(self, collections, events):
+        """
+        Persist modified collections.
+        In JSON mode each modified collection file is rewritten; in journal
+        mode only the events describing the change are appended.
+        In group commit mode the change is queued instead, and the batch to
+        wait on is returned; wait for it with _wait once the lock is released.
+        """
+        with self.lock:
+            if self.follower:
+                raise RuntimeError('A follower FileDB is read-only')
+            
+            for name in collections:
+                self._versions[name] += 1
+            
+            if self._committer is not None:
+                self._dirty.update(collections)
+                return self._committer.submit(collections, events)
+            
+            try:
+                if self.journal is None:
+                    written = 0
+                    for name, data in collections.items():
+                        file_path = self._files[name]
+                        written += self._save_data(file_path, self._stored(name, data))
+                        self._cache[name] = (file_version(file_path), data)
+                    self._flush_bytes.observe(written)
+                    return
+                
+                self._flush_bytes.observe(self.journal.append(events))
+            except Exception:
+                # The in-memory state already holds the change; go back to what was written
+                self._reload()
+                raise
+            if self.journal.records_since_snapshot >= self.snapshot_interval:
+                self._compact()
+    
+    def _compact(self):
+        """
+        Compact the journal into a snapshot. The journal already holds every
+        change, so a failure is logged and compaction is tried again later.
+        """
+        try:
+            self._snapshot()
+        except Exception:
+            logger.exception('Compacting the journal of %s failed', self.data_dir)
+    
+    def _reload(self):
+        """
+        Discard the in-memory state, after a failed write, and read it again
+        from storage, so it holds exactly the changes that were written
+        """
+        with self.lock:
+            self._cache.clear()
+            self._dirty.clear()
+            self._trade_order = (0, None, 0)
+            if self.journal is not None:
+                self._recover()
+            self.reloads += 1
+            self.generation += 1
+            logger.warning('Reloaded %s after a failed write', self.data_dir)
+    
+    @staticmethod
+    def _wait(batch):
+        """Wait for a change queued by _commit to be durable; must not hold the lock"""
+        if batch is not None:
+            batch.wait()
+    
+    def _prepare_batch(self, batch):
+        """
+        Group commit: get a batch's writes ready while the lock is held, and
+        return the function that makes them once it is released. Only the
+        committer thread writes, so the files and the journal are never
+        written concurrently.
+        """
+        if self.journal is not None:
+            if self.journal.records_since_snapshot + len(batch.events) >= self.snapshot_interval:
+                # The snapshot has to match the journal, so nothing may change
+                # in between: write this batch and compact under the lock
+                self._flush_bytes.observe(self.journal.append(batch.events))
+                self._compact()
+                return None
+            
+            def append():
+                self._flush_bytes.observe(self.journal.append(batch.events))
+            
+            return append
+        
+        # Copy the collections as they are now; later changes go in the next batch
+        stored = {name: self._stored(name, list(self._cached(name))) for name in batch.names}
+        versions = {name: self._versions[name] for name in batch.names}
+        
+        def write():
+            written = 0
+            for name, data in stored.items():
+                written += self._write_file(self._files[name], data)
+            self._flush_bytes.observe(written)
+            
+            with self.lock:
+                for name in stored:
+                    self._cache[name] = (file_version(self._files[name]), self._cache[name][1])
+                    # Changed again since it was copied: still ahead of the file
+                    if self._versions[name] == versions[name]:
+                        self._dirty.discard(name)
+        
+        return write
+    
+    def close(self):
+        """Write any queued changes, then flush and close the journal and the archive"""
+        if self._committer is not None:
+            self._committer.close()
         with self.lock:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            if self.journal is not None:
+                self.journal.close()
+            self.archive.close()
     
     # User management methods
     def get_users(self):
         """Get all users"""
-        return self._load_data(self.users_file)
+        return list(self._collection('users'))
     
     def get_user(self, username):
         """Get a user by username"""
-        users = self.get_users()
-        for user in users:
-            if user['username'] == username:
-                return user
-        return None
+        return self._index('users')['by_username'].get(username)
     
     def create_user(self, username, hashed_password):
         """Create a new user"""
-        users = self.get_users()
-        
-        # Check if user already exists
-        if any(user['username'] == username for user in users):
-            return False
-        
-        new_user = {
-            'id': len(users) + 1,
-            'username': username,
-            'password': hashed_password  # Storing hashed password
-        }
-        
-        users.append(new_user)
-        self._save_data(self.users_file, users)
+        with self.lock:
+            users = self._collection('users')
+            
+            # Check if user already exists
+            if username in self._indexes['users']['by_username']:
+                return False
+            
+            new_user = {
+                'id': len(users) + 1,
+                'username': username,
+                'password': hashed_password  # Storing hashed password
+            }
+            
+            users.append(new_user)
+            self._index_user(new_user)
+            batch = self._commit({'users': users}, [('user', new_user)])
+        self._wait(batch)
         return new_user
     
+    def set_password(self, username, hashed_password):
+        """Replace a user's password hash; returns the user, or None if there is no such user"""
+        with self.lock:
+            users = self._collection('users')
+            user = self._indexes['users']['by_username'].get(username)
+            
+            if user is None:
+                return None
+            
+            user['password'] = hashed_password
+            batch = self._commit({'users': users},
+                                 [('password', {'username': username, 'password': hashed_password})])
+        self._wait(batch)
+        return user
+    
     # Order management methods
     def get_orders(self):
-        """Get all orders"""
-        return self._load_data(self.orders_file)
+        """Get all orders, archived ones included"""
+        with self.lock:
+            orders = self._collection('orders')
+            if not self.archive.segments['orders']:
+                return list(orders)
+            return list(heapq.merge(self.archive.iter_after('orders'), orders,
+                                    key=attrgetter('id')))
     
     def get_active_orders(self):
         """Get active orders"""
-        orders = self.get_orders()
-        return [order for order in orders if order['is_active']]
+        with self.lock:
+            indexes = self._index('orders')
+            return [indexes['by_id'][order_id] for order_id in indexes['active']]
     
     def get_user_orders(self, user_id):
-        """Get orders for a specific user"""
-        orders = self.get_orders()
-        return [order for order in orders if order['user_id'] == user_id]
+        """Get orders for a specific user, archived ones included"""
+        with self.lock:
+            indexes = self._index('orders')
+            orders = [indexes['by_id'][order_id] for order_id in indexes['by_user'].get(user_id, ())]
+            archived = self.archive.user_records('orders', user_id)
+            if not archived:
+                return orders
+            return list(heapq.merge(archived, orders, key=attrgetter('id')))
+    
+    def get_order(self, order_id):
+        """Get an order by id, from the archive if it is not in the hot tier"""
+        with self.lock:
+            order = self._index('orders')['by_id'].get(order_id)
+            if order is None:
+                order = self.archive.get('orders', order_id)
+            return order
     
     def create_order(self, user_id, username, price, quantity, order_type):
-        """Create a new order"""
-        orders = self.get_orders()
-        
-        # Create new order
-        new_order = {
-            'id': len(orders) + 1,
-            'user_id': user_id,
-            'user': username,
-            'price': float(price),
-            'quantity': int(quantity),
-            'order_type': order_type,
-            'timestamp': datetime.now().isoformat(),
-            'is_active': True
-        }
-        
-        orders.append(new_order)
-        self._save_data(self.orders_file, orders)
+        """Create a new order at a price in ticks"""
+        with self.lock:
+            orders = self._collection('orders')
+            
+            # Create new order
+            new_order = Order(
+                id=self._next_id('orders', orders),
+                symbol=self.symbol,
+                user_id=user_id,
+                user=username,
+                price=int(price),
+                quantity=int(quantity),
+                order_type=order_type,
+                timestamp=now_ns()
+            )
+            
+            orders.append(new_order)
+            self._index_order(new_order)
+            batch = self._commit({'orders': orders}, [('order', new_order.to_dict(self.tick_size))])
+        self._wait(batch)
         return new_order
     
     def update_order(self, order_id, **kwargs):
         """Update an order"""
-        orders = self.get_orders()
-        
-        for i, order in enumerate(orders):
-            if order['id'] == order_id:
-                orders[i].update(kwargs)
-                self._save_data(self.orders_file, orders)
-                return orders[i]
-        
-        return None
+        with self.lock:
+            orders = self._collection('orders')
+            order = self._indexes['orders']['by_id'].get(order_id)
+            
+            if order is None:
+                return None
+            
+            self._amend_order(order, kwargs)
+            batch = self._commit({'orders': orders},
+                                 [('amend', {'id': order_id, 'changes': self._stored_changes(kwargs)})])
+        self._wait(batch)
+        return order
     
     # Trade management methods
     def get_trades(self):
-        """Get all trades"""
-        return self._load_data(self.trades_file)
+        """Get all trades, archived ones included"""
+        with self.lock:
+            trades = self._collection('trades')
+            return self.archive.trades(0, self.archive.count('trades')) + trades
     
-    def create_trade(self, price, quantity, bid_user_id, bid_username, ask_user_id, ask_username):
-        """Create a new trade"""
-        trades = self.get_trades()
-        
-        # Create new trade
-        new_trade = {
-            'id': len(trades) + 1,
-            'price': float(price),
-            'quantity': int(quantity),
-            'timestamp': datetime.now().isoformat(),
-            'bid_user_id': bid_user_id,
-            'bid_user': bid_username,
-            'ask_user_id': ask_user_id,
-            'ask_user': ask_username
-        }
+    def get_trades_page(self, since_id=None, before_id=None, start=None, end=None, limit=100):
+        """
+        Get a window of trades by seeking into the trade history.
+        With since_id, returns the trades after it, oldest first; otherwise
+        returns the newest trades before before_id, newest first.
+        start and end (nanoseconds since the epoch, inclusive) bound the
+        trade timestamps.
+        Returns the trades and whether more trades match beyond the window.
+        """
+        with self.lock:
+            trades = self._collection('trades')
+            archived = self.archive.count('trades')
+            
+            # Trades are stored in id order, and the archived trades come
+            # before the hot ones, so positions run through the archive and on
+            # into the hot tier. From _time_ordered() on they are in timestamp
+            # order too, so a timestamp is found by bisecting there.
+            def position(value, key, right=False):
+                search = bisect.bisect_right if right else bisect.bisect_left
+                return (self.archive.bisect_trades(value, key, right) 
+                        + search(trades, value, key=attrgetter(key)))
+            
+            def window(first, last):
+                records = self.archive.trades(first, min(last, archived)) if first < archived else []
+                return records + trades[max(0, first - archived):max(0, last - archived)]
+            
+            lo, hi = 0, archived + len(trades)
+            if since_id is not None:
+                lo = position(since_id, 'id', right=True)
+            if before_id is not None:
+                hi = position(before_id, 'id')
+            
+            # Trades before the ordered ones, stored out of time order by older
+            # versions, are filtered one by one
+            early = []
+            if start is not None or end is not None:
+                ordered = min(max(lo, self._time_ordered()), hi)
+                early = [
+                    trade for trade in window(lo, ordered)
+                    if (start is None or trade.timestamp >= start)
+                    and (end is None or trade.timestamp <= end)
+                ]
+                lo = ordered
+            if start is not None:
+                lo = max(lo, position(start, 'timestamp'))
+            if end is not None:
+                hi = min(hi, position(end, 'timestamp', right=True))
+            hi = max(lo, hi)
+            
+            if since_id is not None:
+                if len(early) >= limit:
+                    return early[:limit], len(early) > limit or lo < hi
+                rest = limit - len(early)
+                return early + window(lo, min(hi, lo + rest)), lo + rest < hi
+            
+            first = max(lo, hi - limit)
+            page = window(first, hi)[::-1]
+            rest = limit - len(page)
+            if rest > 0 and early:
+                page.extend(early[:-rest - 1:-1])
+            return page, first > lo or len(early) > max(rest, 0)
+    
+    def _time_ordered(self):
+        """
+        The position from which trades are in timestamp order, none older
+        than any trade before it. New trades always are; only trades stored
+        by older versions may not be. Trades added since the last call are
+        checked, so each trade is only checked once.
+        """
+        trades = self._collection('trades')
+        archived = self.archive.count('trades')
+        total = archived + len(trades)
+        checked, latest, ordered = self._trade_order
+        if total < checked:
+            checked, latest, ordered = 0, None, 0
+        if total > checked:
+            timestamps = itertools.chain(
+                self.archive.trade_timestamps(checked) if checked < archived else (),
+                (trade.timestamp for trade in trades[max(0, checked - archived):])
+            )
+            for position, timestamp in enumerate(timestamps, checked):
+                if latest is not None and timestamp < latest:
+                    ordered = position + 1
+                else:
+                    latest = timestamp
+            self._trade_order = (total, latest, ordered)
+        return ordered
+    
+    def iter_chunks(self, name, since_id=None, chunk_size=1000):
+        """
+        Iterate over the orders or trades after since_id, chunk_size at a time,
+        archived ones included. Only records that exist when iteration starts
+        are returned. Each chunk is taken under the lock (orders are copied,
+        as they change), so a long export holds one chunk and never blocks
+        writers for long. Every chunk seeks past the last id returned, so
+        records archived in between are neither missed nor repeated.
+        """
+        by_id = attrgetter('id')
+        with self.lock:
+            data = self._collection(name)
+            stop_id = max(data[-1].id if data else 0, self.archive.last_id(name))
         
-        trades.append(new_trade)
-        self._save_data(self.trades_file, trades)
+        last_id = since_id
+        while True:
+            with self.lock:
+                data = self._collection(name)
+                position = 0 if last_id is None else bisect.bisect_right(data, last_id, key=by_id)
+                records = itertools.islice(data, position, None)
+                if name == 'orders':
+                    records = (order.copy() for order in records)
+                if self.archive.segments[name]:
+                    records = heapq.merge(self.archive.iter_after(name, last_id), records, key=by_id)
+                chunk = list(itertools.islice(
+                    itertools.takewhile(lambda record: record.id <= stop_id, records), chunk_size
+                ))
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            yield chunk
+    
+    def get_user_trades(self, user_id):
+        """Get trades where a specific user was the buyer or the seller, archived ones included"""
+        with self.lock:
+            indexes = self._index('trades')
+            trades = [indexes['by_id'][trade_id] for trade_id in indexes['by_user'].get(user_id, ())]
+            return self.archive.user_records('trades', user_id) + trades
+    
+    def create_trade(self, price, quantity, bid_user_id, bid_username, ask_user_id, ask_username):
+        """Create a new trade at a price in ticks"""
+        with self.lock:
+            trades = self._collection('trades')
+            
+            # Create new trade
+            new_trade = Trade(
+                id=self._next_id('trades', trades),
+                symbol=self.symbol,
+                price=int(price),
+                quantity=int(quantity),
+                # Trades are kept in time order as well as id order
+                timestamp=max(now_ns(), trades[-1].timestamp) if trades else now_ns(),
+                bid_user_id=bid_user_id,
+                bid_user=bid_username,
+                ask_user_id=ask_user_id,
+                ask_user=ask_username
+            )
+            
+            trades.append(new_trade)
+            self._index_trade(new_trade)
+            batch = self._commit({'trades': trades}, [('trade', new_trade.to_dict(self.tick_size))])
+        self._wait(batch)
         return new_trade
     
     def get_order_book(self):
@@ -167,82 +830,107 @@ class FileDB:
         active_orders = self.get_active_orders()
         
         # Separate bids and asks
-        bids = [order for order in active_orders if order['order_type'] == 'bid']
-        asks = [order for order in active_orders if order['order_type'] == 'ask']
+        bids = [order for order in active_orders if order.order_type == 'bid']
+        asks = [order for order in active_orders if order.order_type == 'ask']
         
         # Sort bids in descending order by price
-        bids.sort(key=lambda x: x['price'], reverse=True)
+        bids.sort(key=lambda x: x.price, reverse=True)
         
         # Sort asks in ascending order by price
-        asks.sort(key=lambda x: x['price'])
+        asks.sort(key=lambda x: x.price)
         
         return {'bids': bids, 'asks': asks}
     
-    def match_orders(self, new_order):
+    # Tiering
+    def archive_history(self, before, min_records=1):
         """
-        Match orders based on price and quantity.
-        Returns a list of executed trades.
+        Move inactive orders and trades older than before (nanoseconds since
+        the epoch) from the hot tier to new archive segments, for each of the
+        two with at least min_records to move. Returns the number of orders
+        and of trades archived.
         """
-        order_book = self.get_order_book()
-        executed_trades = []
+        if self.follower:
+            raise RuntimeError('A follower FileDB is read-only')
         
-        if new_order['order_type'] == 'bid':
-            # For a bid, find matching asks (lower or equal price)
-            matching_orders = [
-                ask for ask in order_book['asks'] 
-                if ask['price'] <= new_order['price'] and ask['user_id'] != new_order['user_id']
-            ]
+        with self._archiving:
+            with self.lock:
+                orders = [
+                    order for order in self._collection('orders')
+                    if not order.is_active and order.timestamp < before
+                ]
+                # Trades are archived oldest first by id, so only the run of
+                # them from the first one that is older than before moves
+                trades = list(itertools.takewhile(
+                    lambda trade: trade.timestamp < before, self._collection('trades')
+                ))
+            moving = {
+                name: records
+                for name, records in (('orders', orders), ('trades', trades))
+                if records and len(records) >= min_records
+            }
+            if not moving:
+                return 0, 0
             
-            # Sort matching asks by price (ascending)
-            matching_orders.sort(key=lambda x: x['price'])
-        else:
-            # For an ask, find matching bids (higher or equal price)
-            matching_orders = [
-                bid for bid in order_book['bids'] 
-                if bid['price'] >= new_order['price'] and bid['user_id'] != new_order['user_id']
-            ]
-            
-            # Sort matching bids by price (descending)
-            matching_orders.sort(key=lambda x: x['price'], reverse=True)
-        
-        remaining_quantity = new_order['quantity']
-        
-        for match in matching_orders:
-            if remaining_quantity <= 0:
-                break
-            
-            # Determine trade quantity
-            trade_quantity = min(remaining_quantity, match['quantity'])
-            
-            # Create trade
-            if new_order['order_type'] == 'bid':
-                trade = self.create_trade(
-                    match['price'], trade_quantity,
-                    new_order['user_id'], new_order['user'],
-                    match['user_id'], match['user']
-                )
-            else:
-                trade = self.create_trade(
-                    match['price'], trade_quantity,
-                    match['user_id'], match['user'],
-                    new_order['user_id'], new_order['user']
-                )
+            # Inactive orders and trades never change again, so their segments
+            # are written without holding up order entry
+            file_names = {name: self.archive.write(name, records) for name, records in moving.items()}
             
-            executed_trades.append(trade)
+            with self.lock:
+                self.archive.publish(file_names)
+                collections = {}
+                for name, records in moving.items():
+                    archived = {record.id for record in records}
+                    data = self._collection(name)
+                    data[:] = [record for record in data if record.id not in archived]
+                    self._build_indexes(name, data)
+                    collections[name] = data
+                    ARCHIVED_RECORDS.labels(name).inc(len(records))
+                batch = self._commit(collections, [('archive', file_names)])
+            self._wait(batch)
+        
+        return len(moving.get('orders', ())), len(moving.get('trades', ()))
+    
+    def record_execution(self, new_orders, trades, order_updates, wait=True, reloads=None):
+        """
+        Persist the outcome of matching a batch of incoming orders.
+        Assigns ids to the new orders and their trades, applies the changes
+        to existing orders and writes each file once.
+        In group commit mode, wait=False returns the queued batch instead of
+        waiting for it, so the caller can release its own locks before it
+        waits; otherwise returns None once the change is durable.
+        With reloads, the number of reloads the batch was matched against,
+        raises StorageReloaded without changing anything if the state has
+        been reloaded since.
+        """
+        with self.lock:
+            if reloads is not None and reloads != self.reloads:
+                raise StorageReloaded(f'{self.data_dir} was reloaded after a failed write')
+            orders = self._collection('orders')
+            events = []
             
-            # Update matched order
-            if trade_quantity == match['quantity']:
-                self.update_order(match['id'], is_active=False)
-            else:
-                self.update_order(match['id'], quantity=match['quantity'] - trade_quantity)
+            orders_by_id = self._indexes['orders']['by_id']
+            for order_id, changes in order_updates.items():
+                self._amend_order(orders_by_id[order_id], changes)
+                events.append(('amend', {'id': order_id, 'changes': self._stored_changes(changes)}))
             
-            # Update remaining quantity
-            remaining_quantity -= trade_quantity
-        
-        # Update the new order if partially or fully filled
-        if remaining_quantity <= 0:
-            self.update_order(new_order['id'], is_active=False)
-        elif remaining_quantity < new_order['quantity']:
-            self.update_order(new_order['id'], quantity=remaining_quantity)
-        
-        return executed_trades
+            for new_order in new_orders:
+                new_order.id = self._next_id('orders', orders)
+                orders.append(new_order)
+                self._index_order(new_order)
+                events.append(('order', new_order.to_dict(self.tick_size)))
+            
+            collections = {'orders': orders}
+            
+            if trades:
+                all_trades = self._collection('trades')
+                for trade in trades:
+                    trade.id = self._next_id('trades', all_trades)
+                    all_trades.append(trade)
+                    self._index_trade(trade)
+                    events.append(('trade', trade.to_dict(self.tick_size)))
+                collections['trades'] = all_trades
+            
+            batch = self._commit(collections, events)
+        if not wait:
+            return batch
+        self._wait(batch)
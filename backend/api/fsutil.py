@@ -0,0 +1,23 @@
+"""
+File system helpers shared by the storage modules of the Order Book application
+"""
+import os
+
+
+def file_version(file_path):
+    """Identify the current version of a file by its inode, mtime and size"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def fsync_dir(path):
+    """Make a rename in a directory durable"""
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,158 @@
+"""
+Group commit - Coalesced storage writes for FileDB
+
+In group commit mode FileDB does not write each change as it is made.
+Changes made within a short window are queued into one batch, and a
+committer thread writes and syncs the whole batch at once: one journal
+append and fsync, or one rewrite of each modified JSON file. Every writer
+waits for its batch to be durable before it returns, so a change is
+acknowledged only once it is on disk, as without group commit.
+
+The window opens with the first change of a batch and closes after
+`window` seconds, or as soon as the batch holds `max_events` events. With
+a window of 0 a batch is written as soon as the committer is free, so
+batches form only from the changes made while the previous one is written.
+"""
+import threading
+import time
+
+from . import metrics
+
+BATCH_EVENTS = metrics.Histogram(
+    'orderbook_group_commit_events',
+    'Events written by one group commit',
+    buckets=metrics.COUNT_BUCKETS + (256, 512, 1024)
+)
+BATCH_COMMITS = metrics.Histogram(
+    'orderbook_group_commit_writers',
+    'Changes coalesced into one group commit',
+    buckets=metrics.COUNT_BUCKETS + (256, 512, 1024)
+)
+WAIT_SECONDS = metrics.Histogram(
+    'orderbook_group_commit_wait_seconds',
+    'Time a writer waited for its group commit to be durable'
+)
+
+
+class Batch:
+    """The changes queued within one window, written and synced together"""
+    __slots__ = ('names', 'events', 'commits', 'error', '_done')
+
+    def __init__(self):
+        self.names = set()                  # Collections modified by the batch
+        self.events = []                    # Journal events, in commit order
+        self.commits = 0
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self):
+        """Block until the batch is durable; raises the error that writing it failed with"""
+        with WAIT_SECONDS.time():
+            self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommitter:
+    """
+    Queues changes into batches and writes each batch from its own thread.
+
+    prepare(batch) is called with the storage lock held, once nothing more
+    can join the batch; it gets the batch's writes ready and returns a
+    function that performs them after the lock is released (or None if it
+    has already written them), so new changes can queue for the next batch
+    while this one goes to disk.
+
+    Changes are already applied in memory when they are queued, so a batch
+    that fails to write leaves memory ahead of storage, and the batch queued
+    behind it was made on top of it. recover() is then called with the
+    storage lock held to read the state back from storage, and both batches
+    fail with the same error.
+    """
+
+    def __init__(self, lock, prepare, recover, window=0.001, max_events=256):
+        self.window = window
+        self.max_events = max_events
+        self._lock = lock
+        self._prepare = prepare
+        self._recover = recover
+        self._pending = None
+        self._opened = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, names, events):
+        """
+        Queue the events of one change to the named collections.
+        Returns the batch to wait on; the caller must release the storage
+        lock first, since the committer needs it to write the batch.
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('The group committer is closed')
+            batch = self._pending
+            if batch is None:
+                batch = self._pending = Batch()
+                self._opened = time.monotonic()
+                self._condition.notify()
+            batch.names.update(names)
+            batch.events.extend(events)
+            batch.commits += 1
+            if len(batch.events) >= self.max_events:
+                self._condition.notify()
+            return batch
+
+    def close(self):
+        """Write any queued changes and stop the committer thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                deadline = self._opened + self.window
+                while not self._closed and len(self._pending.events) < self.max_events:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self._commit()
+
+    def _commit(self):
+        """Write and sync the pending batch, then release its writers"""
+        batch = None
+        done = []
+        try:
+            with self._lock:
+                with self._condition:
+                    batch, self._pending = self._pending, None
+                done.append(batch)
+                write = self._prepare(batch)
+            if write is not None:
+                write()
+        except Exception as exc:
+            if batch is None:
+                raise
+            try:
+                with self._lock:
+                    with self._condition:
+                        if self._pending is not None:
+                            done.append(self._pending)
+                            self._pending = None
+                    self._recover()
+            finally:
+                for failed in done:
+                    failed.error = exc
+        finally:
+            for each in done:
+                BATCH_EVENTS.observe(len(each.events))
+                BATCH_COMMITS.observe(each.commits)
+                each._done.set()
@@ -0,0 +1,228 @@
+"""
+Journal - An append-only write-ahead log with compacted snapshots for FileDB
+"""
+import json
+import os
+import time
+import zlib
+from pathlib import Path
+
+from . import metrics
+from .fsutil import file_version, fsync_dir
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+FSYNC_SECONDS = metrics.Histogram(
+    'orderbook_journal_fsync_seconds',
+    'Time spent syncing the journal to disk'
+)
+
+
+class Journal:
+    """
+    Append-only journal of FileDB events.
+
+    Every record is one line of the form ``<crc32>\\t<json>\\n`` and carries a
+    sequence number. A snapshot stores the full state together with the
+    sequence number of the last record it includes, so recovery loads the
+    snapshot and replays only the records that follow it. A record that was
+    torn by a crash fails its checksum and is cut off during recovery.
+
+    A journal opened as a follower never writes; it tracks how far it has
+    read so that read_new can pick up records appended by the writer.
+    Compaction replaces the journal with a new, empty file, so a follower
+    that read the old one can tell and recover from the new snapshot.
+    """
+
+    def __init__(self, data_dir, fsync='always', fsync_interval=1.0, follower=False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy: {fsync}')
+
+        self.data_dir = Path(data_dir)
+        self.journal_file = self.data_dir / 'journal.log'
+        self.snapshot_file = self.data_dir / 'snapshot.json'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.follower = follower
+
+        self.seq = 0                        # Sequence number of the last record written
+        self.records_since_snapshot = 0
+        self._last_fsync = time.monotonic()
+        self._fd = None
+        self._offset = 0                    # Bytes of the journal read so far
+        self._inode = None                  # Of the journal file read so far
+        self._tail = b''                    # Last line read, which must still be there
+        self._snapshot_version = None
+
+    def recover(self):
+        """
+        Load the latest snapshot and the records written after it.
+        Returns the snapshot state (or None) and the list of records to replay.
+        """
+        state = None
+        self.seq = 0
+        self._snapshot_version = file_version(self.snapshot_file)
+        if self.snapshot_file.exists():
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+            self.seq = snapshot['seq']
+            state = snapshot['state']
+
+        self._offset = 0
+        self._inode = None
+        self._tail = b''
+        records = self._read_records()
+
+        # A follower leaves a torn tail alone; the writer may still be appending it
+        if not self.follower:
+            if self.journal_file.exists() and self._offset < self.journal_file.stat().st_size:
+                os.truncate(self.journal_file, self._offset)
+            self._open()
+
+        self.records_since_snapshot = len(records)
+        return state, records
+
+    def read_new(self):
+        """
+        Follower: read the records appended since the last read.
+        Returns None if the writer has compacted the journal since, or the
+        journal no longer lines up with what was read (it was cut back after
+        a failed write, say), in which case the state has to be recovered
+        again from the snapshot.
+        """
+        if file_version(self.snapshot_file) != self._snapshot_version:
+            return None
+        try:
+            stat = self.journal_file.stat()
+        except FileNotFoundError:
+            return None
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            return None
+        return self._read_records(following=True)
+
+    def _read_records(self, following=False):
+        """
+        Read complete records from the current offset onwards. Following,
+        returns None if the file is not the one read so far, the last record
+        read is no longer in place or a complete record fails its checksum
+        past the start, where the offset can only have landed mid-record.
+        """
+        records = []
+        if not self.journal_file.exists():
+            return records
+
+        with open(self.journal_file, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if following and inode != self._inode:
+                return None
+            self._inode = inode
+
+            if following and self._tail:
+                f.seek(self._offset - len(self._tail))
+                if f.read(len(self._tail)) != self._tail:
+                    return None
+
+            f.seek(self._offset)
+            for line in f:
+                record = self._decode(line)
+                if record is None:
+                    if following and self._offset > 0 and line.endswith(b'\n'):
+                        return None
+                    # Torn or corrupt tail; everything after it is discarded
+                    break
+                self._offset += len(line)
+                self._tail = line
+                if record['seq'] > self.seq:
+                    records.append(record)
+                    self.seq = record['seq']
+        return records
+
+    def append(self, events):
+        """
+        Append a batch of (type, data) events with a single write.
+        Returns the number of bytes written.
+        """
+        lines = []
+        for event_type, data in events:
+            self.seq += 1
+            lines.append(self._encode({'seq': self.seq, 'type': event_type, 'data': data}))
+
+        payload = b''.join(lines)
+        start = os.fstat(self._fd).st_size
+        try:
+            os.write(self._fd, payload)
+            self._sync()
+        except OSError:
+            # Take back whatever part of the batch reached the file, so that
+            # a batch reported as failed is never replayed
+            self.seq -= len(lines)
+            try:
+                os.ftruncate(self._fd, start)
+            except OSError:
+                pass
+            raise
+        self.records_since_snapshot += len(lines)
+        return len(payload)
+
+    def snapshot(self, state):
+        """Write a compacted snapshot of the full state and reset the journal"""
+        tmp_file = self.snapshot_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'seq': self.seq, 'state': state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        fsync_dir(self.data_dir)
+
+        # Records up to self.seq now live in the snapshot, so the journal can
+        # start over. A crash before this point only leaves records that
+        # recovery skips by sequence number. The new journal is a new file,
+        # never the old one truncated, so followers see it was replaced.
+        tmp_file = self.journal_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb'):
+            pass
+        os.replace(tmp_file, self.journal_file)
+        fsync_dir(self.data_dir)
+        self._open()
+        self.records_since_snapshot = 0
+
+    def close(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _sync(self):
+        """Flush the journal to disk according to the fsync policy"""
+        if self.fsync == 'always':
+            with FSYNC_SECONDS.time():
+                os.fsync(self._fd)
+        elif self.fsync == 'interval':
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                with FSYNC_SECONDS.time():
+                    os.fsync(self._fd)
+                self._last_fsync = now
+
+    @staticmethod
+    def _encode(record):
+        payload = json.dumps(record, separators=(',', ':')).encode()
+        return b'%08x\t%s\n' % (zlib.crc32(payload), payload)
+
+    @staticmethod
+    def _decode(line):
+        """Decode one journal line, or return None if it is torn or corrupt"""
+        if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b'\t':
+            return None
+        payload = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
@@ -1,12 +1,31 @@
 import jwt
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from django.conf import settings
 
+from . import metrics
+
 # JWT settings
 JWT_SECRET = settings.SECRET_KEY
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_DELTA = timedelta(days=1)
 
+# Most verified tokens remembered, least recently used dropped first
+JWT_CACHE_SIZE = 10000
+
+CACHE_REQUESTS = metrics.Counter(
+    'orderbook_jwt_cache_requests_total',
+    'Token verifications answered from the cache (hit) or by decoding (miss)',
+    labels=('result',)
+)
+_cache_hits = CACHE_REQUESTS.labels('hit')
+_cache_misses = CACHE_REQUESTS.labels('miss')
+
+_verified = OrderedDict()                   # token -> (user info, expiry in epoch seconds)
+_verified_lock = threading.Lock()
+
 
 def get_token_for_user(user_id, username):
     """Generate a JWT token for a user"""
@@ -20,12 +39,35 @@ def get_token_for_user(user_id, username):
 
 
 def get_user_from_token(token):
-    """Get user information from a JWT token"""
+    """
+    Get user information from a JWT token.
+    Tokens that verified are remembered until they expire, so repeat requests
+    with the same token skip decoding and signature verification. The
+    returned dict is shared between callers and must not be modified.
+    """
+    with _verified_lock:
+        entry = _verified.get(token)
+        if entry is not None:
+            if entry[1] > time.time():
+                _verified.move_to_end(token)
+                _cache_hits.inc()
+                return entry[0]
+            del _verified[token]
+
+    _cache_misses.inc()
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return {
+        user_data = {
             'id': payload['user_id'], 
             'username': payload['username']
         }
     except:
         return None
+
+    # Tokens without an expiry are still verified, but never cached
+    if 'exp' in payload:
+        with _verified_lock:
+            _verified[token] = (user_data, payload['exp'])
+            if len(_verified) > JWT_CACHE_SIZE:
+                _verified.popitem(last=False)
+    return user_data
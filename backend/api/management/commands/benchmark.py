@@ -0,0 +1,102 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import order_path
+
+# Recorded on, and only meaningful for, the machine that runs the comparison;
+# it is not checked in
+BASELINE_FILE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order entry latency and throughput on synthetic order flow'
+
+    # The benchmark swaps the market the views serve, so the URLconf must not
+    # be imported (and the real market built) by the system checks first
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', choices=order_path.TARGETS,
+                            help='Order path to benchmark; repeat for several (default: all)')
+        parser.add_argument('--mix', action='append', choices=list(order_path.MIXES),
+                            help='Order flow mix to replay; repeat for several (default: all)')
+        parser.add_argument('--ops', type=int, default=1000, help='Operations per run')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs of each target and mix; the median is reported')
+        parser.add_argument('--depth', type=int, default=50, help='Price levels per side')
+        parser.add_argument('--orders-per-level', type=int, default=4,
+                            help='Resting orders per seeded price level')
+        parser.add_argument('--history', type=int, default=2000, help='Seeded trades')
+        parser.add_argument('--users', type=int, default=20, help='Trading users')
+        parser.add_argument('--storage', choices=('json', 'journal'), default='json',
+                            help='FileDB storage mode')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed of the order flow')
+        parser.add_argument('--baseline', default=str(BASELINE_FILE),
+                            help='Baseline results file to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed fraction of throughput lost or p99 latency gained')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write the results as the new baseline instead of comparing. '
+                                 'Baselines are per machine and not checked in, so CI must '
+                                 'record one first, on the machine that compares')
+        parser.add_argument('--require-baseline', action='store_true',
+                            help='Fail instead of only reporting when there is no baseline '
+                                 'recorded with the same options (for CI)')
+
+    def handle(self, *args, **options):
+        if options['tolerance'] < 0:
+            raise CommandError('Tolerance must not be negative')
+        if options['repeat'] < 1:
+            raise CommandError('Repeat must be at least 1')
+
+        config = {
+            name: options[name]
+            for name in ('ops', 'depth', 'orders_per_level', 'history', 'users', 'storage', 'seed',
+                         'repeat')
+        }
+        targets = options['target'] or order_path.TARGETS
+        mixes = options['mix'] or list(order_path.MIXES)
+
+        with tempfile.TemporaryDirectory(prefix='order-book-bench-') as work_dir:
+            results = order_path.run(work_dir, targets=targets, mixes=mixes, **config)
+
+        self.stdout.write(f"{'run':<20}{'ops':>8}{'ops/s':>12}{'p50 us':>12}{'p99 us':>12}"
+                          f"{'p999 us':>12}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<20}{result['ops']:>8}{result['throughput']:>12.0f}"
+                f"{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}{result['p999_us']:>12.1f}"
+            )
+
+        baseline_file = Path(options['baseline'])
+        if options['save_baseline']:
+            with open(baseline_file, 'w') as f:
+                json.dump({'config': config, 'results': results}, f, indent=2)
+            self.stdout.write(f'Baseline written to {baseline_file}')
+            return
+
+        if not baseline_file.exists():
+            self._no_baseline(options, 'No baseline to compare against; record one on this '
+                                       'machine with --save-baseline')
+            return
+
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            self._no_baseline(options, 'Baseline was recorded with a different configuration; '
+                                       'not compared')
+            return
+
+        regressions = order_path.compare(results, baseline['results'], options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def _no_baseline(self, options, message):
+        if options['require_baseline']:
+            raise CommandError(message)
+        self.stdout.write(message)
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import export
+from api.market import database_from_settings
+from api.records import timestamp_ns
+
+
+class Command(BaseCommand):
+    help = 'Export the orders or trades of a symbol as NDJSON, CSV or a columnar format'
+
+    # Exports read the files next to a running server; they need nothing else
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection', choices=export.COLLECTIONS)
+        parser.add_argument('--symbol', help='Symbol to export (default: the default symbol)')
+        parser.add_argument('--format', choices=list(export.TEXT_FORMATS) + ['columnar'],
+                            default='ndjson',
+                            help='Output format; columnar is Parquet with pyarrow, else .npy '
+                                 'files with numpy')
+        parser.add_argument('--output', help='Output path (default: standard output for text)')
+        parser.add_argument('--since-id', type=int, help='Only records after this id')
+        parser.add_argument('--start', help='Only records at or after this ISO timestamp')
+        parser.add_argument('--end', help='Only records at or before this ISO timestamp')
+
+    def handle(self, *args, **options):
+        try:
+            start = timestamp_ns(options['start']) if options['start'] else None
+            end = timestamp_ns(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('--start and --end must be ISO timestamps')
+
+        db = database_from_settings(options['symbol'])
+        if db is None:
+            raise CommandError(f"Unknown symbol: {options['symbol']}")
+
+        collection = options['collection']
+        fmt = options['format']
+        selection = {'since_id': options['since_id'], 'start': start, 'end': end}
+        try:
+            if fmt == 'columnar':
+                if not options['output']:
+                    raise CommandError('Columnar exports need --output')
+                try:
+                    written, count = export.write_columnar(db, collection, options['output'],
+                                                           **selection)
+                except RuntimeError as exc:
+                    raise CommandError(str(exc))
+                self.stdout.write(f"Exported {count} {collection} as {written} to "
+                                  f"{options['output']}")
+                return
+
+            chunks = export.iter_text(db, collection, fmt, **selection)
+            if options['output']:
+                with open(options['output'], 'w', newline='') as f:
+                    f.writelines(chunks)
+            else:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+        finally:
+            db.close()
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.market import market_from_settings
+from api.sequencer import SequencerServer
+
+
+class Command(BaseCommand):
+    help = 'Run the sequencer process that owns the order books and serves order entry'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            help="Unix socket to listen on (defaults to ORDER_BOOK['SEQUENCER_SOCKET'])"
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or getattr(settings, 'ORDER_BOOK', {}).get('SEQUENCER_SOCKET')
+        if not socket_path:
+            raise CommandError("No socket given and ORDER_BOOK['SEQUENCER_SOCKET'] is not set")
+
+        market = market_from_settings(sequencer=True)
+        server = SequencerServer(socket_path, market)
+
+        self.stdout.write(f'Sequencer listening on {socket_path} for {", ".join(market.symbols())}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
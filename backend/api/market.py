@@ -0,0 +1,180 @@
+"""
+Market - Per-symbol order books and storage for the Order Book application
+"""
+import os
+from pathlib import Path
+
+from django.conf import settings
+
+from .archive import Archiver
+from .filedb import FileDB
+from .matching import MatchingEngine
+from .sequencer import RemoteEngine, SequencerClient
+from .stats import TradeTape
+from .ticks import DEFAULT_TICK_SIZE, TickSize
+
+
+class Instrument:
+    """
+    The storage, matching engine and tick size of a single tradable symbol,
+    and the columnar trade tape market statistics are computed from
+    """
+    __slots__ = ('symbol', 'db', 'engine', 'tick_size', 'tape')
+
+    def __init__(self, symbol, db, engine, tick_size):
+        self.symbol = symbol
+        self.db = db
+        self.engine = engine
+        self.tick_size = tick_size
+        self.tape = TradeTape(db)
+
+
+class Market:
+    """
+    Registry of tradable instruments.
+
+    Every symbol has its own FileDB and matching engine, and therefore its own
+    files and locks, so order entry on one symbol never waits on another.
+    Users live in the main data directory, which also keeps the orders and
+    trades of the default symbol; other symbols are stored under
+    ``symbols/<SYMBOL>/``. Each symbol trades in whole ticks of its tick size
+    (DEFAULT_TICK_SIZE if it has none).
+
+    Given a sequencer client, the market belongs to a web worker: every
+    database is a read-only follower and order entry and user creation are
+    forwarded to the sequencer process that owns the books.
+
+    Given archive_after (seconds), the market that writes the databases
+    moves inactive orders and trades older than that to their archives
+    every archive_interval seconds.
+    """
+
+    def __init__(self, data_dir, symbols, default_symbol, tick_sizes=None, sequencer=None,
+                 archive_after=None, archive_interval=3600, archive_min_records=1000,
+                 **storage_options):
+        if default_symbol not in symbols:
+            raise ValueError(f'Default symbol {default_symbol} is not a listed symbol')
+
+        self.data_dir = Path(data_dir)
+        self.default_symbol = default_symbol
+        self.sequencer = sequencer
+        storage_options['follower'] = sequencer is not None
+        tick_sizes = {
+            symbol: TickSize((tick_sizes or {}).get(symbol, DEFAULT_TICK_SIZE))
+            for symbol in symbols
+        }
+        self.db = FileDB(self.data_dir, symbol=default_symbol,
+                         tick_size=tick_sizes[default_symbol], **storage_options)
+
+        self.instruments = {}
+        for symbol in symbols:
+            tick_size = tick_sizes[symbol]
+            if symbol == default_symbol:
+                db = self.db
+            else:
+                db = FileDB(symbol_dir(self.data_dir, symbol, default_symbol), symbol=symbol,
+                            tick_size=tick_size, **storage_options)
+
+            if sequencer is not None:
+                engine = RemoteEngine(sequencer, symbol, tick_size)
+            else:
+                engine = MatchingEngine(db, symbol)
+            self.instruments[symbol] = Instrument(symbol, db, engine, tick_size)
+
+        self.archiver = None
+        if archive_after is not None and sequencer is None:
+            self.archiver = Archiver(
+                [instrument.db for instrument in self.instruments.values()],
+                archive_after, interval=archive_interval, min_records=archive_min_records
+            )
+
+    def get(self, symbol=None):
+        """Get an instrument by symbol, or the default one; None if it is not listed"""
+        return self.instruments.get(symbol or self.default_symbol)
+
+    def symbols(self):
+        """All listed symbols"""
+        return list(self.instruments)
+
+    def create_user(self, username, hashed_password):
+        """Create a user in the main database, through the sequencer if there is one"""
+        if self.sequencer is not None:
+            return self.sequencer.call('create_user', username=username,
+                                       hashed_password=hashed_password)
+        return self.db.create_user(username, hashed_password)
+
+    def set_password(self, username, hashed_password):
+        """Replace a user's password hash, through the sequencer if there is one"""
+        if self.sequencer is not None:
+            return self.sequencer.call('set_password', username=username,
+                                       hashed_password=hashed_password)
+        return self.db.set_password(username, hashed_password)
+
+
+def symbol_dir(data_dir, symbol, default_symbol):
+    """The directory keeping the orders and trades of a symbol"""
+    data_dir = Path(data_dir)
+    if symbol == default_symbol:
+        return data_dir
+    return data_dir / 'symbols' / symbol
+
+
+def market_from_settings(sequencer=False):
+    """
+    Build the market described by the FILEDB and ORDER_BOOK settings.
+    Data lives in FILEDB['DATA_DIR'], by default the data directory of the project.
+    If ORDER_BOOK['SEQUENCER_SOCKET'] is set, web workers get a market that
+    forwards to the sequencer, and the sequencer itself is built with
+    sequencer=True.
+    """
+    filedb_settings = getattr(settings, 'FILEDB', {})
+    order_book_settings = getattr(settings, 'ORDER_BOOK', {})
+
+    socket_path = order_book_settings.get('SEQUENCER_SOCKET')
+    client = None
+    if socket_path and not sequencer:
+        client = SequencerClient(socket_path,
+                                 timeout=order_book_settings.get('SEQUENCER_TIMEOUT', 10.0))
+
+    return Market(
+        filedb_settings.get('DATA_DIR', os.path.join(settings.BASE_DIR, 'data')),
+        symbols=order_book_settings.get('SYMBOLS', ['RELIANCE']),
+        default_symbol=order_book_settings.get('DEFAULT_SYMBOL', 'RELIANCE'),
+        tick_sizes=order_book_settings.get('TICK_SIZES'),
+        sequencer=client,
+        archive_after=filedb_settings.get('ARCHIVE_AFTER'),
+        archive_interval=filedb_settings.get('ARCHIVE_INTERVAL', 3600),
+        archive_min_records=filedb_settings.get('ARCHIVE_MIN_RECORDS', 1000),
+        storage=filedb_settings.get('STORAGE', 'json'),
+        fsync=filedb_settings.get('FSYNC', 'always'),
+        fsync_interval=filedb_settings.get('FSYNC_INTERVAL', 1.0),
+        snapshot_interval=filedb_settings.get('SNAPSHOT_INTERVAL', 10000),
+        group_commit=filedb_settings.get('GROUP_COMMIT', False),
+        group_commit_window=filedb_settings.get('GROUP_COMMIT_WINDOW', 0.001),
+        group_commit_max_events=filedb_settings.get('GROUP_COMMIT_MAX_EVENTS', 256)
+    )
+
+
+def database_from_settings(symbol=None):
+    """
+    Open a read-only view of the storage of one listed symbol (the default
+    one if not given), without building a market or its matching engines,
+    for tools that run next to the server. Returns None for an unknown symbol.
+    """
+    filedb_settings = getattr(settings, 'FILEDB', {})
+    order_book_settings = getattr(settings, 'ORDER_BOOK', {})
+
+    default_symbol = order_book_settings.get('DEFAULT_SYMBOL', 'RELIANCE')
+    symbol = symbol or default_symbol
+    if symbol not in order_book_settings.get('SYMBOLS', ['RELIANCE']):
+        return None
+
+    tick_size = (order_book_settings.get('TICK_SIZES') or {}).get(symbol, DEFAULT_TICK_SIZE)
+    data_dir = filedb_settings.get('DATA_DIR', os.path.join(settings.BASE_DIR, 'data'))
+    return FileDB(
+        symbol_dir(data_dir, symbol, default_symbol),
+        symbol=symbol,
+        tick_size=TickSize(tick_size),
+        storage=filedb_settings.get('STORAGE', 'json'),
+        follower=True
+    )
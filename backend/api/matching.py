@@ -0,0 +1,629 @@
+"""
+Matching engine - A resident price-time-priority order book for the Order Book application
+"""
+import bisect
+import threading
+from collections import OrderedDict
+
+from . import metrics
+from .filedb import StorageReloaded
+from .positions import PositionLedger
+from .records import Order, Trade, now_ns
+
+MATCH_ITERATIONS = metrics.Counter(
+    'orderbook_match_iterations_total',
+    'Resting orders examined while matching incoming orders',
+    labels=('symbol',)
+)
+FILLS_PER_ORDER = metrics.Histogram(
+    'orderbook_fills_per_order',
+    'Trades executed by one incoming or amended order',
+    labels=('symbol',),
+    buckets=metrics.COUNT_BUCKETS
+)
+BATCH_SECONDS = metrics.Histogram(
+    'orderbook_batch_seconds',
+    'Time spent processing one batch of commands, including storage',
+    labels=('symbol',)
+)
+BOOK_LEVELS = metrics.Gauge(
+    'orderbook_book_levels',
+    'Price levels on one side of the book',
+    labels=('symbol', 'side')
+)
+RESTING_ORDERS = metrics.Gauge(
+    'orderbook_resting_orders',
+    'Orders resting on the book',
+    labels=('symbol',)
+)
+
+
+class PriceLevel:
+    """All resting orders at a single price, kept in time priority"""
+    __slots__ = ('price', 'orders', 'quantity')
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = OrderedDict()         # order id -> order, oldest first
+        self.quantity = 0                   # Total resting quantity at this price
+
+
+class LevelSnapshot:
+    """A price level as it was when a book snapshot was taken; never modified"""
+    __slots__ = ('price', 'quantity', 'orders')
+
+    def __init__(self, price, quantity, orders):
+        self.price = price
+        self.quantity = quantity
+        self.orders = orders                # Tuple of order copies, oldest first
+
+    def state(self):
+        return {'price': self.price, 'quantity': self.quantity, 'orders': len(self.orders)}
+
+
+class BookSnapshot:
+    """
+    The whole book as it was after one batch, best prices first; never
+    modified. The engine replaces its snapshot after every batch, so a
+    reader that holds one sees a consistent book without taking any lock.
+    """
+    __slots__ = ('sequence', 'bids', 'asks')
+
+    def __init__(self, sequence, bids, asks):
+        self.sequence = sequence
+        self.bids = bids                    # Tuples of LevelSnapshots
+        self.asks = asks
+
+    def order_book(self):
+        """All resting orders of each side in priority order"""
+        return {
+            'bids': [order for level in self.bids for order in level.orders],
+            'asks': [order for level in self.asks for order in level.orders],
+        }
+
+    def depth(self, max_levels=None):
+        """Aggregated quantity and order count for the best price levels of each side"""
+        return {
+            'bids': [level.state() for level in self.bids[:max_levels]],
+            'asks': [level.state() for level in self.asks[:max_levels]],
+        }
+
+
+class BookSide:
+    """One side of the order book, indexed by price level"""
+
+    def __init__(self, order_type):
+        self.order_type = order_type
+        self.levels = {}                    # price -> PriceLevel
+        # Sorted level keys; the best price is always at the end of the list.
+        # Bids are keyed by price and asks by negated price.
+        self._sign = 1 if order_type == 'bid' else -1
+        self._keys = []
+        self._level_snapshots = {}          # key -> LevelSnapshot of the last snapshot
+        self._snapshot = ()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def add(self, order):
+        """Append an order to the back of the queue at its price"""
+        price = order.price
+        level = self.levels.get(price)
+        if level is None:
+            level = PriceLevel(price)
+            self.levels[price] = level
+            bisect.insort(self._keys, self._sign * price)
+        level.orders[order.id] = order
+        level.quantity += order.quantity
+
+    def remove_level(self, price):
+        """Drop an empty price level from the index"""
+        del self.levels[price]
+        key = self._sign * price
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def levels_from_best(self):
+        """Iterate price levels from the best price outwards"""
+        for key in reversed(self._keys):
+            yield self.levels[self._sign * key]
+
+    def crosses(self, level_price, limit_price):
+        """Whether a resting level on this side is marketable against a limit price"""
+        if self.order_type == 'bid':
+            return level_price >= limit_price
+        return level_price <= limit_price
+
+    def snapshot(self, prices, published):
+        """
+        The side's levels, best first, as LevelSnapshots. Only the levels at
+        prices are taken again; the others are shared with the last snapshot.
+        published maps the id of every resting order to its latest copy.
+        """
+        if not prices:
+            return self._snapshot
+        for price in prices:
+            key = self._sign * price
+            level = self.levels.get(price)
+            if level is None:
+                self._level_snapshots.pop(key, None)
+            else:
+                self._level_snapshots[key] = LevelSnapshot(
+                    price, level.quantity, tuple(map(published.__getitem__, level.orders))
+                )
+        self._snapshot = tuple(map(self._level_snapshots.__getitem__, reversed(self._keys)))
+        return self._snapshot
+
+    def level_state(self, price):
+        """Aggregated state of one price level; an empty level has zero quantity"""
+        level = self.levels.get(price)
+        if level is None:
+            return {'price': price, 'quantity': 0, 'orders': 0}
+        return {'price': price, 'quantity': level.quantity, 'orders': len(level.orders)}
+
+
+class MatchingEngine:
+    """
+    In-memory price-time-priority matching engine.
+    The book is rebuilt from the active orders in FileDB on startup, and every
+    incoming order (or batch of orders) is persisted with a single storage
+    write once it is matched. Under group commit the engine lock is released
+    before that write is durable, so orders from other users are matched
+    while it is written.
+
+    Prices are integer ticks of the database's tick size, so price levels are
+    keyed and compared as integers.
+
+    Listeners registered with add_listener are called with an execution event
+    after each order or batch is processed, while the engine lock is still
+    held, so they see events in sequence order and must return quickly.
+    Under group commit they may see an event before it is durable.
+
+    After each batch the engine also publishes an immutable BookSnapshot,
+    which get_order_book and get_depth read without taking the engine lock,
+    so market data reads never wait for order entry or hold it up. A new
+    snapshot takes again only the price levels the batch changed.
+
+    The book is matched in memory before the batch is written. If storage
+    fails to write it (or any other change), storage reloads what it holds
+    and the engine rebuilds the book, the positions and the snapshot from
+    that, so it never carries on from a change that was never written.
+    """
+
+    def __init__(self, db, symbol=None):
+        self.db = db
+        self.symbol = symbol
+        self.tick_size = db.tick_size
+        # Serializes order entry against the book
+        self.lock = metrics.InstrumentedLock(threading.RLock(),
+                                             metrics.LOCK_WAIT_SECONDS.labels('engine'))
+        self.bids = BookSide('bid')
+        self.asks = BookSide('ask')
+        self.sequence = 0                   # Number of book changes since startup
+        self._clock = 0                     # Latest timestamp given or loaded, in ns
+        self._resting = {}                  # order id -> resting order, for O(1) lookup
+        self._published = {}                # order id -> copy of the resting order, for snapshots
+        self._listeners = []
+        # Per-user positions, kept up to date as orders rest, fill and leave the book
+        self.positions = PositionLedger(symbol, self.tick_size)
+
+        label = symbol or ''
+        self._match_iterations = MATCH_ITERATIONS.labels(label)
+        self._fills_per_order = FILLS_PER_ORDER.labels(label)
+        self._batch_seconds = BATCH_SECONDS.labels(label)
+        self._bid_levels = BOOK_LEVELS.labels(label, 'bid')
+        self._ask_levels = BOOK_LEVELS.labels(label, 'ask')
+        self._resting_orders = RESTING_ORDERS.labels(label)
+
+        self._reloads = db.reloads          # Storage reloads the book was built after
+        self._load()
+        self._update_gauges()
+
+    def _load(self):
+        """Rebuild the book from the active orders in storage"""
+        # An order's timestamp is when it took its place in the queue, which
+        # is later than its id suggests if it has since been amended
+        for order in sorted(self.db.get_active_orders(), key=lambda order: order.timestamp):
+            self._rest(order.copy())
+            self._clock = max(self._clock, order.timestamp)
+        for chunk in self.db.iter_chunks('trades'):
+            self.positions.load(chunk)
+            self._clock = max(self._clock, max(trade.timestamp for trade in chunk))
+
+        self._published = {order_id: order.copy() for order_id, order in self._resting.items()}
+        self.snapshot = BookSnapshot(
+            self.sequence,
+            self.bids.snapshot(list(self.bids.levels), self._published),
+            self.asks.snapshot(list(self.asks.levels), self._published),
+        )
+
+    def _reload(self):
+        """
+        Rebuild the book and the positions from storage after it reloaded,
+        and tell listeners the new state of every level either book had
+        """
+        old = self.snapshot
+        self.bids = BookSide('bid')
+        self.asks = BookSide('ask')
+        self._resting = {}
+        self.positions = PositionLedger(self.symbol, self.tick_size)
+        self.sequence += 1
+        self._reloads = self.db.reloads
+        self._load()
+        self._update_gauges()
+
+        if self._listeners:
+            levels = {'bid': {}, 'ask': {}}
+            for order_type, sides in (('bid', (old.bids, self.snapshot.bids)),
+                                      ('ask', (old.asks, self.snapshot.asks))):
+                for side in sides:
+                    levels[order_type].update(dict.fromkeys(level.price for level in side))
+            self._publish([], [], levels)
+
+    def _now(self):
+        """
+        The current time for a new order or trade. It never goes back, even
+        if the system clock does, so trades are timestamped in id order.
+        """
+        self._clock = max(self._clock, now_ns())
+        return self._clock
+
+    def _side(self, order_type):
+        return self.bids if order_type == 'bid' else self.asks
+
+    def _update_gauges(self):
+        self._bid_levels.set(len(self.bids))
+        self._ask_levels.set(len(self.asks))
+        self._resting_orders.set(len(self._resting))
+
+    def _rest(self, order):
+        """Add an order to the back of the queue at its price level"""
+        self._side(order.order_type).add(order)
+        self._resting[order.id] = order
+        self.positions.rest(order)
+
+    def get_order_book(self):
+        """
+        Get the current order book (bids and asks) from the latest snapshot.
+        The orders are shared with the snapshot and must not be modified.
+        """
+        return self.snapshot.order_book()
+
+    def add_listener(self, listener):
+        """Register a callable to receive execution events"""
+        with self.lock:
+            self._listeners.append(listener)
+
+    def get_depth(self, max_levels=None):
+        """Get the aggregated price levels at the top of each side of the book"""
+        return self.snapshot.depth(max_levels)
+
+    def get_position(self, user_id):
+        """Get a user's position, P&L and open order exposure from memory"""
+        with self.lock:
+            return self.positions.get(user_id)
+
+    def submit_order(self, user_id, username, price, quantity, order_type):
+        """
+        Match a new order against the book and rest any remainder.
+        Returns the stored order and the list of executed trades.
+        """
+        command = ('new', {'price': price, 'quantity': quantity, 'order_type': order_type})
+        result = self.submit_batch(user_id, username, [command])[0]
+        return result['order'], result['trades']
+
+    def cancel_order(self, user_id, order_id):
+        """
+        Cancel one of the user's resting orders.
+        Returns the cancelled order, or None if the user has no such active order.
+        """
+        result = self.submit_batch(user_id, None, [('cancel', {'order_id': order_id})])[0]
+        return result.get('order')
+
+    def amend_order(self, user_id, order_id, price=None, quantity=None):
+        """
+        Change the price or remaining quantity of one of the user's resting orders.
+        Returns the amended order and the trades it executed, or None and no
+        trades if the user has no such active order.
+        """
+        command = ('amend', {'order_id': order_id, 'price': price, 'quantity': quantity})
+        result = self.submit_batch(user_id, None, [command])[0]
+        return result.get('order'), result.get('trades', [])
+
+    def submit_batch(self, user_id, username, commands):
+        """
+        Process a list of commands for one user in a single pass, with one
+        storage write for the whole batch. Commands are ('new', {price,
+        quantity, order_type}), ('cancel', {order_id}) or ('amend', {order_id,
+        price, quantity}).
+        Returns one result per command, in order.
+        """
+        results = []
+        new_orders = []
+        trades = []
+        order_updates = {}
+        changed = []
+        moved = []                          # (order type, price) of levels amended orders left
+
+        with self.lock, self._batch_seconds.time():
+            if self._reloads != self.db.reloads:
+                self._reload()
+
+            for action, args in commands:
+                if action == 'new':
+                    new_order = self._new_order(user_id, username, **args)
+                    order_trades, updates, touched = self._match(new_order)
+                    for order_id, changes in updates.items():
+                        order_updates.setdefault(order_id, {}).update(changes)
+                    new_orders.append(new_order)
+                    trades.extend(order_trades)
+                    changed.append(new_order)
+                    changed.extend(touched)
+                    results.append({'status': 'accepted', 'order': new_order, 'trades': order_trades})
+                elif action == 'cancel':
+                    order = self._cancel(user_id, args['order_id'])
+                    if order is None:
+                        results.append({'status': 'rejected', 'detail': 'Order not found'})
+                        continue
+                    order_updates.setdefault(order.id, {}).update(is_active=False)
+                    changed.append(order)
+                    results.append({'status': 'cancelled', 'order': order})
+                elif action == 'amend':
+                    amended = self._amend(user_id, **args)
+                    if amended is None:
+                        results.append({'status': 'rejected', 'detail': 'Order not found'})
+                        continue
+                    order, old_price, order_trades, updates, touched = amended
+                    for order_id, changes in updates.items():
+                        order_updates.setdefault(order_id, {}).update(changes)
+                    trades.extend(order_trades)
+                    moved.append((order.order_type, old_price))
+                    changed.append(order)
+                    changed.extend(touched)
+                    results.append({'status': 'amended', 'order': order.copy(), 'trades': order_trades})
+                else:
+                    raise ValueError(f'Unknown command: {action}')
+
+            if not new_orders and not order_updates:
+                return results
+
+            try:
+                batch = self.db.record_execution(new_orders, trades, order_updates, wait=False,
+                                                 reloads=self._reloads)
+            except StorageReloaded:
+                # A failed write elsewhere discarded state this batch was
+                # matched against; match it again on the book as stored
+                self._reload()
+                return self.submit_batch(user_id, username, commands)
+            except Exception:
+                # Storage went back to what it holds; so does the book
+                self._reload()
+                raise
+
+            # New orders only rest once storage has given them ids. Orders in
+            # one batch belong to the same user, so they can never match each other.
+            for new_order in new_orders:
+                if new_order.is_active:
+                    self._rest(new_order.copy())
+
+            self.sequence += 1
+            self._update_gauges()
+            levels = self._changed_levels(changed, moved)
+            copies = self._publish_snapshot(changed, levels)
+            if self._listeners:
+                self._publish(copies, trades, levels)
+
+        # With group commit the book has moved on already; only the reply
+        # to this user waits for the batch to reach the disk
+        if batch is not None:
+            try:
+                batch.wait()
+            except Exception:
+                # The book was published ahead of a batch that never reached
+                # the disk; storage has reloaded, so take the book back too
+                with self.lock:
+                    if self._reloads != self.db.reloads:
+                        self._reload()
+                raise
+        return results
+
+    def _new_order(self, user_id, username, price, quantity, order_type):
+        return Order(
+            id=None,
+            symbol=self.symbol,
+            user_id=user_id,
+            user=username,
+            price=int(price),
+            quantity=int(quantity),
+            order_type=order_type,
+            timestamp=self._now()
+        )
+
+    def _cancel(self, user_id, order_id):
+        """Take a resting order off the book through its id"""
+        order = self._resting.get(order_id)
+        if order is None or order.user_id != user_id:
+            return None
+
+        del self._resting[order_id]
+        side = self._side(order.order_type)
+        level = side.levels[order.price]
+        del level.orders[order_id]
+        level.quantity -= order.quantity
+        if not level.orders:
+            side.remove_level(order.price)
+        self.positions.unrest(order, order.quantity, closed=True)
+
+        order.is_active = False
+        return order
+
+    def _amend(self, user_id, order_id, price=None, quantity=None):
+        """
+        Change a resting order through its id.
+        Reducing the quantity at the same price keeps the order's place in the
+        queue. Any other change takes it off the book and enters it again as
+        if new, so it may trade and rests at the back of its new price level.
+        Returns the order, its previous price, its trades, the changes to
+        apply to orders and the resting orders it filled, or None if the
+        user has no such active order.
+        """
+        order = self._resting.get(order_id)
+        if order is None or order.user_id != user_id:
+            return None
+
+        old_price = order.price
+        price = old_price if price is None else int(price)
+        quantity = order.quantity if quantity is None else int(quantity)
+
+        if price == old_price and quantity <= order.quantity:
+            self._side(order.order_type).levels[price].quantity -= order.quantity - quantity
+            self.positions.unrest(order, order.quantity - quantity)
+            order.quantity = quantity
+            return order, old_price, [], {order_id: {'quantity': quantity}}, []
+
+        self._cancel(user_id, order_id)
+        order.price = price
+        order.quantity = quantity
+        order.timestamp = self._now()
+        order.is_active = True
+        trades, order_updates, touched = self._match(order)
+        if order.is_active:
+            self._rest(order)
+
+        order_updates[order_id] = {
+            'price': order.price,
+            'quantity': order.quantity,
+            'timestamp': order.timestamp,
+            'is_active': order.is_active,
+        }
+        return order, old_price, trades, order_updates, touched
+
+    def _changed_levels(self, orders, moved=()):
+        """The prices of the levels on each side changed by one batch, in order of change"""
+        levels = {'bid': {}, 'ask': {}}
+        for order in orders:
+            levels[order.order_type][order.price] = None
+        for order_type, price in moved:
+            levels[order_type][price] = None
+        return levels
+
+    def _publish_snapshot(self, orders, levels):
+        """
+        Replace the book snapshot after a batch that changed orders and the
+        levels they are at. Returns copies of the orders, which are shared
+        with the snapshot while they rest.
+        """
+        copies = []
+        for order in orders:
+            copy = order.copy()
+            if copy.is_active:
+                self._published[copy.id] = copy
+            else:
+                self._published.pop(copy.id, None)
+            copies.append(copy)
+
+        self.snapshot = BookSnapshot(
+            self.sequence,
+            self.bids.snapshot(levels['bid'], self._published),
+            self.asks.snapshot(levels['ask'], self._published),
+        )
+        return copies
+
+    def _publish(self, orders, trades, levels):
+        """Notify listeners of the orders and price levels changed by one batch"""
+        event = {
+            'symbol': self.symbol,
+            'sequence': self.sequence,
+            'orders': orders,
+            'trades': trades,
+            'depth': {
+                'bids': [self.bids.level_state(price) for price in levels['bid']],
+                'asks': [self.asks.level_state(price) for price in levels['ask']],
+            },
+        }
+        for listener in self._listeners:
+            listener(event)
+
+    def _match(self, new_order):
+        """
+        Walk the opposite side from the best price while it crosses the new order.
+        Returns the executed trades, the changes to apply to resting orders and
+        the resting orders that were filled.
+        """
+        opposite = self.asks if new_order.order_type == 'bid' else self.bids
+        remaining_quantity = new_order.quantity
+        trades = []
+        order_updates = {}
+        touched = []
+        exhausted_levels = []
+        examined = 0
+
+        for level in opposite.levels_from_best():
+            if remaining_quantity <= 0 or not opposite.crosses(level.price, new_order.price):
+                break
+
+            filled = []
+            for match in level.orders.values():
+                if remaining_quantity <= 0:
+                    break
+                examined += 1
+                # Never trade against the user's own resting orders
+                if match.user_id == new_order.user_id:
+                    continue
+
+                trade_quantity = min(remaining_quantity, match.quantity)
+                trade = self._trade(new_order, match, trade_quantity)
+                trades.append(trade)
+                level.quantity -= trade_quantity
+                self.positions.unrest(match, trade_quantity,
+                                      closed=trade_quantity == match.quantity)
+                self.positions.fill(trade)
+
+                if trade_quantity == match.quantity:
+                    filled.append(match.id)
+                    match.is_active = False
+                    order_updates[match.id] = {'is_active': False}
+                else:
+                    match.quantity -= trade_quantity
+                    order_updates[match.id] = {'quantity': match.quantity}
+                touched.append(match)
+
+                remaining_quantity -= trade_quantity
+
+            for order_id in filled:
+                del level.orders[order_id]
+                del self._resting[order_id]
+            if not level.orders:
+                exhausted_levels.append(level.price)
+
+        for price in exhausted_levels:
+            opposite.remove_level(price)
+
+        self._match_iterations.inc(examined)
+        self._fills_per_order.observe(len(trades))
+
+        # Update the new order if partially or fully filled
+        if remaining_quantity <= 0:
+            new_order.is_active = False
+        elif remaining_quantity < new_order.quantity:
+            new_order.quantity = remaining_quantity
+
+        return trades, order_updates, touched
+
+    def _trade(self, new_order, match, quantity):
+        """Build a trade at the resting order's price"""
+        if new_order.order_type == 'bid':
+            bid, ask = new_order, match
+        else:
+            bid, ask = match, new_order
+
+        return Trade(
+            id=None,
+            symbol=self.symbol,
+            price=match.price,
+            quantity=quantity,
+            timestamp=self._now(),
+            bid_user_id=bid.user_id,
+            bid_user=bid.user,
+            ask_user_id=ask.user_id,
+            ask_user=ask.user
+        )
@@ -0,0 +1,241 @@
+"""
+Metrics - Low-overhead counters, gauges and histograms for the Order Book application
+
+Metrics are process-wide and rendered in the Prometheus text exposition
+format by the metrics endpoint. Recording a value costs at most one
+uncontended lock acquisition and a bisect, so instrumentation stays on.
+
+Metrics with labels hand out one child per combination of label values;
+hot paths look their children up once and keep them.
+"""
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of histogram buckets
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    """A named metric and its children, one per combination of label values"""
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+        with _registry_lock:
+            if name in _registry:
+                raise ValueError(f'Metric {name} is already registered')
+            _registry[name] = self
+
+        if not self.label_names:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Get the child for the given label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} takes labels {self.label_names}')
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            labels = list(zip(self.label_names, values))
+            lines.extend(child.render(self.name, labels))
+        return lines
+
+
+class _Value:
+    """The current value of a counter or gauge"""
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labels):
+        return [f'{name}{_format_labels(labels)} {_format_number(self.value)}']
+
+
+class _Observations:
+    """Bucket counts, sum and count of a histogram"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager that observes the time spent in its block, in seconds"""
+        return _Timer(self)
+
+    def render(self, name, labels):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        lines = []
+        cumulative = 0
+        bounds = [_format_number(bound) for bound in self.buckets] + ['+Inf']
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels + [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('observations', 'started')
+
+    def __init__(self, observations):
+        self.observations = observations
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.observations.observe(time.perf_counter() - self.started)
+
+
+class Counter(_Metric):
+    """A value that only goes up"""
+    kind = 'counter'
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that is set to its current level"""
+    kind = 'gauge'
+
+    def _child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    """A distribution of observed values over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def _child(self):
+        return _Observations(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class InstrumentedLock:
+    """
+    Wraps a Lock or RLock and records how long acquisitions wait for it.
+    An acquisition that gets the lock straight away records nothing, so an
+    uncontended lock costs one extra non-blocking acquire.
+    """
+    __slots__ = ('_lock', '_wait')
+
+    def __init__(self, lock, wait):
+        self._lock = lock
+        self._wait = wait
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        self._wait.observe(time.perf_counter() - started)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Shared by every lock the order path takes
+LOCK_WAIT_SECONDS = Histogram(
+    'orderbook_lock_wait_seconds',
+    'Time spent waiting for a contended lock',
+    labels=('lock',)
+)
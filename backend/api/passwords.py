@@ -0,0 +1,128 @@
+"""
+Passwords - Password hashing and verification for the Order Book application
+
+Passwords are stored as salted PBKDF2-SHA256 hashes:
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+Hashing is deliberately slow, so it runs in a bounded pool of threads rather
+than on the request thread. hashlib releases the GIL while it hashes, so the
+pool uses as many cores as it has workers, and the workers are kept below
+the number of cores so a logon storm cannot starve order entry. Requests
+beyond the workers queue for them; past the queue limit they are refused
+with PoolBusy instead of piling up.
+
+Users registered before this stored an unsalted SHA-256 hex digest; those
+still verify, and needs_rehash tells the caller to replace them.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import metrics
+
+ALGORITHM = 'pbkdf2_sha256'
+DEFAULT_ITERATIONS = 600000
+SALT_BYTES = 16
+
+HASH_SECONDS = metrics.Histogram(
+    'orderbook_password_hash_seconds',
+    'Time spent hashing one password in the hashing pool'
+)
+WAIT_SECONDS = metrics.Histogram(
+    'orderbook_password_wait_seconds',
+    'Time a password spent queued for and hashing in the pool'
+)
+REJECTED = metrics.Counter(
+    'orderbook_password_rejected_total',
+    'Password hashes refused because the pool queue was full'
+)
+
+
+class PoolBusy(Exception):
+    """Too many passwords are already waiting to be hashed"""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a bounded pool of worker threads"""
+
+    def __init__(self, iterations=DEFAULT_ITERATIONS, workers=None, max_queued=64):
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        self.iterations = iterations
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='password-hasher')
+        # One slot per worker plus one per queued request
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+
+    def hash(self, password):
+        """Hash a password with a fresh salt, in the pool; raises PoolBusy if it is full"""
+        salt = base64.b64encode(os.urandom(SALT_BYTES)).decode()
+        digest = self._run(_pbkdf2, password, salt, self.iterations)
+        return f'{ALGORITHM}${self.iterations}${salt}${digest}'
+
+    def verify(self, password, encoded):
+        """
+        Check a password against its stored hash, in the pool; raises PoolBusy
+        if it is full. A malformed hash matches no password.
+        """
+        if '$' not in encoded:
+            # Legacy unsalted SHA-256 digest, too cheap to be worth the pool
+            expected = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(encoded.encode(), expected.encode())
+
+        parsed = _parse(encoded)
+        if parsed is None:
+            return False
+        iterations, salt, digest = parsed
+        computed = self._run(_pbkdf2, password, salt, iterations)
+        return hmac.compare_digest(digest.encode(), computed.encode())
+
+    def needs_rehash(self, encoded):
+        """Whether a stored hash is legacy, malformed or weaker than the current settings"""
+        parsed = _parse(encoded)
+        return parsed is None or parsed[0] != self.iterations
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            REJECTED.inc()
+            raise PoolBusy('Too many logins in progress, try again shortly')
+        try:
+            with WAIT_SECONDS.time():
+                return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+
+def _parse(encoded):
+    """The iterations, salt and digest of a PBKDF2 hash, or None if it is not one"""
+    parts = encoded.split('$', 3)
+    if len(parts) != 4 or parts[0] != ALGORITHM:
+        return None
+    try:
+        iterations = int(parts[1])
+    except ValueError:
+        return None
+    if iterations < 1:
+        return None
+    return iterations, parts[2], parts[3]
+
+
+def _pbkdf2(password, salt, iterations):
+    with HASH_SECONDS.time():
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations)
+    return base64.b64encode(digest).decode()
+
+
+def hasher_from_settings():
+    """Build the password hasher described by the PASSWORDS settings"""
+    password_settings = getattr(settings, 'PASSWORDS', {})
+    return PasswordHasher(
+        iterations=password_settings.get('ITERATIONS', DEFAULT_ITERATIONS),
+        workers=password_settings.get('WORKERS'),
+        max_queued=password_settings.get('MAX_QUEUED', 64)
+    )
@@ -0,0 +1,163 @@
+"""
+Positions - Per-user positions and P&L for the Order Book application
+
+A PositionLedger belongs to one matching engine and is updated by it as
+orders rest, fill and leave the book, so a user's position is always at
+hand and reading it never touches the trade history:
+- net quantity (positive long, negative short) and its average price
+- realized P&L, booked with the average cost method as a position is
+  reduced or reversed, and unrealized P&L at the last trade price
+- open order exposure: the orders, quantity and notional resting on each side
+
+The ledger is rebuilt from the trade history and the resting book when the
+engine starts. Amounts are kept in ticks (times quantity), exactly; average
+prices and P&L are given to VWAP_EXTRA_PLACES more decimals than the tick.
+"""
+from decimal import Decimal
+from fractions import Fraction
+
+from .stats import VWAP_EXTRA_PLACES
+
+
+class Position:
+    """One user's position in one symbol, in ticks"""
+    __slots__ = ('quantity', 'cost', 'realized', 'bought', 'sold',
+                 'bid_orders', 'bid_quantity', 'bid_notional',
+                 'ask_orders', 'ask_quantity', 'ask_notional')
+
+    def __init__(self):
+        self.quantity = 0                   # Net quantity: bought minus sold
+        self.cost = 0                       # Cost of the open quantity, signed like it
+        self.realized = 0
+        self.bought = 0
+        self.sold = 0
+        self.bid_orders = 0
+        self.bid_quantity = 0
+        self.bid_notional = 0
+        self.ask_orders = 0
+        self.ask_quantity = 0
+        self.ask_notional = 0
+
+    def trade(self, side, price, quantity):
+        """Apply a fill; side is 1 for a buy and -1 for a sell"""
+        if side > 0:
+            self.bought += quantity
+        else:
+            self.sold += quantity
+
+        if self.quantity == 0 or (self.quantity > 0) == (side > 0):
+            # Opening or adding to a position
+            self.quantity += side * quantity
+            self.cost += side * quantity * price
+            return
+
+        # Reducing the position, at its average cost, and reversing it with any remainder
+        held = abs(self.quantity)
+        closed = min(quantity, held)
+        released = Fraction(self.cost * closed, held)
+        if released.denominator == 1:
+            released = released.numerator
+        self.realized += -side * closed * price - released
+        self.cost -= released
+        self.quantity += side * closed
+
+        if quantity > closed:
+            remainder = quantity - closed
+            self.quantity = side * remainder
+            self.cost = side * remainder * price
+
+
+class PositionLedger:
+    """The positions of every user in one symbol"""
+
+    def __init__(self, symbol, tick_size):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.last_price = None              # Of the latest trade, in ticks
+        self._positions = {}                # user id -> Position
+        self._places = Decimal(1).scaleb(tick_size.size.as_tuple().exponent - VWAP_EXTRA_PLACES)
+
+    def _position(self, user_id):
+        position = self._positions.get(user_id)
+        if position is None:
+            position = self._positions[user_id] = Position()
+        return position
+
+    def load(self, trades):
+        """Replay trades from the history, in id order"""
+        for trade in trades:
+            self.fill(trade)
+
+    def fill(self, trade):
+        """Book a trade to both of its users"""
+        self._position(trade.bid_user_id).trade(1, trade.price, trade.quantity)
+        self._position(trade.ask_user_id).trade(-1, trade.price, trade.quantity)
+        self.last_price = trade.price
+
+    def rest(self, order):
+        """An order went on the book with its remaining quantity"""
+        position = self._position(order.user_id)
+        if order.order_type == 'bid':
+            position.bid_orders += 1
+            position.bid_quantity += order.quantity
+            position.bid_notional += order.quantity * order.price
+        else:
+            position.ask_orders += 1
+            position.ask_quantity += order.quantity
+            position.ask_notional += order.quantity * order.price
+
+    def unrest(self, order, quantity, closed=False):
+        """
+        quantity of a resting order left the book, by filling, being
+        cancelled or being reduced; closed if the order is off the book now
+        """
+        position = self._position(order.user_id)
+        if order.order_type == 'bid':
+            position.bid_orders -= closed
+            position.bid_quantity -= quantity
+            position.bid_notional -= quantity * order.price
+        else:
+            position.ask_orders -= closed
+            position.ask_quantity -= quantity
+            position.ask_notional -= quantity * order.price
+
+    def get(self, user_id):
+        """A user's position in its JSON-ready form"""
+        position = self._positions.get(user_id) or Position()
+        to_price = self.tick_size.to_price
+
+        average_price = unrealized = None
+        if position.quantity:
+            average_price = self._amount(Fraction(position.cost, position.quantity))
+        if self.last_price is not None:
+            unrealized = self._amount(position.quantity * self.last_price - position.cost)
+
+        return {
+            'symbol': self.symbol,
+            'quantity': position.quantity,
+            'average_price': average_price,
+            'realized_pnl': self._amount(position.realized),
+            'unrealized_pnl': unrealized,
+            'last_price': None if self.last_price is None else to_price(self.last_price),
+            'bought': position.bought,
+            'sold': position.sold,
+            'open_bids': {
+                'orders': position.bid_orders,
+                'quantity': position.bid_quantity,
+                'notional': to_price(position.bid_notional),
+            },
+            'open_asks': {
+                'orders': position.ask_orders,
+                'quantity': position.ask_quantity,
+                'notional': to_price(position.ask_notional),
+            },
+            # The position if every resting order on one side filled
+            'max_long': position.quantity + position.bid_quantity,
+            'max_short': position.quantity - position.ask_quantity,
+        }
+
+    def _amount(self, ticks):
+        """An exact amount in ticks as a decimal string"""
+        ticks = Fraction(ticks)
+        amount = Decimal(ticks.numerator) / Decimal(ticks.denominator) * self.tick_size.size
+        return str(amount.quantize(self._places))
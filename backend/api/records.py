@@ -0,0 +1,136 @@
+"""
+Records - Compact in-memory orders and trades for the Order Book application
+
+Orders and trades are held as slotted objects rather than dicts: prices are
+integer ticks, timestamps are integer nanoseconds since the epoch (UTC) and
+usernames are interned, so every record repeats only references. They are
+converted to the JSON-ready dicts the API and the storage files use with
+to_dict, and back with from_dict, given the TickSize of their instrument.
+"""
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# Timestamps are UTC: stored and returned with a +00:00 offset, and parsed
+# with any offset they carry converted to UTC (none means UTC, as in older files)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def timestamp_ns(value):
+    """Parse an ISO timestamp into nanoseconds since the epoch; one without an offset is UTC"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // _MICROSECOND * 1000
+
+
+def now_ns():
+    """The current time in nanoseconds since the epoch"""
+    return time.time_ns()
+
+
+def format_timestamp(ns):
+    """Format nanoseconds since the epoch as an ISO timestamp in UTC, with its offset"""
+    return (_EPOCH + timedelta(microseconds=ns // 1000)).isoformat()
+
+
+class Order:
+    """A single order; price is in ticks and quantity is what remains unfilled"""
+    __slots__ = ('id', 'symbol', 'user_id', 'user', 'price', 'quantity', 'order_type',
+                 'timestamp', 'is_active')
+
+    def __init__(self, id, symbol, user_id, user, price, quantity, order_type, timestamp,
+                 is_active=True):
+        self.id = id
+        self.symbol = symbol
+        self.user_id = user_id
+        self.user = sys.intern(user) if user else user
+        self.price = price
+        self.quantity = quantity
+        self.order_type = order_type
+        self.timestamp = timestamp
+        self.is_active = is_active
+
+    @classmethod
+    def from_dict(cls, data, tick_size, symbol=None):
+        """Build an order from its stored form; records from before symbols get the given one"""
+        return cls(
+            data['id'],
+            data.get('symbol', symbol),
+            data['user_id'],
+            data['user'],
+            tick_size.nearest_ticks(data['price']),
+            int(data['quantity']),
+            data['order_type'],
+            timestamp_ns(data['timestamp']),
+            data['is_active']
+        )
+
+    def to_dict(self, tick_size):
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'user_id': self.user_id,
+            'user': self.user,
+            'price': tick_size.to_price(self.price),
+            'quantity': self.quantity,
+            'order_type': self.order_type,
+            'timestamp': format_timestamp(self.timestamp),
+            'is_active': self.is_active
+        }
+
+    def copy(self):
+        return Order(self.id, self.symbol, self.user_id, self.user, self.price, self.quantity,
+                     self.order_type, self.timestamp, self.is_active)
+
+    def update(self, changes):
+        """Apply a dict of field changes"""
+        for name, value in changes.items():
+            setattr(self, name, value)
+
+
+class Trade:
+    """A single execution between a buyer and a seller, at a price in ticks"""
+    __slots__ = ('id', 'symbol', 'price', 'quantity', 'timestamp', 'bid_user_id', 'bid_user',
+                 'ask_user_id', 'ask_user')
+
+    def __init__(self, id, symbol, price, quantity, timestamp, bid_user_id, bid_user,
+                 ask_user_id, ask_user):
+        self.id = id
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.timestamp = timestamp
+        self.bid_user_id = bid_user_id
+        self.bid_user = sys.intern(bid_user) if bid_user else bid_user
+        self.ask_user_id = ask_user_id
+        self.ask_user = sys.intern(ask_user) if ask_user else ask_user
+
+    @classmethod
+    def from_dict(cls, data, tick_size, symbol=None):
+        """Build a trade from its stored form; records from before symbols get the given one"""
+        return cls(
+            data['id'],
+            data.get('symbol', symbol),
+            tick_size.nearest_ticks(data['price']),
+            int(data['quantity']),
+            timestamp_ns(data['timestamp']),
+            data['bid_user_id'],
+            data['bid_user'],
+            data['ask_user_id'],
+            data['ask_user']
+        )
+
+    def to_dict(self, tick_size):
+        return {
+            'id': self.id,
+            'symbol': self.symbol,
+            'price': tick_size.to_price(self.price),
+            'quantity': self.quantity,
+            'timestamp': format_timestamp(self.timestamp),
+            'bid_user_id': self.bid_user_id,
+            'bid_user': self.bid_user,
+            'ask_user_id': self.ask_user_id,
+            'ask_user': self.ask_user
+        }
@@ -0,0 +1,241 @@
+"""
+Segments - Immutable archive files of orders or trades for the Order Book application
+
+A segment holds a run of archived records of one collection in id order, as
+fixed-width binary rows, so record i is found by offset alone and read
+straight out of a memory map. A segment file is:
+- a header: magic, collection, record count and where the sections below start
+- the rows, starting at RECORDS_OFFSET
+- a user index: (user id, row) pairs sorted by user id, also fixed width
+- JSON metadata: the symbol, the tick size prices are counted in and the
+  usernames that rows refer to by position
+
+Only every SPARSE_EVERY-th row's id (and timestamp) is kept in memory. A
+lookup narrows down to one block of rows with it and binary searches the
+block in the map, so an open segment costs a few pages however long it is.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+
+from .records import Order, Trade
+from .ticks import TickSize
+
+MAGIC = b'OBSEG001'
+HEADER = struct.Struct('<8sB7xQQQQQ')   # magic, kind, count, users offset, users count,
+                                        # metadata offset, metadata length
+RECORDS_OFFSET = 64
+
+SPARSE_EVERY = 64
+
+KINDS = ('orders', 'trades')
+ORDER_TYPES = ('bid', 'ask')
+
+# id, user id, username ref, price (ticks), quantity, timestamp (ns), order type, is active
+ORDER_ROW = struct.Struct('<qqIqqqBB')
+# id, price (ticks), quantity, timestamp (ns), bid user id, bid username ref,
+# ask user id, ask username ref
+TRADE_ROW = struct.Struct('<qqqqqIqI')
+ROWS = {'orders': ORDER_ROW, 'trades': TRADE_ROW}
+# Offset of the timestamp within a row
+TIMESTAMP_OFFSETS = {'orders': 36, 'trades': 24}
+
+USER_ENTRY = struct.Struct('<qQ')       # user id, row
+INT64 = struct.Struct('<q')
+
+
+def write_segment(path, kind, records, symbol, tick_size):
+    """
+    Write records of one collection, in id order, to a new segment file at
+    path. The file is synced and then renamed into place, so a segment is
+    either complete or absent.
+    """
+    row = ROWS[kind]
+    usernames = {}
+    user_entries = []
+
+    def ref(username):
+        return usernames.setdefault(username, len(usernames))
+
+    body = bytearray(row.size * len(records))
+    for position, record in enumerate(records):
+        offset = position * row.size
+        if kind == 'orders':
+            row.pack_into(body, offset, record.id, record.user_id, ref(record.user),
+                          record.price, record.quantity, record.timestamp,
+                          ORDER_TYPES.index(record.order_type), record.is_active)
+            user_entries.append((record.user_id, position))
+        else:
+            row.pack_into(body, offset, record.id, record.price, record.quantity,
+                          record.timestamp, record.bid_user_id, ref(record.bid_user),
+                          record.ask_user_id, ref(record.ask_user))
+            user_entries.append((record.bid_user_id, position))
+            if record.ask_user_id != record.bid_user_id:
+                user_entries.append((record.ask_user_id, position))
+
+    user_entries.sort()
+    users = bytearray(USER_ENTRY.size * len(user_entries))
+    for index, entry in enumerate(user_entries):
+        USER_ENTRY.pack_into(users, index * USER_ENTRY.size, *entry)
+
+    metadata = json.dumps({
+        'symbol': symbol,
+        'tick_size': str(tick_size.size),
+        'usernames': list(usernames),
+    }).encode()
+
+    users_offset = RECORDS_OFFSET + len(body)
+    metadata_offset = users_offset + len(users)
+    header = HEADER.pack(MAGIC, KINDS.index(kind), len(records), users_offset,
+                         len(user_entries), metadata_offset, len(metadata))
+
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(RECORDS_OFFSET, b'\0'))
+        f.write(body)
+        f.write(users)
+        f.write(metadata)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _Column:
+    """A sequence view of one int64 field of fixed-width entries, for bisect"""
+    __slots__ = ('_buffer', '_start', '_stride', '_count')
+
+    def __init__(self, buffer, start, stride, count):
+        self._buffer = buffer
+        self._start = start
+        self._stride = stride
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return INT64.unpack_from(self._buffer, self._start + index * self._stride)[0]
+
+
+class Segment:
+    """A read-only, memory-mapped archive segment"""
+
+    def __init__(self, path, tick_size):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, kind, self.count, users_offset, users_count,
+         metadata_offset, metadata_length) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'Not an archive segment: {path}')
+        self.kind = KINDS[kind]
+        self._row = ROWS[self.kind]
+
+        metadata = json.loads(self._map[metadata_offset:metadata_offset + metadata_length])
+        self.symbol = metadata['symbol']
+        self._usernames = [sys.intern(username) for username in metadata['usernames']]
+        # Prices are rescaled if the instrument's tick size changed since
+        stored_tick_size = TickSize(metadata['tick_size'])
+        self._stored_tick_size = None if stored_tick_size.size == tick_size.size else stored_tick_size
+        self.tick_size = tick_size
+
+        self._ids = _Column(self._map, RECORDS_OFFSET, self._row.size, self.count)
+        self._timestamps = _Column(self._map, RECORDS_OFFSET + TIMESTAMP_OFFSETS[self.kind],
+                                   self._row.size, self.count)
+        self._user_ids = _Column(self._map, users_offset, USER_ENTRY.size, users_count)
+        self._users_offset = users_offset
+
+        # The sparse index: the id and timestamp of every SPARSE_EVERY-th row
+        self._sparse_ids = [self._ids[i] for i in range(0, self.count, SPARSE_EVERY)]
+        self._sparse_timestamps = [
+            self._timestamps[i] for i in range(0, self.count, SPARSE_EVERY)
+        ]
+        self.first_id = self._ids[0] if self.count else 0
+        self.last_id = self._ids[self.count - 1] if self.count else 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, position):
+        """Decode the record at a row position"""
+        fields = self._row.unpack_from(self._map, RECORDS_OFFSET + position * self._row.size)
+        if self.kind == 'orders':
+            order_id, user_id, user, price, quantity, timestamp, order_type, is_active = fields
+            return Order(order_id, self.symbol, user_id, self._usernames[user],
+                         self._price(price), quantity, ORDER_TYPES[order_type], timestamp,
+                         bool(is_active))
+        (trade_id, price, quantity, timestamp, bid_user_id, bid_user, ask_user_id,
+         ask_user) = fields
+        return Trade(trade_id, self.symbol, self._price(price), quantity, timestamp,
+                     bid_user_id, self._usernames[bid_user], ask_user_id,
+                     self._usernames[ask_user])
+
+    def _price(self, ticks):
+        if self._stored_tick_size is None:
+            return ticks
+        return self.tick_size.nearest_ticks(self._stored_tick_size.to_price(ticks))
+
+    def records(self, start=0, stop=None):
+        """Iterate over the records at row positions start to stop"""
+        stop = self.count if stop is None else min(stop, self.count)
+        for position in range(start, stop):
+            yield self.record(position)
+
+    def timestamps(self, start=0):
+        """Iterate over the timestamps of the rows from position start, without decoding them"""
+        timestamps = self._timestamps
+        for position in range(start, self.count):
+            yield timestamps[position]
+
+    def bisect_id(self, record_id, right=False):
+        """Row position of an id, as bisect_left (or bisect_right) would find it"""
+        return self._bisect(self._ids, self._sparse_ids, record_id, right)
+
+    def bisect_timestamp(self, timestamp, right=False):
+        """Row position of a timestamp; only meaningful for trades, which are in time order"""
+        return self._bisect(self._timestamps, self._sparse_timestamps, timestamp, right)
+
+    def _bisect(self, column, sparse, value, right):
+        search = bisect.bisect_right if right else bisect.bisect_left
+        # Samples before the position: it lies after the last of them and at
+        # or before the next one, so only that block of rows is searched
+        block = search(sparse, value)
+        if block == 0:
+            return 0
+        lo = (block - 1) * SPARSE_EVERY + 1
+        hi = min(self.count, block * SPARSE_EVERY)
+        return search(column, value, lo, hi)
+
+    def get(self, record_id):
+        """The record with an id, or None if it is not in the segment"""
+        if not self.first_id <= record_id <= self.last_id:
+            return None
+        position = self.bisect_id(record_id)
+        if position < self.count and self._ids[position] == record_id:
+            return self.record(position)
+        return None
+
+    def __contains__(self, record_id):
+        if not self.first_id <= record_id <= self.last_id:
+            return False
+        position = self.bisect_id(record_id)
+        return position < self.count and self._ids[position] == record_id
+
+    def user_records(self, user_id):
+        """The records of one user (as either side, for trades), in id order"""
+        entries = self._user_ids
+        position = bisect.bisect_left(entries, user_id)
+        records = []
+        while position < len(entries) and entries[position] == user_id:
+            _, row = USER_ENTRY.unpack_from(self._map,
+                                            self._users_offset + position * USER_ENTRY.size)
+            records.append(self.record(row))
+            position += 1
+        return records
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,215 @@
+"""
+Sequencer - Single-writer order entry for the Order Book application
+
+When several web worker processes serve the API, none of them may own the
+order books: each would assign its own ids and match against its own copy of
+the book. In sequencer mode one process (``manage.py run_sequencer``) owns
+every book and the storage, and web workers forward order-entry commands to
+it over a Unix socket. Workers read everything else from the storage the
+sequencer publishes, through follower FileDBs.
+
+The protocol is one JSON object per line in each direction:
+    {"command": "submit_order", "symbol": "RELIANCE", "args": {...}}
+    {"ok": true, "result": ...}  or  {"ok": false, "error": "..."}
+Orders and trades travel in their dict form and are turned back into
+records on the web worker side.
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from .records import Order, Trade
+
+
+class SequencerError(Exception):
+    """A command was rejected by the sequencer or could not be delivered"""
+
+
+class SequencerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves order-entry commands for every instrument of a market.
+    Each connection gets its own thread; commands on the same symbol are
+    serialized by that symbol's matching engine lock.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, market):
+        self.market = market
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, SequencerRequestHandler)
+
+    def execute(self, command, symbol, args):
+        """Run one command against the market"""
+        if command == 'create_user':
+            return self.market.db.create_user(**args)
+        if command == 'set_password':
+            return self.market.db.set_password(**args)
+
+        instrument = self.market.get(symbol)
+        if instrument is None:
+            raise SequencerError(f'Unknown symbol: {symbol}')
+
+        engine = instrument.engine
+        tick_size = instrument.tick_size
+        if command == 'submit_order':
+            order, trades = engine.submit_order(**args)
+            return _encode_result({'order': order, 'trades': trades}, tick_size)
+        if command == 'cancel_order':
+            order = engine.cancel_order(**args)
+            return None if order is None else order.to_dict(tick_size)
+        if command == 'amend_order':
+            order, trades = engine.amend_order(**args)
+            return _encode_result({'order': order, 'trades': trades}, tick_size)
+        if command == 'submit_batch':
+            return [_encode_result(result, tick_size) for result in engine.submit_batch(**args)]
+        if command == 'get_order_book':
+            book = engine.get_order_book()
+            return {
+                side: [order.to_dict(tick_size) for order in orders]
+                for side, orders in book.items()
+            }
+        if command == 'get_depth':
+            return engine.get_depth(**args)
+        if command == 'get_position':
+            return engine.get_position(**args)
+
+        raise SequencerError(f'Unknown command: {command}')
+
+
+class SequencerRequestHandler(socketserver.StreamRequestHandler):
+    """Reads commands from one web worker connection and writes back the results"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.execute(request['command'], request.get('symbol'),
+                                             request.get('args', {}))
+                response = {'ok': True, 'result': result}
+            except Exception as exc:
+                response = {'ok': False, 'error': str(exc)}
+
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class SequencerClient:
+    """
+    Forwards commands to the sequencer, over one connection per thread.
+    A call that gets no answer within timeout seconds fails with
+    SequencerError and drops its connection; the sequencer may still have
+    carried the command out.
+    """
+
+    def __init__(self, socket_path, timeout=10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def call(self, command, symbol=None, **args):
+        request = json.dumps({'command': command, 'symbol': symbol, 'args': args}).encode() + b'\n'
+
+        try:
+            reader = self._connection()
+            self._local.sock.sendall(request)
+            line = reader.readline()
+        except OSError as exc:
+            self._disconnect()
+            raise SequencerError(f'Sequencer unavailable: {exc}') from exc
+
+        if not line:
+            self._disconnect()
+            raise SequencerError('Sequencer closed the connection')
+
+        response = json.loads(line)
+        if not response['ok']:
+            raise SequencerError(response['error'])
+        return response['result']
+
+    def _connection(self):
+        if getattr(self._local, 'sock', None) is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+            self._local.reader = sock.makefile('rb')
+        return self._local.reader
+
+    def _disconnect(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.reader.close()
+            sock.close()
+        self._local.sock = None
+
+
+class RemoteEngine:
+    """Stands in for a MatchingEngine in a web worker and forwards to the sequencer"""
+
+    def __init__(self, client, symbol, tick_size):
+        self.client = client
+        self.symbol = symbol
+        self.tick_size = tick_size
+
+    def submit_order(self, user_id, username, price, quantity, order_type):
+        result = _decode_result(self.client.call(
+            'submit_order', self.symbol,
+            user_id=user_id, username=username, price=price,
+            quantity=quantity, order_type=order_type
+        ), self.tick_size)
+        return result['order'], result['trades']
+
+    def cancel_order(self, user_id, order_id):
+        order = self.client.call('cancel_order', self.symbol, user_id=user_id, order_id=order_id)
+        return None if order is None else Order.from_dict(order, self.tick_size)
+
+    def amend_order(self, user_id, order_id, price=None, quantity=None):
+        result = _decode_result(self.client.call(
+            'amend_order', self.symbol, user_id=user_id, order_id=order_id,
+            price=price, quantity=quantity
+        ), self.tick_size)
+        return result['order'], result['trades']
+
+    def submit_batch(self, user_id, username, commands):
+        results = self.client.call('submit_batch', self.symbol, user_id=user_id,
+                                   username=username, commands=commands)
+        return [_decode_result(result, self.tick_size) for result in results]
+
+    def get_order_book(self):
+        book = self.client.call('get_order_book', self.symbol)
+        return {
+            side: [Order.from_dict(order, self.tick_size) for order in orders]
+            for side, orders in book.items()
+        }
+
+    def get_depth(self, max_levels=None):
+        return self.client.call('get_depth', self.symbol, max_levels=max_levels)
+
+    def get_position(self, user_id):
+        return self.client.call('get_position', self.symbol, user_id=user_id)
+
+
+def _encode_result(result, tick_size):
+    """Turn the records in an engine result into dicts for the wire"""
+    encoded = dict(result)
+    if encoded.get('order') is not None:
+        encoded['order'] = encoded['order'].to_dict(tick_size)
+    if 'trades' in encoded:
+        encoded['trades'] = [trade.to_dict(tick_size) for trade in encoded['trades']]
+    return encoded
+
+
+def _decode_result(result, tick_size):
+    """Turn the dicts in an engine result from the wire back into records"""
+    if result.get('order') is not None:
+        result['order'] = Order.from_dict(result['order'], tick_size)
+    if 'trades' in result:
+        result['trades'] = [Trade.from_dict(trade, tick_size) for trade in result['trades']]
+    return result
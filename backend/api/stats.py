@@ -0,0 +1,268 @@
+"""
+Stats - Market statistics over the trade tape for the Order Book application
+
+A TradeTape keeps a columnar copy of a symbol's trades in NumPy arrays:
+timestamps, prices in ticks, quantities and running totals of quantity and
+price times quantity. It only appends the trades executed since it was last
+read (unless storage rebuilt its state, which may reuse trade ids, when the
+tape is read again), so statistics never re-scan the tape:
+- VWAP and volume over any window are differences of running totals
+- OHLCV bars are cut with NumPy reductions; completed bars are cached per
+  interval and only the bar still open is recomputed
+
+The tape is kept in timestamp order, so windows are found by binary search.
+New trades are timestamped in id order, so they are simply appended; trades
+stored out of time order (by older versions) are sorted into place.
+"""
+import bisect
+import threading
+from decimal import Decimal
+from operator import itemgetter
+
+import numpy as np
+
+from .records import format_timestamp
+
+# Bar intervals offered, in nanoseconds
+INTERVALS = {
+    '1m': 60 * 10**9,
+    '5m': 5 * 60 * 10**9,
+    '15m': 15 * 60 * 10**9,
+    '1h': 60 * 60 * 10**9,
+    '4h': 4 * 60 * 60 * 10**9,
+    '1d': 24 * 60 * 60 * 10**9,
+}
+
+# VWAPs are given to this many more decimal places than the tick size
+VWAP_EXTRA_PLACES = 2
+
+_COLUMNS = ('timestamps', 'prices', 'quantities')
+
+
+class TradeTape:
+    """Columnar, incrementally updated trade history of one symbol"""
+
+    def __init__(self, db, capacity=1024):
+        self.db = db
+        self.tick_size = db.tick_size
+        self.lock = threading.Lock()
+        self.count = 0
+        self._last_id = 0
+        self._generation = db.generation    # Storage state the tape was read from
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.prices = np.empty(capacity, dtype=np.int64)         # in ticks
+        self.quantities = np.empty(capacity, dtype=np.int64)
+        # Running totals before each trade: cumulative[i] covers trades [0, i)
+        self._cumulative_quantity = np.zeros(capacity + 1, dtype=np.int64)
+        self._cumulative_notional = np.zeros(capacity + 1, dtype=np.int64)
+        self._bars = {}                     # interval -> _BarCache
+
+    def _refresh(self):
+        """
+        Append the trades executed since the tape was last read. If storage
+        rebuilt its state meanwhile, trade ids may have been reused, so the
+        tape is read again from the start.
+        """
+        while True:
+            generation = self.db.generation
+            if generation != self._generation:
+                self._clear()
+                self._generation = generation
+            self._append()
+            if self.db.generation == generation:
+                return
+
+    def _clear(self):
+        """Drop every trade from the tape"""
+        self.count = 0
+        self._last_id = 0
+        self._bars = {}
+
+    def _append(self):
+        """Append the trades after the last one on the tape"""
+        appended_from = self.count
+        for chunk in self.db.iter_chunks('trades', since_id=self._last_id):
+            size = len(chunk)
+            self._reserve(self.count + size)
+            start, stop = self.count, self.count + size
+
+            quantities = np.fromiter((trade.quantity for trade in chunk), np.int64, size)
+            prices = np.fromiter((trade.price for trade in chunk), np.int64, size)
+            self.timestamps[start:stop] = np.fromiter(
+                (trade.timestamp for trade in chunk), np.int64, size
+            )
+            self.prices[start:stop] = prices
+            self.quantities[start:stop] = quantities
+            self._cumulative_quantity[start + 1:stop + 1] = (
+                self._cumulative_quantity[start] + np.cumsum(quantities)
+            )
+            self._cumulative_notional[start + 1:stop + 1] = (
+                self._cumulative_notional[start] + np.cumsum(prices * quantities)
+            )
+
+            self.count = stop
+            self._last_id = chunk[-1].id
+
+        if appended_from < self.count:
+            self._sort(appended_from)
+
+    def _sort(self, appended_from):
+        """Sort trades appended from an index into timestamp order, if they are not"""
+        timestamps = self.timestamps[:self.count]
+        if appended_from:
+            lo = int(np.searchsorted(timestamps[:appended_from], timestamps[appended_from:].min(),
+                                     'right'))
+        else:
+            lo = 0
+        if lo == appended_from and np.all(timestamps[lo + 1:] >= timestamps[lo:-1]):
+            return
+
+        order = lo + np.argsort(timestamps[lo:], kind='stable')
+        for name in _COLUMNS:
+            column = getattr(self, name)
+            column[lo:self.count] = column[order]
+        quantities = self.quantities[lo:self.count]
+        self._cumulative_quantity[lo + 1:self.count + 1] = (
+            self._cumulative_quantity[lo] + np.cumsum(quantities)
+        )
+        self._cumulative_notional[lo + 1:self.count + 1] = (
+            self._cumulative_notional[lo] + np.cumsum(self.prices[lo:self.count] * quantities)
+        )
+        # Bars cut from the trades that moved are stale
+        self._bars = {}
+
+    def _reserve(self, size):
+        """Grow the columns, doubling their capacity, to hold size trades"""
+        capacity = len(self.timestamps)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in _COLUMNS:
+            column = np.empty(capacity, dtype=np.int64)
+            column[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, column)
+        for name in ('_cumulative_quantity', '_cumulative_notional'):
+            column = np.zeros(capacity + 1, dtype=np.int64)
+            column[:self.count + 1] = getattr(self, name)[:self.count + 1]
+            setattr(self, name, column)
+
+    def _window(self, start=None, end=None):
+        """Index range of the trades with start <= timestamp <= end (nanoseconds)"""
+        timestamps = self.timestamps[:self.count]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, 'left'))
+        hi = self.count if end is None else int(np.searchsorted(timestamps, end, 'right'))
+        return lo, max(lo, hi)
+
+    def summary(self, start=None, end=None):
+        """Trade count, volume, VWAP and open/high/low/close of the trades in a window"""
+        with self.lock:
+            self._refresh()
+            lo, hi = self._window(start, end)
+            if lo == hi:
+                return {
+                    'trades': 0, 'volume': 0, 'vwap': None,
+                    'open': None, 'high': None, 'low': None, 'close': None,
+                }
+
+            volume = int(self._cumulative_quantity[hi] - self._cumulative_quantity[lo])
+            notional = int(self._cumulative_notional[hi] - self._cumulative_notional[lo])
+            prices = self.prices[lo:hi]
+            return {
+                'trades': hi - lo,
+                'volume': volume,
+                'vwap': self._vwap(notional, volume),
+                'open': self.tick_size.to_price(int(prices[0])),
+                'high': self.tick_size.to_price(int(prices.max())),
+                'low': self.tick_size.to_price(int(prices.min())),
+                'close': self.tick_size.to_price(int(prices[-1])),
+            }
+
+    def bars(self, interval, start=None, end=None, limit=None):
+        """
+        OHLCV bars of the given interval (a key of INTERVALS) aligned to the
+        epoch, oldest first. Only bars with trades are returned. With limit,
+        the latest limit bars starting in the window are returned.
+        """
+        with self.lock:
+            self._refresh()
+            cache = self._bars.get(interval)
+            if cache is None:
+                cache = self._bars[interval] = _BarCache(INTERVALS[interval])
+            open_bar = cache.update(self)
+
+            completed = cache.completed
+            first, last = 0, len(completed)
+            if start is not None:
+                first = bisect.bisect_left(completed, start, key=itemgetter(0))
+            if end is not None:
+                last = bisect.bisect_right(completed, end, key=itemgetter(0))
+            rows = []
+            if open_bar is not None and (start is None or open_bar[0] >= start) and (
+                    end is None or open_bar[0] <= end):
+                rows.append(open_bar)
+            if limit is not None:
+                first = max(first, last - (limit - len(rows)))
+            rows[:0] = completed[first:last]
+            return [self._format_bar(row) for row in rows]
+
+    def _format_bar(self, row):
+        bar_start, open_, high, low, close, volume, trades, notional = row
+        return {
+            'start': format_timestamp(bar_start),
+            'open': self.tick_size.to_price(open_),
+            'high': self.tick_size.to_price(high),
+            'low': self.tick_size.to_price(low),
+            'close': self.tick_size.to_price(close),
+            'volume': volume,
+            'trades': trades,
+            'vwap': self._vwap(notional, volume),
+        }
+
+    def _vwap(self, notional, volume):
+        """Volume-weighted average price from a notional in ticks times quantity"""
+        places = Decimal(1).scaleb(self.tick_size.size.as_tuple().exponent - VWAP_EXTRA_PLACES)
+        return str((Decimal(notional) * self.tick_size.size / volume).quantize(places))
+
+
+class _BarCache:
+    """The completed bars of one interval, and where the open bar begins on the tape"""
+    __slots__ = ('interval', 'completed', 'open_index')
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.completed = []                 # (start, open, high, low, close, volume, trades, notional)
+        self.open_index = 0                 # Tape index of the first trade of the open bar
+
+    def update(self, tape):
+        """
+        Cut the trades from the open bar onwards into bars. Every bar but the
+        last is complete, since later trades are always in later bars, so it
+        is cached; the last is recomputed on every update.
+        Returns the open bar, or None if there are no trades.
+        """
+        lo, hi = self.open_index, tape.count
+        if lo == hi:
+            return None
+
+        timestamps = tape.timestamps[lo:hi]
+        prices = tape.prices[lo:hi]
+        quantities = tape.quantities[lo:hi]
+        bar_ids = timestamps // self.interval
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bar_ids)) + 1))
+        ends = np.append(starts[1:], hi - lo)
+
+        rows = list(zip(
+            (bar_ids[starts] * self.interval).tolist(),
+            prices[starts].tolist(),
+            np.maximum.reduceat(prices, starts).tolist(),
+            np.minimum.reduceat(prices, starts).tolist(),
+            prices[ends - 1].tolist(),
+            np.add.reduceat(quantities, starts).tolist(),
+            (ends - starts).tolist(),
+            np.add.reduceat(prices * quantities, starts).tolist(),
+        ))
+
+        self.completed.extend(rows[:-1])
+        self.open_index = lo + int(starts[-1])
+        return rows[-1]
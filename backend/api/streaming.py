@@ -0,0 +1,186 @@
+"""
+Streaming - Real-time market data over WebSockets for the Order Book application
+
+Clients connect to ``/ws/market/?token=<jwt>&symbol=<SYMBOL>`` (the default
+symbol if none is given) and receive, for that symbol:
+- a ``snapshot`` of the aggregated book when they subscribe
+- ``depth`` deltas with the new state of every price level that changed
+- ``trade`` messages for every execution
+- ``order`` messages for changes to their own orders
+
+Every book message carries the engine sequence number, so a client can drop
+deltas that are already reflected in its snapshot.
+"""
+import asyncio
+import json
+import threading
+from urllib.parse import parse_qs
+
+from .jwt_utils import get_user_from_token
+from .views import market
+
+MARKET_DATA_PATH = '/ws/market/'
+
+# Messages buffered per client before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def _encode(message):
+    return json.dumps(message, separators=(',', ':'))
+
+
+class Subscriber:
+    """A single WebSocket client and its outgoing message queue"""
+    __slots__ = ('user_id', 'loop', 'queue')
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, text):
+        """Queue an encoded message; a client that has fallen too far behind is cut off"""
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class MarketDataHub:
+    """
+    Fans out engine execution events to WebSocket subscribers.
+    Each message is encoded once and the same text is queued for every
+    subscriber, so the encoding cost of an event does not grow with the
+    number of subscribers.
+    """
+
+    def __init__(self, symbol, engine):
+        self.symbol = symbol
+        self.engine = engine
+        self.lock = threading.Lock()        # Guards the subscriber set
+        self.subscribers = set()
+
+        engine.add_listener(self.publish)
+
+    def subscribe(self, user_id, loop):
+        """
+        Register a subscriber and return it with its initial book snapshot.
+
+        The engine lock is not taken, so a subscriber never waits for order
+        entry. The engine publishes a snapshot before the delta of the same
+        sequence, so taking the snapshot after registering misses no delta;
+        the deltas queued meanwhile that it already reflects carry a sequence
+        no later than its own, and clients drop them.
+        """
+        subscriber = Subscriber(user_id, loop)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        book = self.engine.snapshot
+        snapshot = dict(
+            self.engine.tick_size.format_depth(book.depth()),
+            type='snapshot',
+            symbol=self.symbol,
+            sequence=book.sequence
+        )
+        return subscriber, _encode(snapshot)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event):
+        """Engine listener: encode the event once and hand it to each subscriber's loop"""
+        with self.lock:
+            if not self.subscribers:
+                return
+            loops = {subscriber.loop for subscriber in self.subscribers}
+
+        tick_size = self.engine.tick_size
+        header = {'symbol': self.symbol, 'sequence': event['sequence']}
+        broadcast = [_encode(dict(tick_size.format_depth(event['depth']), type='depth', **header))]
+        broadcast.extend(
+            _encode(dict(header, type='trade', trade=trade.to_dict(tick_size)))
+            for trade in event['trades']
+        )
+        private = {}
+        for order in event['orders']:
+            private.setdefault(order.user_id, []).append(
+                _encode(dict(header, type='order', order=order.to_dict(tick_size)))
+            )
+
+        for loop in loops:
+            loop.call_soon_threadsafe(self._deliver, loop, broadcast, private)
+
+    def _deliver(self, loop, broadcast, private):
+        """Runs on a subscriber event loop and queues the messages for its clients"""
+        with self.lock:
+            subscribers = [subscriber for subscriber in self.subscribers if subscriber.loop is loop]
+
+        for subscriber in subscribers:
+            for text in broadcast:
+                subscriber.deliver(text)
+            for text in private.get(subscriber.user_id, ()):
+                subscriber.deliver(text)
+
+
+# One hub per symbol, so subscribers only receive the books they asked for.
+# In sequencer mode the engines live in the sequencer process, so there is no feed.
+hubs = {} if market.sequencer is not None else {
+    symbol: MarketDataHub(symbol, instrument.engine)
+    for symbol, instrument in market.instruments.items()
+}
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI application for WebSocket connections"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    if scope['path'] != MARKET_DATA_PATH:
+        await send({'type': 'websocket.close', 'code': 4004})
+        return
+
+    # Browsers cannot set headers on a WebSocket, so the JWT comes in the query string
+    query = parse_qs(scope.get('query_string', b'').decode())
+    user_data = get_user_from_token(query.get('token', [''])[0])
+    if not user_data:
+        await send({'type': 'websocket.close', 'code': 4001})
+        return
+
+    hub = hubs.get(query.get('symbol', [market.default_symbol])[0])
+    if hub is None:
+        await send({'type': 'websocket.close', 'code': 4004})
+        return
+
+    await send({'type': 'websocket.accept'})
+    subscriber, snapshot = hub.subscribe(user_data['id'], asyncio.get_running_loop())
+
+    async def forward_messages():
+        await send({'type': 'websocket.send', 'text': snapshot})
+        while True:
+            text = await subscriber.queue.get()
+            if text is None:
+                # Fell too far behind; the client reconnects and resubscribes
+                await send({'type': 'websocket.close', 'code': 1013})
+                return
+            await send({'type': 'websocket.send', 'text': text})
+
+    async def wait_for_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+
+    tasks = [
+        asyncio.ensure_future(forward_messages()),
+        asyncio.ensure_future(wait_for_disconnect()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,80 @@
+import random
+import tempfile
+
+from django.test import SimpleTestCase
+
+from api.filedb import FileDB
+from api.ticks import TickSize
+
+
+class ArchivePagingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.db = FileDB(self.data_dir.name, symbol='TEST', tick_size=TickSize('0.01'),
+                         storage='journal')
+        self.trades = [self.db.create_trade(100 + n % 7, 1 + n % 3, 1, 'alice', 2, 'bob')
+                       for n in range(150)]
+        # Two archive segments, with the newest trades left in the hot tier
+        for index in (40, 90):
+            self.db.archive_history(self.trades[index].timestamp)
+
+    def tearDown(self):
+        self.db.close()
+        self.data_dir.cleanup()
+
+    def expected(self, since_id=None, before_id=None, start=None, end=None, limit=100):
+        """The page get_trades_page should return, by filtering every trade"""
+        matching = [
+            trade for trade in self.trades
+            if (since_id is None or trade.id > since_id)
+            and (before_id is None or trade.id < before_id)
+            and (start is None or trade.timestamp >= start)
+            and (end is None or trade.timestamp <= end)
+        ]
+        if since_id is None:
+            matching.reverse()
+        return [trade.id for trade in matching[:limit]], len(matching) > limit
+
+    def page(self, **params):
+        trades, more = self.db.get_trades_page(**params)
+        return [trade.id for trade in trades], more
+
+    def test_pages_match_filtering_every_trade(self):
+        before = self.trades[90].timestamp
+        self.assertEqual(len(self.db.archive.segments['trades']), 2)
+        self.assertEqual(self.db.archive.count('trades'),
+                         sum(trade.timestamp < before for trade in self.trades))
+        self.assertEqual([trade.id for trade in self.db.get_trades()],
+                         [trade.id for trade in self.trades])
+
+        rnd = random.Random(4)
+        ids = [trade.id for trade in self.trades]
+        timestamps = [trade.timestamp for trade in self.trades]
+        for _ in range(300):
+            params = {'limit': rnd.randint(1, 60)}
+            if rnd.random() < 0.5:
+                params['since_id'] = rnd.choice([0] + ids)
+            if rnd.random() < 0.5:
+                params['before_id'] = rnd.choice(ids + [ids[-1] + 1])
+            if rnd.random() < 0.5:
+                params['start'] = rnd.choice(timestamps)
+            if rnd.random() < 0.5:
+                params['end'] = rnd.choice(timestamps)
+            self.assertEqual(self.page(**params), self.expected(**params), params)
+
+    def test_cursors_walk_across_tiers(self):
+        for limit in (1, 7, 40, 200):
+            forward, since_id, more = [], 0, True
+            while more:
+                page, more = self.page(since_id=since_id, limit=limit)
+                forward.extend(page)
+                since_id = page[-1]
+            self.assertEqual(forward, [trade.id for trade in self.trades])
+
+            backward, before_id, more = [], None, True
+            while more:
+                page, more = self.page(before_id=before_id, limit=limit)
+                backward.extend(page)
+                before_id = page[-1]
+            self.assertEqual(backward, [trade.id for trade in reversed(self.trades)])
@@ -0,0 +1,36 @@
+from django.test import SimpleTestCase
+
+from api.cache import ResponseCache
+
+
+class ResponseCacheTests(SimpleTestCase):
+
+    def test_built_once_per_etag(self):
+        cache = ResponseCache()
+        builds = []
+
+        def build():
+            builds.append(1)
+            return b'body'
+
+        self.assertEqual(cache.get('key', '"1"', build), b'body')
+        self.assertEqual(cache.get('key', '"1"', build), b'body')
+        self.assertEqual(len(builds), 1)
+        cache.get('key', '"2"', build)
+        self.assertEqual(len(builds), 2)
+        self.assertIsNone(cache.lookup('key', '"1"'))
+
+    def test_bounded_by_bytes(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.get('a', '"1"', lambda: b'12345')
+        cache.get('b', '"1"', lambda: b'12345')
+        cache.get('c', '"1"', lambda: b'123')
+        # The least recently used body goes to make room
+        self.assertIsNone(cache.lookup('a', '"1"'))
+        self.assertEqual(cache.lookup('b', '"1"'), b'12345')
+        self.assertEqual(cache.lookup('c', '"1"'), b'123')
+
+        # A body larger than the whole cache is returned but not kept
+        self.assertEqual(cache.get('d', '"1"', lambda: b'x' * 11), b'x' * 11)
+        self.assertIsNone(cache.lookup('d', '"1"'))
+        self.assertEqual(cache.lookup('b', '"1"'), b'12345')
@@ -0,0 +1,59 @@
+import random
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from api.filedb import FileDB
+from api.matching import MatchingEngine
+from api.ticks import TickSize
+
+TICK_SIZE = TickSize('0.01')
+
+
+class GroupCommitRestartTests(SimpleTestCase):
+
+    @staticmethod
+    def state(db, engine):
+        book = engine.get_order_book()
+        return (
+            [order.to_dict(TICK_SIZE) for order in db.get_orders()],
+            [trade.to_dict(TICK_SIZE) for trade in db.get_trades()],
+            {side: [(order.id, order.quantity) for order in orders] for side, orders in book.items()},
+            [engine.get_position(user_id) for user_id in range(1, 5)],
+        )
+
+    def check_restart(self, storage):
+        with tempfile.TemporaryDirectory() as data_dir:
+            options = dict(symbol='TEST', tick_size=TICK_SIZE, storage=storage, snapshot_interval=50)
+            db = FileDB(data_dir, group_commit=True, **options)
+            engine = MatchingEngine(db, 'TEST')
+
+            # Users trade at once, so their changes share batches
+            def trade(user_id):
+                rnd = random.Random(user_id)
+                for _ in range(60):
+                    order, _ = engine.submit_order(user_id, f'user{user_id}', rnd.randint(98, 102),
+                                                   rnd.randint(1, 5), rnd.choice(['bid', 'ask']))
+                    if order.is_active and rnd.random() < 0.3:
+                        engine.cancel_order(user_id, order.id)
+
+            threads = [threading.Thread(target=trade, args=(user_id,)) for user_id in range(1, 5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            written = self.state(db, engine)
+            db.close()
+
+            db = FileDB(data_dir, **options)
+            self.assertEqual(self.state(db, MatchingEngine(db, 'TEST')), written)
+            self.assertEqual(len(written[0]), 240)
+            self.assertTrue(written[1])
+            db.close()
+
+    def test_json_restart(self):
+        self.check_restart('json')
+
+    def test_journal_restart(self):
+        self.check_restart('journal')
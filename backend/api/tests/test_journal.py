@@ -0,0 +1,79 @@
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.fsutil import fsync_dir
+from api.journal import Journal
+
+
+class FollowerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.writer = Journal(self.data_dir.name)
+        self.writer.recover()
+        self.follower = Journal(self.data_dir.name, follower=True)
+        _, self.seen = self.follower.recover()
+
+    def tearDown(self):
+        self.writer.close()
+        self.data_dir.cleanup()
+
+    def append(self, count, tag='a'):
+        self.writer.append([('trade', {'tag': tag, 'n': n}) for n in range(count)])
+
+    def follow(self):
+        """
+        Read as FileDB does, recovering from the snapshot whenever read_new
+        gives up; returns the records read since the snapshot
+        """
+        records = self.follower.read_new()
+        if records is None:
+            _, self.seen = self.follower.recover()
+        else:
+            self.seen.extend(records)
+        return self.seen
+
+    def test_reads_appended_records(self):
+        self.append(3)
+        self.assertEqual([record['seq'] for record in self.follower.read_new()], [1, 2, 3])
+        self.assertEqual(self.follower.read_new(), [])
+
+    def test_catches_up_after_reading_mid_compaction(self):
+        self.append(5)
+        self.follow()
+
+        # The follower reads after the new snapshot is in place but before
+        # the journal starts over, so it reads the old journal to its end
+        reads = []
+
+        def read_between(path):
+            if not reads:
+                reads.append(self.follow())
+            fsync_dir(path)
+
+        with mock.patch('api.journal.fsync_dir', read_between):
+            self.writer.snapshot({'trades': []})
+        self.assertEqual(self.follower.seq, 5)
+
+        # The writer then appends past the offset the follower reached
+        self.append(20)
+        self.follow()
+        self.follow()
+        self.assertEqual(self.follower.seq, self.writer.seq)
+
+    def test_recovers_when_journal_is_cut_back(self):
+        self.append(5)
+        self.follow()
+        # A failed write is cut back after the follower read it, and later
+        # records land where it was
+        size = self.writer.journal_file.stat().st_size
+        self.append(2)
+        self.follow()
+        with open(self.writer.journal_file, 'r+b') as f:
+            f.truncate(size)
+        self.writer.seq = 5
+        self.append(30, tag='b')
+        self.follow()
+        self.assertEqual(self.follow(), Journal(self.data_dir.name, follower=True).recover()[1])
@@ -0,0 +1,136 @@
+import random
+import tempfile
+
+from django.test import SimpleTestCase
+
+from api.filedb import FileDB
+from api.matching import MatchingEngine
+from api.ticks import TickSize
+
+
+class ReferenceBook:
+    """Price-time priority matching done the slow and obvious way, to check the engine against"""
+
+    def __init__(self):
+        self.resting = []                   # [id, user id, side, price, quantity], oldest first
+
+    def book(self):
+        """Resting orders of each side in priority order, as (id, user id, price, quantity)"""
+        def side(order_type, sign):
+            orders = [order for order in self.resting if order[2] == order_type]
+            return [(order[0], order[1], order[3], order[4])
+                    for order in sorted(orders, key=lambda order: -sign * order[3])]
+        return {'bids': side('bid', 1), 'asks': side('ask', -1)}
+
+    def submit(self, order_id, user_id, order_type, price, quantity):
+        """Match an order and rest what is left; returns (price, quantity, bid user, ask user) per trade"""
+        trades = []
+        sign = 1 if order_type == 'bid' else -1
+        opposite = sorted((order for order in self.resting if order[2] != order_type),
+                          key=lambda order: sign * order[3])
+        for resting in opposite:
+            if not quantity or sign * (price - resting[3]) < 0:
+                break
+            if resting[1] == user_id:
+                continue
+            traded = min(quantity, resting[4])
+            users = (user_id, resting[1]) if order_type == 'bid' else (resting[1], user_id)
+            trades.append((resting[3], traded) + users)
+            resting[4] -= traded
+            quantity -= traded
+        self.resting = [order for order in self.resting if order[4]]
+        if quantity:
+            self.resting.append([order_id, user_id, order_type, price, quantity])
+        return trades
+
+    def find(self, user_id, order_id):
+        for order in self.resting:
+            if order[0] == order_id and order[1] == user_id:
+                return order
+        return None
+
+    def cancel(self, user_id, order_id):
+        order = self.find(user_id, order_id)
+        if order is not None:
+            self.resting.remove(order)
+        return order is not None
+
+    def amend(self, user_id, order_id, price, quantity):
+        order = self.find(user_id, order_id)
+        if order is None:
+            return []
+        if price == order[3] and quantity <= order[4]:
+            order[4] = quantity
+            return []
+        self.resting.remove(order)
+        return self.submit(order_id, user_id, order[2], price, quantity)
+
+
+class MatchingEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.db = FileDB(self.data_dir.name, symbol='TEST', tick_size=TickSize('0.01'),
+                         storage='journal')
+        self.engine = MatchingEngine(self.db, 'TEST')
+        self.reference = ReferenceBook()
+
+    def tearDown(self):
+        self.db.close()
+        self.data_dir.cleanup()
+
+    def book(self, engine=None):
+        book = (engine or self.engine).get_order_book()
+        return {side: [(order.id, order.user_id, order.price, order.quantity) for order in orders]
+                for side, orders in book.items()}
+
+    @staticmethod
+    def trades(trades):
+        return [(trade.price, trade.quantity, trade.bid_user_id, trade.ask_user_id)
+                for trade in trades]
+
+    def test_matches_like_reference_model(self):
+        rnd = random.Random(7)
+        executed = []
+        for step in range(600):
+            user_id = rnd.randint(1, 5)
+            resting = [order for side in self.book().values() for order in side]
+            action = rnd.random()
+            if action < 0.15 and resting:
+                order_id = rnd.choice(resting)[0]
+                cancelled = self.engine.cancel_order(user_id, order_id)
+                self.assertEqual(cancelled is not None, self.reference.cancel(user_id, order_id))
+            elif action < 0.3 and resting:
+                order_id, _, price, quantity = rnd.choice(resting)
+                price = rnd.choice([price, price + rnd.randint(-3, 3)])
+                quantity = rnd.choice([max(1, quantity - 1), quantity + rnd.randint(1, 3)])
+                _, trades = self.engine.amend_order(user_id, order_id, price, quantity)
+                self.assertEqual(self.trades(trades),
+                                 self.reference.amend(user_id, order_id, price, quantity))
+                executed.extend(trades)
+            elif action < 0.4:
+                # One user's orders in a single batch never match each other
+                commands = [('new', {'price': rnd.randint(95, 105), 'quantity': rnd.randint(1, 6),
+                                     'order_type': rnd.choice(['bid', 'ask'])})
+                            for _ in range(rnd.randint(2, 4))]
+                results = self.engine.submit_batch(user_id, f'user{user_id}', commands)
+                for (_, args), result in zip(commands, results):
+                    expected = self.reference.submit(result['order'].id, user_id, args['order_type'],
+                                                     args['price'], args['quantity'])
+                    self.assertEqual(self.trades(result['trades']), expected)
+                    executed.extend(result['trades'])
+            else:
+                price, quantity = rnd.randint(95, 105), rnd.randint(1, 8)
+                order_type = rnd.choice(['bid', 'ask'])
+                order, trades = self.engine.submit_order(user_id, f'user{user_id}', price, quantity,
+                                                         order_type)
+                self.assertEqual(self.trades(trades),
+                                 self.reference.submit(order.id, user_id, order_type, price, quantity))
+                executed.extend(trades)
+            self.assertEqual(self.book(), self.reference.book(), f'Books differ after step {step}')
+
+        self.assertGreater(len(executed), 100)
+        self.assertEqual([trade.id for trade in self.db.get_trades()],
+                         [trade.id for trade in executed])
+        # A new engine rebuilds the same book from storage
+        self.assertEqual(self.book(MatchingEngine(self.db, 'TEST')), self.book())
@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase
+
+from api.records import format_timestamp, timestamp_ns
+
+
+class TimestampTests(SimpleTestCase):
+
+    def test_formatted_with_utc_offset(self):
+        ns = timestamp_ns('2025-04-27T09:15:20.5+00:00')
+        self.assertEqual(format_timestamp(ns), '2025-04-27T09:15:20.500000+00:00')
+
+    def test_offsets_converted_and_naive_read_as_utc(self):
+        expected = timestamp_ns('2025-04-27T09:15:20+00:00')
+        for value in ('2025-04-27T09:15:20', '2025-04-27T09:15:20Z',
+                      '2025-04-27T14:45:20+05:30'):
+            self.assertEqual(timestamp_ns(value), expected, value)
+        self.assertEqual(timestamp_ns(format_timestamp(expected)), expected)
@@ -0,0 +1,44 @@
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.filedb import FileDB
+from api.journal import Journal
+from api.stats import TradeTape
+from api.ticks import TickSize
+
+
+class TradeTapeReloadTests(SimpleTestCase):
+
+    def check_reload(self, storage, target, attribute):
+        with tempfile.TemporaryDirectory() as data_dir:
+            db = FileDB(data_dir, symbol='TEST', tick_size=TickSize('0.01'), storage=storage,
+                        group_commit=True)
+            tape = TradeTape(db)
+            for price in (100, 101):
+                db.create_trade(price, 1, 1, 'alice', 2, 'bob')
+            self.assertEqual(tape.summary()['trades'], 2)
+
+            # The tape reads a trade before its batch is written; the write
+            # fails, storage reloads without it and the next trade takes its id
+            def fail(*args):
+                self.assertEqual(tape.summary()['trades'], 3)
+                raise OSError('disk full')
+
+            with mock.patch.object(target, attribute, side_effect=fail):
+                with self.assertRaises(OSError):
+                    db.create_trade(500, 7, 1, 'alice', 2, 'bob')
+            self.assertEqual(db.reloads, 1)
+            db.create_trade(102, 3, 1, 'alice', 2, 'bob')
+
+            summary = tape.summary()
+            self.assertEqual(summary, TradeTape(db).summary())
+            self.assertEqual((summary['trades'], summary['volume']), (3, 5))
+            db.close()
+
+    def test_reset_after_failed_json_write(self):
+        self.check_reload('json', FileDB, '_write_file')
+
+    def test_reset_after_failed_journal_write(self):
+        self.check_reload('journal', Journal, '_sync')
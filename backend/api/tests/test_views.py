@@ -0,0 +1,100 @@
+import asyncio
+import tempfile
+import threading
+import time
+
+from django.test import AsyncClient, SimpleTestCase
+
+from api import views
+from api.cache import ResponseCache
+from api.jwt_utils import get_token_for_user
+from api.market import Market
+
+
+class ViewTestCase(SimpleTestCase):
+    """Serves the views from a market of its own, in a temporary directory"""
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.market = Market(self.data_dir.name, symbols=['TEST'], default_symbol='TEST',
+                             tick_sizes={'TEST': '0.01'})
+        self.saved = views.market, views.db, views.responses
+        views.market, views.db, views.responses = self.market, self.market.db, ResponseCache()
+        self.instrument = self.market.get()
+        self.auth = {'Authorization': f"Bearer {get_token_for_user(1, 'alice')}"}
+        self.hung = False                   # A request never returned and still holds locks
+
+    def tearDown(self):
+        views.market, views.db, views.responses = self.saved
+        if not self.hung:
+            self.market.db.close()
+        self.data_dir.cleanup()
+
+
+class CachedReadTests(ViewTestCase):
+
+    def test_concurrent_cache_misses(self):
+        engine = self.instrument.engine
+        db = self.instrument.db
+        for price in range(100, 105):
+            engine.submit_order(1, 'alice', price, 1, 'ask')
+            engine.submit_order(2, 'bob', price, 1, 'bid')
+
+        # The first read finds storage busy and goes to a thread, which is
+        # slow to build the body; the second read comes in on the event loop
+        # meanwhile, with storage idle, and misses the cache too
+        get_trades = db.get_trades
+        building = threading.Event()
+
+        def slow_get_trades():
+            if not building.is_set():
+                building.set()
+                time.sleep(0.2)
+            return get_trades()
+
+        db.get_trades = slow_get_trades
+        flushing = threading.Event()
+
+        def flush():
+            with db.lock:
+                flushing.set()
+                time.sleep(0.1)
+
+        statuses = []
+
+        async def read():
+            client = AsyncClient()
+            threading.Thread(target=flush).start()
+            flushing.wait()
+            first = asyncio.ensure_future(client.get('/api/trades/', headers=self.auth))
+            while not building.is_set():
+                await asyncio.sleep(0.01)
+            second = await client.get('/api/trades/', headers=self.auth)
+            statuses.extend([(await first).status_code, second.status_code])
+
+        # A lock-order inversion hangs the whole event loop, so no timeout
+        # inside it could fire; wait from outside instead
+        reader = threading.Thread(target=asyncio.run, args=(read(),), daemon=True)
+        reader.start()
+        reader.join(10)
+        self.hung = reader.is_alive()
+        self.assertFalse(self.hung, 'Cached reads deadlocked')
+        self.assertEqual(statuses, [200, 200])
+
+
+class TradeViewTests(ViewTestCase):
+
+    def test_cache_key_from_parsed_parameters(self):
+        engine = self.instrument.engine
+        engine.submit_order(1, 'alice', 100, 1, 'ask')
+        engine.submit_order(2, 'bob', 100, 1, 'bid')
+
+        async def read():
+            client = AsyncClient()
+            for query in ('limit=5&since_id=0', 'since_id=0&limit=5', 'since_id=0&limit=5&x=1',
+                          'since_id=0&since_id=0&limit=5', '', 'junk=1'):
+                response = await client.get(f'/api/trades/?{query}', headers=self.auth)
+                self.assertEqual(response.status_code, 200)
+
+        asyncio.run(read())
+        self.assertEqual(len(views.responses._entries), 2)
@@ -0,0 +1,60 @@
+"""
+Ticks - Integer price representation for the Order Book application
+
+Inside the matching engine and storage every price is a whole number of
+ticks, the minimum price increment of its instrument, so that price levels
+are exact integer keys. Prices are only written as decimals on output.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+DEFAULT_TICK_SIZE = '0.01'
+
+
+def parse_price(value):
+    """Parse an entered price as an exact decimal; raises ValueError if it is not a number"""
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid price: {value}')
+    if not price.is_finite():
+        raise ValueError(f'Invalid price: {value}')
+    return price
+
+
+class TickSize:
+    """Converts between decimal prices and integer ticks for one instrument"""
+    __slots__ = ('size',)
+
+    def __init__(self, size=DEFAULT_TICK_SIZE):
+        self.size = Decimal(str(size))
+        if not self.size.is_finite() or self.size <= 0:
+            raise ValueError(f'Invalid tick size: {size}')
+
+    def to_ticks(self, price):
+        """
+        Convert an entered price to ticks.
+        Raises ValueError if it is not a number or not a whole number of ticks.
+        """
+        try:
+            ticks, remainder = divmod(parse_price(price), self.size)
+        except InvalidOperation:
+            raise ValueError(f'Invalid price: {price}')
+        if remainder:
+            raise ValueError(f'Price must be a multiple of the tick size {self.size}')
+        return int(ticks)
+
+    def nearest_ticks(self, price):
+        """Convert a stored price to the nearest whole number of ticks"""
+        return int((Decimal(str(price)) / self.size).to_integral_value(ROUND_HALF_EVEN))
+
+    def to_price(self, ticks):
+        """Format a number of ticks as a decimal price string"""
+        return str(ticks * self.size)
+
+    def format_levels(self, levels):
+        """Aggregated price levels with their prices written as decimals"""
+        return [dict(level, price=self.to_price(level['price'])) for level in levels]
+
+    def format_depth(self, depth):
+        """Both sides of an aggregated book with their prices written as decimals"""
+        return {side: self.format_levels(levels) for side, levels in depth.items()}
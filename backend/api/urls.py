@@ -2,9 +2,18 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path('symbols/', views.SymbolView.as_view(), name='symbols'),
     path('orders/', views.OrderView.as_view(), name='orders'),
+    path('orders/<int:order_id>/', views.OrderDetailView.as_view(), name='order-detail'),
+    path('orders/batch/', views.OrderBatchView.as_view(), name='orders-batch'),
     path('orderbook/', views.OrderBookView.as_view(), name='orderbook'),
+    path('orderbook/depth/', views.OrderBookDepthView.as_view(), name='orderbook-depth'),
     path('trades/', views.TradeView.as_view(), name='trades'),
+    path('trades/bars/', views.BarsView.as_view(), name='trades-bars'),
+    path('trades/summary/', views.TradeSummaryView.as_view(), name='trades-summary'),
+    path('positions/', views.PositionView.as_view(), name='positions'),
+    path('export/<str:collection>.<str:fmt>', views.ExportView.as_view(), name='export'),
     path('auth/register/', views.RegisterView.as_view(), name='register'),
     path('auth/login/', views.LoginView.as_view(), name='login'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
@@ -1,16 +1,295 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status, views
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-import hashlib
-import os
-from django.conf import settings
+from rest_framework.renderers import JSONRenderer
 
-from .filedb import FileDB
+from . import export, metrics, stats
+from .authentication import JWTAuthentication
+from .cache import ResponseCache, etag_matches
+from .passwords import PoolBusy, hasher_from_settings
+from .records import timestamp_ns
+from .sequencer import SequencerError
+from .ticks import parse_price
 from .jwt_utils import get_token_for_user
+from .market import market_from_settings
+
+# Initialize the market: one file database and matching engine per symbol,
+# either resident in this process or owned by the sequencer
+market = market_from_settings()
+
+# Users are stored in the main database
+db = market.db
+
+# Encoded bodies of the polled read endpoints, shared between requests
+responses = ResponseCache()
+
+# Password hashing runs in its own bounded pool of threads
+passwords = hasher_from_settings()
+
+# Order entry from the async views matches and then writes to storage, so it
+# runs on its own threads and a slow flush never holds up the event loop.
+# Each symbol's engine serializes its orders, so more threads would only wait,
+# unless group commit lets orders wait for the disk together.
+ORDER_ENTRY_GROUP_THREADS = 32
+order_entry_threads = len(market.instruments)
+if getattr(settings, 'FILEDB', {}).get('GROUP_COMMIT'):
+    order_entry_threads *= ORDER_ENTRY_GROUP_THREADS
+order_entry = ThreadPoolExecutor(max_workers=max(2, order_entry_threads), 
+                                 thread_name_prefix='order-entry')
+
+
+def unknown_symbol_response(symbol):
+    return Response({'detail': f'Unknown symbol: {symbol}'}, 
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
+def busy_response(exc):
+    return Response({'detail': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, 
+                    headers={'Retry-After': '1'})
 
-# Initialize the file database
-DB_DIR = os.path.join(settings.BASE_DIR, 'data')
-db = FileDB(DB_DIR)
+
+def cached_response(request, key, etag, build):
+    """
+    Answer a GET for a versioned resource: 304 Not Modified if the client
+    already has the ETag, otherwise the JSON encoding of build(), which is
+    encoded once per ETag and shared through the response cache.
+    The ETag must be taken before building, so a body is never older than its tag.
+    """
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request, etag):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    body = responses.get(key, etag, lambda: JSONRenderer().render(build()))
+    return HttpResponse(body, content_type='application/json', headers=headers)
+
+
+def streaming_response(request, chunks, content_type):
+    """
+    Stream a sync iterator of chunks under either handler. Under ASGI Django
+    would first collect a sync iterator into a list, so there the chunks are
+    produced one at a time on a thread instead.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = iterate_on_thread(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+async def iterate_on_thread(iterator):
+    """Turn a blocking iterator into an async one that advances it on a thread"""
+    done = object()
+    advance = sync_to_async(next, thread_sensitive=False)
+    while True:
+        item = await advance(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """A JSON response encoded as the DRF views encode theirs"""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', 
+                        status=status)
+
+
+def busy_json_response(exc):
+    """busy_response for the async views"""
+    response = json_response({'detail': str(exc)}, status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
+
+async def cached_read(request, instruments, key, version, build):
+    """
+    cached_response for the async views. version() gives the ETag from the
+    in-memory state of some instruments and runs through read_state; only a
+    body not cached at that ETag is built, on a thread. The storage locks
+    are released first and the event loop never waits for another build, as
+    a build takes the storage locks while others wait for it.
+    """
+    etag = await read_state(instruments, version)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request, etag):
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    body = responses.lookup(key, etag)
+    if body is None:
+        body = await asyncio.get_running_loop().run_in_executor(
+            None, responses.get, key, etag, lambda: JSONRenderer().render(build()))
+    return HttpResponse(body, content_type='application/json', headers=headers)
+
+
+async def read_state(instruments, read):
+    """
+    Run read(), which reads the in-memory state of some instruments, from an
+    async view. In-process it runs straight on the event loop when the
+    storage locks are free, and on a thread otherwise, so a writer holding
+    them through a disk flush never blocks the loop. Followers of the
+    sequencer may have to reload files, so their reads always run on a thread.
+    """
+    if market.sequencer is None:
+        locks = [instrument.db.lock for instrument in instruments]
+        held = []
+        for lock in locks:
+            if not lock.acquire(blocking=False):
+                break
+            held.append(lock)
+        try:
+            if len(held) == len(locks):
+                return read()
+        finally:
+            for lock in reversed(held):
+                lock.release()
+    
+    return await asyncio.get_running_loop().run_in_executor(None, read)
+
+
+class AsyncAPIView(View):
+    """
+    Base of the views that run natively on the event loop under ASGI.
+    DRF views are sync only, so these authenticate with the same JWT
+    authentication, require an authenticated user and parse JSON bodies
+    themselves, answering in the same shapes as the DRF views.
+    """
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authentication, as for the DRF views, so no CSRF token either
+        return csrf_exempt(super().as_view(**initkwargs))
+    
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed as exc:
+            return json_response({'detail': exc.detail}, status.HTTP_403_FORBIDDEN)
+        if authenticated is None:
+            return json_response({'detail': 'Authentication credentials were not provided.'}, 
+                                 status.HTTP_403_FORBIDDEN)
+        request.user = authenticated[0]
+        
+        request.data = {}
+        if request.body:
+            try:
+                request.data = json.loads(request.body)
+            except ValueError as exc:
+                return json_response({'detail': f'JSON parse error - {exc}'}, 
+                                     status.HTTP_400_BAD_REQUEST)
+            if not isinstance(request.data, dict):
+                return json_response({'detail': 'Expected a JSON object'}, 
+                                     status.HTTP_400_BAD_REQUEST)
+        
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def to_dicts(records, tick_size):
+    """Turn orders or trades into their JSON-ready form"""
+    return [record.to_dict(tick_size) for record in records]
+
+
+def execution_response(order, trades, tick_size):
+    """The JSON-ready form of an order and the trades it executed"""
+    return {
+        'order': order.to_dict(tick_size),
+        'trades': to_dicts(trades, tick_size)
+    }
+
+
+def batch_result(result, tick_size):
+    """The JSON-ready form of one result of an engine batch"""
+    result = dict(result)
+    if 'order' in result:
+        result['order'] = result['order'].to_dict(tick_size)
+    if 'trades' in result:
+        result['trades'] = to_dicts(result['trades'], tick_size)
+    return result
+
+
+def time_window(params):
+    """
+    Parse the optional start and end ISO timestamps of a query into nanoseconds.
+    Returns (start, end) and None, or (None, None) and an error message.
+    """
+    try:
+        start = timestamp_ns(params['start']) if 'start' in params else None
+        end = timestamp_ns(params['end']) if 'end' in params else None
+    except ValueError:
+        return (None, None), 'start and end must be ISO timestamps'
+    return (start, end), None
+
+
+def validate_order(data, tick_size):
+    """
+    Validate the fields of a new order and convert its price to ticks.
+    Returns the cleaned fields and None, or None and an error message.
+    """
+    price = data.get('price')
+    quantity = data.get('quantity')
+    order_type = data.get('order_type')  # 'bid' or 'ask'
+    
+    # Validate input
+    if not price or not quantity or not order_type:
+        return None, 'Price, quantity and order type are required'
+    
+    # Validate price and quantity are positive
+    try:
+        price = parse_price(price)
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return None, 'Invalid price or quantity format'
+    
+    if price <= 0 or quantity <= 0:
+        return None, 'Price and quantity must be positive'
+    
+    if order_type not in ['bid', 'ask']:
+        return None, 'Order type must be "bid" or "ask"'
+    
+    try:
+        price = tick_size.to_ticks(price)
+    except ValueError as exc:
+        return None, str(exc)
+    
+    return {'price': price, 'quantity': quantity, 'order_type': order_type}, None
+
+
+def validate_amend(data, tick_size):
+    """
+    Validate the new price and/or remaining quantity of an order,
+    converting the price to ticks.
+    Returns the cleaned fields and None, or None and an error message.
+    """
+    price = data.get('price')
+    quantity = data.get('quantity')
+    
+    if price is None and quantity is None:
+        return None, 'Price or quantity is required'
+    
+    try:
+        price = None if price is None else parse_price(price)
+        quantity = None if quantity is None else int(quantity)
+    except (TypeError, ValueError):
+        return None, 'Invalid price or quantity format'
+    
+    if (price is not None and price <= 0) or (quantity is not None and quantity <= 0):
+        return None, 'Price and quantity must be positive'
+    
+    if price is not None:
+        try:
+            price = tick_size.to_ticks(price)
+        except ValueError as exc:
+            return None, str(exc)
+    
+    return {'price': price, 'quantity': quantity}, None
 
 
 class LoginView(views.APIView):
@@ -31,13 +310,24 @@ class LoginView(views.APIView):
         if not user:
             return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Hash the provided password for comparison
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        # Compare the password with the stored hash, off the request thread
+        stored_password = user['password']
+        try:
+            valid = passwords.verify(password, stored_password)
+        except PoolBusy as exc:
+            return busy_response(exc)
         
-        # Compare the hashed passwords
-        if user['password'] != hashed_password:
+        if not valid:
             return Response({'detail': 'Invalid password'}, status=status.HTTP_401_UNAUTHORIZED)
         
+        # Upgrade legacy and outdated hashes while the password is at hand;
+        # if the pool is busy the upgrade waits for the next login
+        if passwords.needs_rehash(stored_password):
+            try:
+                market.set_password(username, passwords.hash(password))
+            except (PoolBusy, SequencerError):
+                pass
+        
         # Generate JWT token
         token = get_token_for_user(user['id'], user['username'])
         
@@ -69,10 +359,16 @@ class RegisterView(views.APIView):
                             status=status.HTTP_400_BAD_REQUEST)
         
         # Hash the password before storing it
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        try:
+            hashed_password = passwords.hash(password)
+        except PoolBusy as exc:
+            return busy_response(exc)
         
         # Create a new user with the hashed password
-        user = db.create_user(username, hashed_password)
+        try:
+            user = market.create_user(username, hashed_password)
+        except SequencerError as exc:
+            return busy_response(exc)
         
         if user:
             # Generate JWT token
@@ -90,72 +386,526 @@ class RegisterView(views.APIView):
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class OrderBookView(views.APIView):
-    """API endpoint for the order book"""
+class SymbolView(views.APIView):
+    """API endpoint for listing the tradable symbols"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        order_book = db.get_order_book()
-        return Response(order_book)
+        return Response({
+            'symbols': market.symbols(),
+            'default': market.default_symbol,
+            'tick_sizes': {
+                symbol: str(instrument.tick_size.size)
+                for symbol, instrument in market.instruments.items()
+            }
+        })
+
+
+class OrderBookView(AsyncAPIView):
+    """
+    API endpoint for the order book of a symbol. The book is read on the
+    event loop from the matching engine's latest snapshot, without taking
+    any lock, and is tagged with the snapshot's sequence number.
+    """
+    
+    async def get(self, request):
+        symbol = request.GET.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return json_response({'detail': f'Unknown symbol: {symbol}'}, 
+                                 status.HTTP_400_BAD_REQUEST)
+        
+        engine = instrument.engine
+        key = ('orderbook', instrument.symbol)
+        
+        def build(order_book):
+            return {
+                side: to_dicts(orders, instrument.tick_size)
+                for side, orders in order_book.items()
+            }
+        
+        if market.sequencer is not None:
+            # The book lives in the sequencer; follow the published orders instead
+            def version():
+                return f'"{instrument.db.version("orders")}"'
+            
+            try:
+                return await cached_read(request, [instrument], key, version, 
+                                         lambda: build(engine.get_order_book()))
+            except SequencerError as exc:
+                return busy_json_response(exc)
+        
+        snapshot = engine.snapshot
+        etag = f'"{instrument.db.epoch}-e{snapshot.sequence}"'
+        return cached_response(request, key, etag, lambda: build(snapshot.order_book()))
 
 
-class OrderView(views.APIView):
-    """API endpoint for creating and listing orders"""
+class OrderBookDepthView(views.APIView):
+    """API endpoint for the aggregated (L2) order book depth of a symbol"""
     permission_classes = [IsAuthenticated]
     
+    DEFAULT_LEVELS = 10
+    MAX_LEVELS = 100
+    
     def get(self, request):
-        orders = db.get_user_orders(request.user.id)
-        return Response(orders)
+        symbol = request.query_params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        levels = request.query_params.get('levels', self.DEFAULT_LEVELS)
+        
+        try:
+            levels = int(levels)
+        except (TypeError, ValueError):
+            return Response({'detail': 'Levels must be an integer'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        if levels <= 0 or levels > self.MAX_LEVELS:
+            return Response({'detail': f'Levels must be between 1 and {self.MAX_LEVELS}'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        key = ('depth', instrument.symbol, levels)
+        
+        if market.sequencer is not None:
+            def build():
+                return instrument.tick_size.format_depth(instrument.engine.get_depth(levels))
+            
+            etag = f'"{instrument.db.version("orders")}"'
+            try:
+                return cached_response(request, key, etag, build)
+            except SequencerError as exc:
+                return busy_response(exc)
+        
+        # In-process the depth comes from the engine's snapshot, without any lock
+        snapshot = instrument.engine.snapshot
+        etag = f'"{instrument.db.epoch}-e{snapshot.sequence}"'
+        return cached_response(request, key, etag, 
+                               lambda: instrument.tick_size.format_depth(snapshot.depth(levels)))
+
+
+class OrderView(AsyncAPIView):
+    """
+    API endpoint for creating and listing orders.
+    Listing answers from the response cache on the event loop while storage
+    is idle and builds a changed listing on a thread; new orders are matched
+    and written on the order entry threads.
+    """
+    
+    async def get(self, request):
+        symbol = request.GET.get('symbol')
+        
+        user_id = request.user.id
+        
+        if symbol is None:
+            # Orders across every symbol
+            instruments = list(market.instruments.values())
+        else:
+            instrument = market.get(symbol)
+            if instrument is None:
+                return json_response({'detail': f'Unknown symbol: {symbol}'}, 
+                                     status.HTTP_400_BAD_REQUEST)
+            instruments = [instrument]
+        
+        def build():
+            return [
+                order.to_dict(instrument.tick_size)
+                for instrument in instruments
+                for order in instrument.db.get_user_orders(user_id)
+            ]
+        
+        def version():
+            return '"' + '.'.join(instrument.db.version('orders') for instrument in instruments) + '"'
+        
+        return await cached_read(request, instruments, ('orders', user_id, symbol), version, build)
+    
+    async def post(self, request):
+        symbol = request.data.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return json_response({'detail': f'Unknown symbol: {symbol}'}, 
+                                 status.HTTP_400_BAD_REQUEST)
+        
+        fields, error = validate_order(request.data, instrument.tick_size)
+        if error:
+            return json_response({'detail': error}, status.HTTP_400_BAD_REQUEST)
+        
+        # Match the order against the book and store it with its trades
+        try:
+            new_order, trades = await asyncio.get_running_loop().run_in_executor(
+                order_entry, 
+                partial(
+                    instrument.engine.submit_order, 
+                    user_id=request.user.id, 
+                    username=request.user.username, 
+                    **fields
+                )
+            )
+        except SequencerError as exc:
+            return busy_json_response(exc)
+        
+        # Return the created order and any executed trades
+        return json_response(execution_response(new_order, trades, instrument.tick_size), 
+                             status.HTTP_201_CREATED)
+
+
+class OrderDetailView(views.APIView):
+    """
+    API endpoint for cancelling and amending one of the user's active orders.
+    Reducing the quantity keeps the order's place in the queue; a new price
+    or a larger quantity sends it to the back of the queue at its price.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def delete(self, request, order_id):
+        symbol = request.query_params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        try:
+            order = instrument.engine.cancel_order(request.user.id, order_id)
+        except SequencerError as exc:
+            return busy_response(exc)
+        if order is None:
+            return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(order.to_dict(instrument.tick_size))
+    
+    def patch(self, request, order_id):
+        symbol = request.query_params.get('symbol') or request.data.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        fields, error = validate_amend(request.data, instrument.tick_size)
+        if error:
+            return Response({'detail': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            order, trades = instrument.engine.amend_order(request.user.id, order_id, **fields)
+        except SequencerError as exc:
+            return busy_response(exc)
+        if order is None:
+            return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(execution_response(order, trades, instrument.tick_size))
+
+
+class OrderBatchView(views.APIView):
+    """
+    API endpoint for submitting many orders, cancels and amends in one request.
+    The body is {'symbol': ..., 'orders': [...]} where each item is one of
+    {'action': 'new', 'price', 'quantity', 'order_type'},
+    {'action': 'cancel', 'id'} or {'action': 'amend', 'id', 'price', 'quantity'}.
+    Items are validated and matched in one pass with a single storage write,
+    and the response holds one result per item, in order.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    MAX_BATCH_SIZE = 500
     
     def post(self, request):
-        price = request.data.get('price')
-        quantity = request.data.get('quantity')
-        order_type = request.data.get('order_type')  # 'bid' or 'ask'
+        symbol = request.data.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        items = request.data.get('orders')
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Orders must be a non-empty list'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Validate input
-        if not price or not quantity or not order_type:
-            return Response({'detail': 'Price, quantity and order type are required'}, 
+        if len(items) > self.MAX_BATCH_SIZE:
+            return Response({'detail': f'At most {self.MAX_BATCH_SIZE} orders per batch'}, 
                             status=status.HTTP_400_BAD_REQUEST)
         
-        # Validate price and quantity are positive
+        # Validate every item first; only valid items reach the engine
+        results = [None] * len(items)
+        commands = []
+        positions = []
+        for position, item in enumerate(items):
+            command, error = self._command(item, instrument.tick_size)
+            if error:
+                results[position] = {'status': 'rejected', 'detail': error}
+            else:
+                commands.append(command)
+                positions.append(position)
+        
+        if commands:
+            try:
+                engine_results = instrument.engine.submit_batch(
+                    user_id=request.user.id, 
+                    username=request.user.username, 
+                    commands=commands
+                )
+            except SequencerError as exc:
+                return busy_response(exc)
+            for position, result in zip(positions, engine_results):
+                results[position] = batch_result(result, instrument.tick_size)
+        
+        return Response({'results': results})
+    
+    def _command(self, item, tick_size):
+        """Turn one batch item into an engine command, or return an error message"""
+        if not isinstance(item, dict):
+            return None, 'Each order must be an object'
+        
+        action = item.get('action', 'new')
+        if action == 'new':
+            fields, error = validate_order(item, tick_size)
+            return ('new', fields), error
+        
+        if action not in ('cancel', 'amend'):
+            return None, 'Action must be "new", "cancel" or "amend"'
+        
         try:
-            price = float(price)
-            quantity = int(quantity)
+            order_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            return None, 'Cancel and amend require an integer order id'
+        
+        if action == 'cancel':
+            return ('cancel', {'order_id': order_id}), None
+        
+        fields, error = validate_amend(item, tick_size)
+        if error:
+            return None, error
+        return ('amend', dict(fields, order_id=order_id)), None
+
+
+class TradeView(AsyncAPIView):
+    """
+    API endpoint for listing the trades of a symbol (the default one unless
+    ?symbol= is given).
+    Without paging parameters every trade is returned. With any of the
+    parameters below the response is a page of the form
+    {'results': [...], 'next_cursor': id or null}:
+    - since_id: trades after this id, oldest first (for incremental polling)
+    - cursor: trades before this id, newest first (for paging back through history)
+    - start / end: ISO timestamps bounding the trades
+    - limit: page size
+    """
+    
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+    PAGE_PARAMS = ('since_id', 'cursor', 'start', 'end', 'limit')
+    
+    async def get(self, request):
+        params = request.GET
+        
+        symbol = params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return json_response({'detail': f'Unknown symbol: {symbol}'}, 
+                                 status.HTTP_400_BAD_REQUEST)
+        
+        # Keyed by the parsed parameters, so reordered, repeated or unknown
+        # parameters share the entry of the page they ask for
+        key = ('trades', instrument.symbol)
+        
+        if not any(name in params for name in self.PAGE_PARAMS):
+            def build():
+                return to_dicts(instrument.db.get_trades(), instrument.tick_size)
+        else:
+            try:
+                since_id = int(params['since_id']) if 'since_id' in params else None
+                cursor = int(params['cursor']) if 'cursor' in params else None
+                limit = int(params.get('limit', self.DEFAULT_LIMIT))
+            except ValueError:
+                return json_response({'detail': 'since_id, cursor and limit must be integers'}, 
+                                     status.HTTP_400_BAD_REQUEST)
             
-            if price <= 0 or quantity <= 0:
-                return Response({'detail': 'Price and quantity must be positive'}, 
-                                status=status.HTTP_400_BAD_REQUEST)
+            (start, end), error = time_window(params)
+            if error:
+                return json_response({'detail': error}, status.HTTP_400_BAD_REQUEST)
             
-            if order_type not in ['bid', 'ask']:
-                return Response({'detail': 'Order type must be "bid" or "ask"'}, 
-                                status=status.HTTP_400_BAD_REQUEST)
+            if limit <= 0 or limit > self.MAX_LIMIT:
+                return json_response({'detail': f'Limit must be between 1 and {self.MAX_LIMIT}'}, 
+                                     status.HTTP_400_BAD_REQUEST)
+            
+            key += (since_id, cursor, start, end, limit)
+            
+            def build():
+                trades, has_more = instrument.db.get_trades_page(
+                    since_id=since_id, 
+                    before_id=cursor, 
+                    start=start, 
+                    end=end, 
+                    limit=limit
+                )
+                
+                # Continue from the last trade returned, in the direction of the page
+                next_cursor = trades[-1].id if trades and has_more else None
+                
+                return {
+                    'results': to_dicts(trades, instrument.tick_size),
+                    'next_cursor': next_cursor
+                }
+        
+        def version():
+            return f'"{instrument.db.version("trades")}"'
+        
+        return await cached_read(request, [instrument], key, version, build)
+
+
+class BarsView(views.APIView):
+    """
+    API endpoint for the OHLCV bars of a symbol (the default one unless
+    ?symbol= is given), oldest first, with the volume-weighted average
+    price of each bar. Only bars with trades are returned.
+    - interval: bar length, one of stats.INTERVALS (default 1m)
+    - start / end: ISO timestamps bounding the bar start times
+    - limit: the latest bars to return
+    """
+    permission_classes = [IsAuthenticated]
+    
+    DEFAULT_INTERVAL = '1m'
+    DEFAULT_LIMIT = 500
+    MAX_LIMIT = 5000
+    
+    def get(self, request):
+        params = request.query_params
+        
+        symbol = params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        interval = params.get('interval', self.DEFAULT_INTERVAL)
+        if interval not in stats.INTERVALS:
+            return Response({'detail': f"Interval must be one of {', '.join(stats.INTERVALS)}"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            limit = int(params.get('limit', self.DEFAULT_LIMIT))
         except ValueError:
-            return Response({'detail': 'Invalid price or quantity format'}, 
+            return Response({'detail': 'Limit must be an integer'}, 
                             status=status.HTTP_400_BAD_REQUEST)
         
-        # Create the order
-        new_order = db.create_order(
-            user_id=request.user.id, 
-            username=request.user.username, 
-            price=price, 
-            quantity=quantity, 
-            order_type=order_type
-        )
+        if limit <= 0 or limit > self.MAX_LIMIT:
+            return Response({'detail': f'Limit must be between 1 and {self.MAX_LIMIT}'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
         
-        # Match the order with existing orders
-        trades = db.match_orders(new_order)
+        (start, end), error = time_window(params)
+        if error:
+            return Response({'detail': error}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Return the created order and any executed trades
         return Response({
-            'order': new_order,
-            'trades': trades
-        }, status=status.HTTP_201_CREATED)
+            'symbol': instrument.symbol,
+            'interval': interval,
+            'bars': instrument.tape.bars(interval, start=start, end=end, limit=limit)
+        })
+
+
+class TradeSummaryView(views.APIView):
+    """
+    API endpoint for the trade count, volume, VWAP and open/high/low/close
+    of a symbol over a window of its trade history (all of it unless
+    start and/or end ISO timestamps are given)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        params = request.query_params
+        
+        symbol = params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        (start, end), error = time_window(params)
+        if error:
+            return Response({'detail': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(dict(instrument.tape.summary(start=start, end=end),
+                             symbol=instrument.symbol))
 
 
-class TradeView(views.APIView):
-    """API endpoint for listing trades"""
+class PositionView(views.APIView):
+    """
+    API endpoint for the user's net position, average price, realized and
+    unrealized P&L and open order exposure in each symbol (or in one, if
+    ?symbol= is given), read from the ledgers the matching engines keep
+    """
     permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        symbol = request.query_params.get('symbol')
+
+        if symbol is None:
+            instruments = list(market.instruments.values())
+        else:
+            instrument = market.get(symbol)
+            if instrument is None:
+                return unknown_symbol_response(symbol)
+            instruments = [instrument]
+
+        try:
+            positions = [
+                instrument.engine.get_position(request.user.id)
+                for instrument in instruments
+            ]
+        except SequencerError as exc:
+            return busy_response(exc)
+
+        return Response({'positions': positions})
+
+
+class ExportView(views.APIView):
+    """
+    API endpoint streaming every order or trade of a symbol (the default one
+    unless ?symbol= is given) as NDJSON or CSV, e.g. /api/export/trades.csv.
+    Records are written out a chunk at a time, so the full history never has
+    to fit in one response body in memory. Optional parameters:
+    - since_id: records after this id
+    - start / end: ISO timestamps bounding the record timestamps
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def perform_content_negotiation(self, request, force=False):
+        # The export is written in the format named in the URL, whatever the
+        # client accepts; errors are still rendered as JSON
+        return super().perform_content_negotiation(request, force=True)
+    
+    def get(self, request, collection, fmt):
+        if collection not in export.COLLECTIONS or fmt not in export.TEXT_FORMATS:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        params = request.query_params
+        symbol = params.get('symbol')
+        instrument = market.get(symbol)
+        if instrument is None:
+            return unknown_symbol_response(symbol)
+        
+        try:
+            since_id = int(params['since_id']) if 'since_id' in params else None
+        except ValueError:
+            return Response({'detail': 'since_id must be an integer'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        (start, end), error = time_window(params)
+        if error:
+            return Response({'detail': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = streaming_response(
+            request, 
+            export.iter_text(instrument.db, collection, fmt, since_id=since_id, start=start,
+                             end=end),
+            export.TEXT_FORMATS[fmt]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{instrument.symbol}-{collection}.{fmt}"'
+        )
+        return response
+
+
+class MetricsView(views.APIView):
+    """
+    API endpoint exposing the process metrics in the Prometheus text format.
+    It is unauthenticated so scrapers need no token; keep it off public networks.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
     
     def get(self, request):
-        trades = db.get_trades()
-        return Response(trades)
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
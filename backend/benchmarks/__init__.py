@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Order Book application, run with ``manage.py benchmark``
+"""
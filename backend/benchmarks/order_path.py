@@ -0,0 +1,310 @@
+"""
+Order path benchmark - Load generation and latency measurement for order entry
+
+Seeds a data directory with a book of configurable depth and a trade history
+of configurable size, then replays the same synthetic order flow through the
+matching engine and FileDB directly ('engine') and through the DRF views
+in-process ('views'), timing every operation.
+
+Order flow is built from three kinds of operations:
+- passive: a limit order that rests behind the touch
+- aggressive: a limit order that crosses the spread and trades
+- cancel: a cancel of a passive order placed earlier in the run
+
+Each run is repeated and the median of every figure is reported, so one
+slow run (a GC pause, another process) does not decide the result. p999
+takes more samples than one run has to mean anything, so it is taken over
+the latencies of every repeat pooled together.
+"""
+import json
+import logging
+import random
+import shutil
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from api.filedb import FileDB
+from api.matching import MatchingEngine
+from api.ticks import TickSize
+
+SYMBOL = 'BENCH'
+TICK_SIZE = '0.01'
+MID_PRICE = 10000                           # 100.00 in ticks
+HISTORY_START = datetime(2025, 1, 1, 9, 15)
+
+# Operation weights of each order flow mix
+MIXES = {
+    'passive': {'passive': 1.0},
+    'aggressive': {'aggressive': 0.5, 'passive': 0.5},
+    'cancel': {'passive': 0.5, 'cancel': 0.5},
+    'mixed': {'passive': 0.6, 'aggressive': 0.2, 'cancel': 0.2},
+}
+
+TARGETS = ('engine', 'views')
+
+
+def seed_data(data_dir, depth=50, orders_per_level=4, history=2000, users=20, seed=1):
+    """Write users, a resting book of depth price levels per side and a trade history"""
+    rng = random.Random(seed)
+    tick_size = TickSize(TICK_SIZE)
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    user_list = [
+        {'id': user_id, 'username': f'bench{user_id}', 'password': ''}
+        for user_id in range(1, users + 1)
+    ]
+
+    orders = []
+    for level in range(1, depth + 1):
+        for order_type, price in (('bid', MID_PRICE - level), ('ask', MID_PRICE + level)):
+            for _ in range(orders_per_level):
+                user = rng.choice(user_list)
+                orders.append({
+                    'id': len(orders) + 1,
+                    'symbol': SYMBOL,
+                    'user_id': user['id'],
+                    'user': user['username'],
+                    'price': tick_size.to_price(price),
+                    'quantity': rng.randint(1, 100),
+                    'order_type': order_type,
+                    'timestamp': HISTORY_START.isoformat(),
+                    'is_active': True
+                })
+
+    trades = []
+    for trade_id in range(1, history + 1):
+        bid_user, ask_user = rng.sample(user_list, 2)
+        trades.append({
+            'id': trade_id,
+            'symbol': SYMBOL,
+            'price': tick_size.to_price(MID_PRICE + rng.randint(-depth, depth)),
+            'quantity': rng.randint(1, 100),
+            'timestamp': (HISTORY_START + timedelta(milliseconds=trade_id)).isoformat(),
+            'bid_user_id': bid_user['id'],
+            'bid_user': bid_user['username'],
+            'ask_user_id': ask_user['id'],
+            'ask_user': ask_user['username']
+        })
+
+    for name, data in (('users', user_list), ('orders', orders), ('trades', trades)):
+        with open(data_dir / f'{name}.json', 'w') as f:
+            json.dump(data, f)
+    return user_list
+
+
+def generate_flow(mix, count, depth=50, users=20, seed=1):
+    """
+    Build a reproducible list of operations:
+    ('passive' | 'aggressive', user_id, order_type, price, quantity) or
+    ('cancel', user_id, index of the passive operation to cancel).
+    """
+    rng = random.Random(seed)
+    kinds = list(MIXES[mix])
+    weights = [MIXES[mix][kind] for kind in kinds]
+    passive_by_user = {}
+    flow = []
+
+    for index in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        user_id = rng.randint(1, users)
+        order_type = rng.choice(('bid', 'ask'))
+        sign = 1 if order_type == 'bid' else -1
+
+        if kind == 'cancel' and passive_by_user.get(user_id):
+            pending = passive_by_user[user_id]
+            flow.append(('cancel', user_id, pending.pop(rng.randrange(len(pending)))))
+            continue
+        if kind == 'aggressive':
+            price = MID_PRICE + sign * rng.randint(1, 3)
+            flow.append(('aggressive', user_id, order_type, price, rng.randint(1, 50)))
+            continue
+
+        price = MID_PRICE - sign * rng.randint(1, depth)
+        flow.append(('passive', user_id, order_type, price, rng.randint(1, 100)))
+        passive_by_user.setdefault(user_id, []).append(index)
+
+    return flow
+
+
+class EngineRunner:
+    """Replays operations straight into a matching engine and its FileDB"""
+
+    def __init__(self, data_dir, users, storage='json'):
+        self.usernames = {user['id']: user['username'] for user in users}
+        self.db = FileDB(data_dir, symbol=SYMBOL, tick_size=TickSize(TICK_SIZE), storage=storage)
+        self.engine = MatchingEngine(self.db, SYMBOL)
+
+    def submit(self, user_id, order_type, price, quantity):
+        order, _ = self.engine.submit_order(user_id, self.usernames[user_id], price, quantity,
+                                            order_type)
+        return order.id
+
+    def cancel(self, user_id, order_id):
+        self.engine.cancel_order(user_id, order_id)
+
+    def close(self):
+        self.db.close()
+
+
+class ViewsRunner:
+    """Replays operations as authenticated requests to the DRF views, in-process"""
+
+    def __init__(self, data_dir, users, storage='json'):
+        from django.conf import settings
+        from rest_framework.test import APIClient
+
+        # Cancels of orders that have already filled are answered with 404s,
+        # which Django would otherwise log one by one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        settings.ALLOWED_HOSTS = ['testserver']
+        settings.FILEDB = dict(settings.FILEDB, DATA_DIR=str(data_dir), STORAGE=storage)
+        settings.ORDER_BOOK = dict(settings.ORDER_BOOK, SYMBOLS=[SYMBOL], DEFAULT_SYMBOL=SYMBOL,
+                                   TICK_SIZES={SYMBOL: TICK_SIZE}, SEQUENCER_SOCKET=None)
+
+        # Importing the views builds their market from the settings above the
+        # first time; later runs swap in a market over their own data
+        from api import views
+        from api.jwt_utils import get_token_for_user
+        from api.market import market_from_settings
+
+        self.views = views
+        if views.market.data_dir != Path(data_dir):
+            views.market.db.close()
+            views.market = market_from_settings()
+            views.db = views.market.db
+
+        self.client = APIClient()
+        self.tick_size = TickSize(TICK_SIZE)
+        self.auth = {
+            user['id']: f"Bearer {get_token_for_user(user['id'], user['username'])}"
+            for user in users
+        }
+
+    def submit(self, user_id, order_type, price, quantity):
+        response = self.client.post(
+            '/api/orders/',
+            {'price': self.tick_size.to_price(price), 'quantity': quantity,
+             'order_type': order_type},
+            format='json',
+            HTTP_AUTHORIZATION=self.auth[user_id]
+        )
+        return response.json()['order']['id']
+
+    def cancel(self, user_id, order_id):
+        self.client.delete(f'/api/orders/{order_id}/', HTTP_AUTHORIZATION=self.auth[user_id])
+
+    def close(self):
+        self.views.market.db.close()
+
+
+RUNNERS = {'engine': EngineRunner, 'views': ViewsRunner}
+
+
+def replay(runner, flow):
+    """Run every operation and return the latency of each, in nanoseconds"""
+    order_ids = {}
+    latencies = []
+    clock = time.perf_counter_ns
+
+    for index, operation in enumerate(flow):
+        if operation[0] == 'cancel':
+            _, user_id, ref = operation
+            started = clock()
+            runner.cancel(user_id, order_ids[ref])
+        else:
+            _, user_id, order_type, price, quantity = operation
+            started = clock()
+            order_ids[index] = runner.submit(user_id, order_type, price, quantity)
+        latencies.append(clock() - started)
+
+    return latencies
+
+
+def percentile(ordered, fraction):
+    """A percentile of sorted latencies in nanoseconds, in microseconds"""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] / 1000
+
+
+def summarize(latencies):
+    """Throughput and latency percentiles (in microseconds) of one run"""
+    ordered = sorted(latencies)
+    return {
+        'ops': len(ordered),
+        'throughput': len(ordered) / (sum(ordered) / 1e9),
+        'p50_us': percentile(ordered, 0.50),
+        'p99_us': percentile(ordered, 0.99),
+    }
+
+
+def combine(runs, latencies):
+    """
+    The median of each figure over repeated runs of the same flow, and the
+    p999 of their latencies pooled
+    """
+    return {
+        'ops': runs[0]['ops'],
+        'runs': len(runs),
+        **{key: statistics.median(run[key] for run in runs)
+           for key in ('throughput', 'p50_us', 'p99_us')},
+        'p999_us': percentile(sorted(latencies), 0.999),
+    }
+
+
+def run(work_dir, targets=TARGETS, mixes=tuple(MIXES), ops=1000, depth=50, orders_per_level=4,
+        history=2000, users=20, storage='json', seed=1, repeat=3):
+    """
+    Run every target against every mix repeat times, each on a fresh copy of
+    the seeded data. Returns a dict of median results keyed by '<target>/<mix>'.
+    """
+    work_dir = Path(work_dir)
+    template = work_dir / 'seed'
+    user_list = seed_data(template, depth, orders_per_level, history, users, seed)
+
+    results = {}
+    for target in targets:
+        for mix in mixes:
+            flow = generate_flow(mix, ops, depth, users, seed)
+            runs = []
+            pooled = []
+            for attempt in range(repeat):
+                data_dir = work_dir / f'{target}-{mix}-{attempt}'
+                shutil.copytree(template, data_dir)
+
+                runner = RUNNERS[target](data_dir, user_list, storage)
+                try:
+                    latencies = replay(runner, flow)
+                finally:
+                    runner.close()
+                shutil.rmtree(data_dir)
+                runs.append(summarize(latencies))
+                pooled.extend(latencies)
+            results[f'{target}/{mix}'] = combine(runs, pooled)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results to a baseline and return the regressions found: lower
+    throughput or higher p99 latency than the baseline allows.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['throughput'] < expected['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.0f} ops/s "
+                f"is below the baseline {expected['throughput']:.0f} ops/s"
+            )
+        if result['p99_us'] > expected['p99_us'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {result['p99_us']:.0f} us "
+                f"is above the baseline {expected['p99_us']:.0f} us"
+            )
+    return regressions
@@ -2,6 +2,8 @@
 ASGI config for order_book_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django, and WebSocket connections by the market
+data feed in ``api.streaming``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'order_book_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since the feed is attached to the matching engine
+from api.streaming import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
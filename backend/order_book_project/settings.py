@@ -96,6 +96,52 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# FileDB storage settings
+FILEDB = {
+    # 'json' rewrites a JSON file per collection on every change,
+    # 'journal' appends every change to a write-ahead journal
+    'STORAGE': 'json',
+    # Journal fsync policy: 'always', 'interval' or 'never'
+    'FSYNC': 'always',
+    'FSYNC_INTERVAL': 1.0,
+    # Number of journal records between compacted snapshots
+    'SNAPSHOT_INTERVAL': 10000,
+    # Group commit: queue the changes made within GROUP_COMMIT_WINDOW seconds
+    # (or until GROUP_COMMIT_MAX_EVENTS events) and write them together
+    'GROUP_COMMIT': False,
+    'GROUP_COMMIT_WINDOW': 0.001,
+    'GROUP_COMMIT_MAX_EVENTS': 256,
+    # Tiering: every ARCHIVE_INTERVAL seconds, move filled and cancelled orders
+    # and trades older than ARCHIVE_AFTER seconds (None: never) to archive
+    # segments, if there are at least ARCHIVE_MIN_RECORDS of them
+    'ARCHIVE_AFTER': None,
+    'ARCHIVE_INTERVAL': 3600,
+    'ARCHIVE_MIN_RECORDS': 1000,
+}
+
+# Listed instruments; orders that do not name a symbol trade the default one
+ORDER_BOOK = {
+    'SYMBOLS': ['RELIANCE'],
+    'DEFAULT_SYMBOL': 'RELIANCE',
+    # Minimum price increment of each symbol; symbols not listed use 0.01
+    'TICK_SIZES': {'RELIANCE': '0.05'},
+    # Unix socket of the sequencer process (manage.py run_sequencer). When set,
+    # web workers forward order entry to it instead of matching in-process.
+    'SEQUENCER_SOCKET': None,
+    # Seconds a web worker waits for the sequencer to answer before the
+    # request is answered with 503 Service Unavailable
+    'SEQUENCER_TIMEOUT': 10.0,
+}
+
+# Password hashing: PBKDF2 iterations, hashing threads (default: one less
+# than the number of cores) and logins that may queue for them before
+# further ones are refused
+PASSWORDS = {
+    'ITERATIONS': 600000,
+    'WORKERS': None,
+    'MAX_QUEUED': 64,
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -1,12 +1,14 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Order } from '../../types/types';
-import { getUserOrders } from '../../services/api';
+import { cancelOrder, getUserOrders } from '../../services/api';
+import { subscribeMarketData } from '../../services/marketData';
 import './MyOrders.css';
 
 const MyOrders: React.FC = () => {
   const [orders, setOrders] = useState<Order[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const connected = useRef<boolean>(false);
 
   const fetchUserOrders = async () => {
     try {
@@ -25,12 +27,45 @@ const MyOrders: React.FC = () => {
   useEffect(() => {
     fetchUserOrders();
     
-    // Refresh user orders every 10 seconds
-    const intervalId = setInterval(fetchUserOrders, 10000);
+    // Changes to the user's own orders are pushed by the market data feed
+    const unsubscribe = subscribeMarketData(message => {
+      if (message.type === 'order') {
+        const updated = message.order;
+        setOrders(current => current.some(order => order.id === updated.id)
+          ? current.map(order => (order.id === updated.id ? updated : order))
+          : [...current, updated]);
+      }
+    }, status => {
+      connected.current = status;
+    });
     
-    return () => clearInterval(intervalId);
+    // Fall back to refreshing user orders every 10 seconds while the feed is down
+    const intervalId = setInterval(() => {
+      if (!connected.current) {
+        fetchUserOrders();
+      }
+    }, 10000);
+    
+    return () => {
+      clearInterval(intervalId);
+      unsubscribe();
+    };
   }, []);
 
+  const handleCancel = async (order: Order) => {
+    if (order.id === undefined) {
+      return;
+    }
+    try {
+      const cancelled = await cancelOrder(order.id, order.symbol);
+      setOrders(current => current.map(o => (o.id === cancelled.id ? cancelled : o)));
+      setError(null);
+    } catch (err) {
+      setError('Failed to cancel the order');
+      console.error(err);
+    }
+  };
+
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
     return date.toLocaleString();
@@ -124,9 +159,18 @@ const MyOrders: React.FC = () => {
                       <td>
                         {order.hasOwnProperty('is_active') ? 
                           (order.is_active ? 
-                            <span className="status-badge active">
-                              <i className="bi bi-circle-fill me-1"></i>Active
-                            </span> : 
+                            <>
+                              <span className="status-badge active">
+                                <i className="bi bi-circle-fill me-1"></i>Active
+                              </span>
+                              <button
+                                className="btn btn-sm btn-link text-danger ms-1 p-0"
+                                onClick={() => handleCancel(order)}
+                                title="Cancel Order"
+                              >
+                                <i className="bi bi-x-circle"></i>
+                              </button>
+                            </> : 
                             <span className="status-badge completed">
                               <i className="bi bi-check-circle-fill me-1"></i>Completed
                             </span>
@@ -1,29 +1,41 @@
-import React, { useEffect, useState } from 'react';
-import { OrderBook as OrderBookType } from '../../types/types';
-import { getOrderBook } from '../../services/api';
+import React, { useEffect, useRef, useState } from 'react';
+import { OrderBookDepth } from '../../types/types';
+import { getOrderBookDepth } from '../../services/api';
+import { applyDepthDelta, subscribeMarketData } from '../../services/marketData';
 import './OrderBook.css';
 
+// Number of price levels shown on each side of the book
+const DEPTH_LEVELS = 20;
+
 const OrderBook: React.FC = () => {
-  const [orderBook, setOrderBook] = useState<OrderBookType>({ bids: [], asks: [] });
+  const [orderBook, setOrderBook] = useState<OrderBookDepth>({ bids: [], asks: [] });
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
   const [spread, setSpread] = useState<number | null>(null);
+  const connected = useRef<boolean>(false);
+  const latestBook = useRef<OrderBookDepth>({ bids: [], asks: [] });
+  // Sequence of the last snapshot from the feed; older deltas are already in it
+  const bookSequence = useRef<number>(-1);
+
+  const updateOrderBook = (data: OrderBookDepth) => {
+    latestBook.current = data;
+    setOrderBook(data);
+    
+    // Calculate the spread (difference between lowest ask and highest bid)
+    if (data.asks.length > 0 && data.bids.length > 0) {
+      const lowestAsk = Math.min(...data.asks.map(ask => ask.price));
+      const highestBid = Math.max(...data.bids.map(bid => bid.price));
+      setSpread(lowestAsk - highestBid);
+    } else {
+      setSpread(null);
+    }
+  };
 
   const fetchOrderBook = async () => {
     try {
       setLoading(true);
-      const data = await getOrderBook();
-      setOrderBook(data);
-      
-      // Calculate the spread (difference between lowest ask and highest bid)
-      if (data.asks.length > 0 && data.bids.length > 0) {
-        const lowestAsk = Math.min(...data.asks.map(ask => ask.price));
-        const highestBid = Math.max(...data.bids.map(bid => bid.price));
-        setSpread(lowestAsk - highestBid);
-      } else {
-        setSpread(null);
-      }
-      
+      const data = await getOrderBookDepth(DEPTH_LEVELS);
+      updateOrderBook(data);
       setError(null);
     } catch (err) {
       setError('Failed to load order book');
@@ -36,10 +48,40 @@ const OrderBook: React.FC = () => {
   useEffect(() => {
     fetchOrderBook();
     
-    // Refresh order book every 10 seconds
-    const intervalId = setInterval(fetchOrderBook, 10000);
+    // Live updates from the market data feed
+    const unsubscribe = subscribeMarketData(message => {
+      if (message.type === 'snapshot') {
+        bookSequence.current = message.sequence;
+        updateOrderBook({ bids: message.bids, asks: message.asks });
+      } else if (message.type === 'depth') {
+        // Deltas queued while the snapshot was taken may already be in it
+        if (message.sequence <= bookSequence.current) {
+          return;
+        }
+        const book = latestBook.current;
+        updateOrderBook({
+          bids: applyDepthDelta(book.bids, message.bids, 'bid'),
+          asks: applyDepthDelta(book.asks, message.asks, 'ask'),
+        });
+      } else {
+        return;
+      }
+      setLoading(false);
+    }, status => {
+      connected.current = status;
+    });
+    
+    // Fall back to refreshing the order book every 10 seconds while the feed is down
+    const intervalId = setInterval(() => {
+      if (!connected.current) {
+        fetchOrderBook();
+      }
+    }, 10000);
     
-    return () => clearInterval(intervalId);
+    return () => {
+      clearInterval(intervalId);
+      unsubscribe();
+    };
   }, []);
 
   if (loading && !orderBook.bids.length && !orderBook.asks.length) {
@@ -1,4 +1,5 @@
 import React, { useState } from 'react';
+import axios from 'axios';
 import { placeOrder } from '../../services/api';
 import './OrderForm.css';
 
@@ -48,7 +49,9 @@ const OrderForm: React.FC = () => {
       }, 3000);
       
     } catch (err) {
-      setError('Failed to place order. Please try again.');
+      // Show the server's reason, e.g. a price that is not a whole number of ticks
+      const detail = axios.isAxiosError(err) ? err.response?.data?.detail : undefined;
+      setError(detail || 'Failed to place order. Please try again.');
       console.error(err);
     } finally {
       setLoading(false);
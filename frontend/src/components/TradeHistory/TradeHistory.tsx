@@ -1,18 +1,34 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Trade } from '../../types/types';
 import { getTrades } from '../../services/api';
+import { subscribeMarketData } from '../../services/marketData';
 import './TradeHistory.css';
 
+// Number of recent trades loaded when the component mounts
+const TRADE_HISTORY_LIMIT = 100;
+
 const TradeHistory: React.FC = () => {
   const [trades, setTrades] = useState<Trade[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
+  const connected = useRef<boolean>(false);
+  const latestId = useRef<number>(0);
+
+  const addTrades = (newTrades: Trade[]) => {
+    newTrades.forEach(trade => {
+      latestId.current = Math.max(latestId.current, trade.id || 0);
+    });
+    setTrades(current => {
+      const known = new Set(current.map(trade => trade.id));
+      return [...current, ...newTrades.filter(trade => !known.has(trade.id))];
+    });
+  };
 
   const fetchTrades = async () => {
     try {
       setLoading(true);
-      const data = await getTrades();
-      setTrades(data);
+      const page = await getTrades({ limit: TRADE_HISTORY_LIMIT });
+      addTrades(page.results);
       setError(null);
     } catch (err) {
       setError('Failed to load trade history');
@@ -22,13 +38,41 @@ const TradeHistory: React.FC = () => {
     }
   };
 
+  // Fetch only the trades executed since the latest one we have
+  const fetchNewTrades = async () => {
+    try {
+      const page = await getTrades({ since_id: latestId.current, limit: TRADE_HISTORY_LIMIT });
+      addTrades(page.results);
+      setError(null);
+    } catch (err) {
+      setError('Failed to load trade history');
+      console.error(err);
+    }
+  };
+
   useEffect(() => {
     fetchTrades();
     
-    // Refresh trade history every 10 seconds
-    const intervalId = setInterval(fetchTrades, 10000);
+    // New trades are pushed by the market data feed
+    const unsubscribe = subscribeMarketData(message => {
+      if (message.type === 'trade') {
+        addTrades([message.trade]);
+      }
+    }, status => {
+      connected.current = status;
+    });
+    
+    // Fall back to polling for new trades every 10 seconds while the feed is down
+    const intervalId = setInterval(() => {
+      if (!connected.current) {
+        fetchNewTrades();
+      }
+    }, 10000);
     
-    return () => clearInterval(intervalId);
+    return () => {
+      clearInterval(intervalId);
+      unsubscribe();
+    };
   }, []);
 
   const formatDate = (dateString: string) => {
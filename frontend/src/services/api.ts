@@ -1,8 +1,20 @@
 import axios from 'axios';
-import { Order, Trade, AuthResponse, OrderBook } from '../types/types';
+import { Order, AuthResponse, OrderBook, OrderBookDepth, TradePage, TradeQuery } from '../types/types';
 
 export const API_URL = 'http://localhost:8000/api';
 
+// Prices arrive as exact decimal strings, in whole ticks of their symbol; the UI works with numbers
+export const parsePrice = <T extends { price: number | string }>(item: T): T => ({
+  ...item,
+  price: Number(item.price),
+});
+
+const parseBook = <T extends { bids: any[]; asks: any[] }>(book: T): T => ({
+  ...book,
+  bids: book.bids.map(parsePrice),
+  asks: book.asks.map(parsePrice),
+});
+
 const setAuthToken = (token: string) => {
   if (token) {
     axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
@@ -58,13 +70,24 @@ export const register = async (username: string, password: string): Promise<Auth
 export const getOrderBook = async (): Promise<OrderBook> => {
   try {
     const response = await axios.get(`${API_URL}/orderbook/`);
-    return response.data;
+    return parseBook(response.data);
   } catch (error) {
     console.error('Error fetching order book:', error);
     throw error;
   }
 };
 
+// Order Service - Get Aggregated Order Book Depth - API Call
+export const getOrderBookDepth = async (levels: number = 10): Promise<OrderBookDepth> => {
+  try {
+    const response = await axios.get(`${API_URL}/orderbook/depth/`, { params: { levels } });
+    return parseBook(response.data);
+  } catch (error) {
+    console.error('Error fetching order book depth:', error);
+    throw error;
+  }
+};
+
 // Order Service - Place Order - API Call
 export const placeOrder = async (order: Order): Promise<Order> => {
   try {
@@ -73,28 +96,54 @@ export const placeOrder = async (order: Order): Promise<Order> => {
       quantity: order.quantity,
       order_type: order.order_type,
     });
-    return response.data.order;
+    return parsePrice(response.data.order);
   } catch (error) {
     console.error('Error placing order:', error);
     throw error;
   }
 };
 
+// Cancel one of the user's active orders
+export const cancelOrder = async (orderId: number, symbol?: string): Promise<Order> => {
+  try {
+    const response = await axios.delete(`${API_URL}/orders/${orderId}/`, { params: { symbol } });
+    return parsePrice(response.data);
+  } catch (error) {
+    console.error('Error cancelling order:', error);
+    throw error;
+  }
+};
+
+// Change the price or remaining quantity of one of the user's active orders
+export const amendOrder = async (
+  orderId: number,
+  changes: { price?: number; quantity?: number },
+  symbol?: string
+): Promise<Order> => {
+  try {
+    const response = await axios.patch(`${API_URL}/orders/${orderId}/`, changes, { params: { symbol } });
+    return parsePrice(response.data.order);
+  } catch (error) {
+    console.error('Error amending order:', error);
+    throw error;
+  }
+};
+
 export const getUserOrders = async (): Promise<Order[]> => {
   try {
     const response = await axios.get(`${API_URL}/orders/`);
-    return response.data;
+    return response.data.map(parsePrice);
   } catch (error) {
     console.error('Error fetching user orders:', error);
     throw error;
   }
 };
 
-// Trade services
-export const getTrades = async (): Promise<Trade[]> => {
+// Trade services - a page of trades, newest first, or the trades after since_id
+export const getTrades = async (query: TradeQuery = { limit: 100 }): Promise<TradePage> => {
   try {
-    const response = await axios.get(`${API_URL}/trades/`);
-    return response.data;
+    const response = await axios.get(`${API_URL}/trades/`, { params: query });
+    return { ...response.data, results: response.data.results.map(parsePrice) };
   } catch (error) {
     console.error('Error fetching trades:', error);
     throw error;
@@ -0,0 +1,111 @@
+import { Order, Trade, PriceLevel } from '../types/types';
+import { API_URL, parsePrice } from './api';
+
+// WebSocket endpoint of the market data feed, served next to the REST API
+export const MARKET_DATA_URL = API_URL.replace(/^http/, 'ws').replace(/\/api$/, '/ws/market/');
+
+// Delay before reconnecting after the feed is lost
+const RECONNECT_DELAY = 3000;
+
+export type MarketDataMessage =
+  | { type: 'snapshot'; sequence: number; bids: PriceLevel[]; asks: PriceLevel[] }
+  | { type: 'depth'; sequence: number; bids: PriceLevel[]; asks: PriceLevel[] }
+  | { type: 'trade'; sequence: number; trade: Trade }
+  | { type: 'order'; sequence: number; order: Order };
+
+type Listener = (message: MarketDataMessage) => void;
+type StatusListener = (connected: boolean) => void;
+
+// A single connection is shared by every component on the page
+const listeners = new Set<Listener>();
+const statusListeners = new Set<StatusListener>();
+let socket: WebSocket | null = null;
+let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+
+const notifyStatus = (connected: boolean) => {
+  statusListeners.forEach(listener => listener(connected));
+};
+
+// Prices arrive as decimal strings, like in the REST API
+const parseMessage = (message: MarketDataMessage): MarketDataMessage => {
+  switch (message.type) {
+    case 'snapshot':
+    case 'depth':
+      return { ...message, bids: message.bids.map(parsePrice), asks: message.asks.map(parsePrice) };
+    case 'trade':
+      return { ...message, trade: parsePrice(message.trade) };
+    case 'order':
+      return { ...message, order: parsePrice(message.order) };
+  }
+};
+
+const connect = () => {
+  const token = localStorage.getItem('token');
+  if (!token || socket) {
+    return;
+  }
+
+  socket = new WebSocket(`${MARKET_DATA_URL}?token=${encodeURIComponent(token)}`);
+
+  socket.onopen = () => notifyStatus(true);
+
+  socket.onmessage = (event: MessageEvent) => {
+    const message = parseMessage(JSON.parse(event.data));
+    listeners.forEach(listener => listener(message));
+  };
+
+  socket.onclose = () => {
+    socket = null;
+    notifyStatus(false);
+    if (listeners.size > 0 && !reconnectTimer) {
+      reconnectTimer = setTimeout(() => {
+        reconnectTimer = null;
+        connect();
+      }, RECONNECT_DELAY);
+    }
+  };
+};
+
+// Subscribe to the market data feed; returns a function that unsubscribes
+export const subscribeMarketData = (listener: Listener, onStatus?: StatusListener): (() => void) => {
+  listeners.add(listener);
+  if (onStatus) {
+    statusListeners.add(onStatus);
+  }
+
+  connect();
+  if (onStatus) {
+    onStatus(socket !== null && socket.readyState === WebSocket.OPEN);
+  }
+
+  return () => {
+    listeners.delete(listener);
+    if (onStatus) {
+      statusListeners.delete(onStatus);
+    }
+    if (listeners.size === 0 && socket) {
+      socket.close();
+    }
+  };
+};
+
+// Apply a depth delta to one side of the book. Deltas carry the new absolute state
+// of each level, so a level with zero quantity is removed
+export const applyDepthDelta = (
+  levels: PriceLevel[],
+  changes: PriceLevel[],
+  side: 'bid' | 'ask'
+): PriceLevel[] => {
+  const byPrice = new Map(levels.map(level => [level.price, level]));
+  changes.forEach(change => {
+    if (change.quantity > 0) {
+      byPrice.set(change.price, change);
+    } else {
+      byPrice.delete(change.price);
+    }
+  });
+
+  return Array.from(byPrice.values()).sort((a, b) =>
+    side === 'bid' ? b.price - a.price : a.price - b.price
+  );
+};
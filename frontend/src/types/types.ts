@@ -1,5 +1,6 @@
 export interface Order {
     id?: number;
+    symbol?: string;
     user?: string;
     user_id?: number;
     price: number;
@@ -11,6 +12,7 @@ export interface Order {
 
 export interface Trade {
     id?: number;
+    symbol?: string;
     price: number;
     quantity: number;
     timestamp: string;
@@ -20,6 +22,19 @@ export interface Trade {
     ask_user_id?: number;
 }
 
+export interface TradePage {
+    results: Trade[];
+    next_cursor: number | null;
+}
+
+export interface TradeQuery {
+    since_id?: number;
+    cursor?: number;
+    start?: string;
+    end?: string;
+    limit?: number;
+}
+
 export interface User {
     id?: number;
     username: string;
@@ -31,6 +46,17 @@ export interface OrderBook {
     asks: Order[];
 }
 
+export interface PriceLevel {
+    price: number;
+    quantity: number;
+    orders: number;
+}
+
+export interface OrderBookDepth {
+    bids: PriceLevel[];
+    asks: PriceLevel[];
+}
+
 export interface AuthResponse {
     token: string;
     user: {